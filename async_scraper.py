@@ -0,0 +1,185 @@
+import asyncio
+import time
+import aiohttp
+from urllib.parse import urlparse
+from multiprocessing_scraper import StockXScraper
+
+class RateLimiter:
+    """
+    Token bucket that lets through at most `rate` requests per second with bursts of up to `burst` requests
+    """
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class StockXAsyncScraper:
+    """
+    Runs the links, info and transaction stages of a StockXScraper in one process with asyncio, keeping one pooled
+    HTTP session per proxy instead of a new connection (and a new process) per request
+    """
+    def __init__(self, stock_x_scraper, concurrency=50, requests_per_second_per_host=None, connections_per_proxy=10, timeout=30, retries=10):
+        self.scraper = stock_x_scraper
+        self.concurrency = concurrency
+        self.requests_per_second_per_host = requests_per_second_per_host
+        self.connections_per_proxy = connections_per_proxy
+        self.timeout = timeout
+        self.retries = retries
+        self.sessions = {}
+        self.rate_limiters = {}
+        self.request_count = 0
+        self.elapsed = 0.0
+
+    def run(self, stages=("links", "info", "transactions")):
+        """
+        Runs the given stages in order and prints the request throughput of each one
+        """
+        return asyncio.run(self._run(stages))
+
+    async def _run(self, stages):
+        stage_functions = {"links": self.scrape_shoe_links, "info": self.scrape_shoe_info, "transactions": self.scrape_transaction_data}
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        try:
+            for stage in stages:
+                request_count = self.request_count
+                start = time.perf_counter()
+                await stage_functions[stage]()
+                elapsed = time.perf_counter() - start
+                self.elapsed += elapsed
+                print("Stage {}: {} requests in {:.2f}s ({:.1f} requests/sec)".format(stage, self.request_count - request_count, elapsed, (self.request_count - request_count) / elapsed if elapsed else 0))
+        finally:
+            await self._close_sessions()
+            self.scraper.proxy_pool.save()
+            print("Proxy pool: {}".format(self.scraper.proxy_pool.get_summary()))
+
+    async def scrape_shoe_links(self):
+        pages = [str(page) for page in range(1, 26)]
+        pages_to_scrape = [page for page in pages if page not in self.scraper.scraped_pages]
+        print("Amount of pages to scrape: {}".format(len(pages_to_scrape)))
+        await asyncio.gather(*[self.get_shoe_links(page) for page in pages_to_scrape])
+        self.scraper.join_shoe_links_csv_files()
+
+    async def scrape_shoe_info(self):
+        links = self.scraper._get_list_from_csv("shoe_links/{}_links.csv".format(self.scraper.brand.replace("-", "_")))
+        links_to_scrape = [link for link in links if self.scraper.base_url + link not in self.scraper.scraped_shoe_info_links]
+        print("Amount of links to scrape: {}".format(len(links_to_scrape)))
+        await asyncio.gather(*[self.get_shoe_info(link) for link in links_to_scrape])
+
+    async def scrape_transaction_data(self):
+        sku_list = self.scraper.crawl_state.get_skus("info")
+        skus_to_scrape = [sku for sku in sku_list if sku not in self.scraper.scraped_sku_list]
+        print("Amount of SKUs to scrape: {}".format(len(skus_to_scrape)))
+        await asyncio.gather(*[self.get_shoe_transaction_data(sku) for sku in skus_to_scrape])
+
+    async def get_shoe_links(self, page):
+        url = "{}/{}?page={}".format(self.scraper.base_url, self.scraper.brand, page)
+        text = await self._fetch(url)
+        if text is None:
+            print("Unable to get information from {}".format(url))
+            return
+        shoe_links = self.scraper._scrape_shoe_links(text)
+        self.scraper._save_shoe_links(page, shoe_links)
+        print("Shoe links scraped from page {}".format(page))
+
+    async def get_shoe_info(self, link):
+        url = "{}{}".format(self.scraper.base_url, link)
+        if self.scraper._check_if_shoe_info_already_scraped(url):
+            return
+        text = await self._fetch(url)
+        if text is None:
+            print("Unable to get information from {}".format(url))
+            return
+        try:
+            shoe_info = self.scraper._scrape_shoe_info(text)
+            file_name = self.scraper._save_shoe_info(url, shoe_info)
+            print("JSON file: {} created".format(file_name))
+        except (IndexError, KeyError, ValueError):
+            print("Unable to get information from {}".format(url))
+
+    async def get_shoe_transaction_data(self, sku):
+        if self.scraper._check_if_shoe_transaction_already_scraped(sku):
+            return
+        url = "{}/api/products/{}/activity".format(self.scraper.base_url, sku)
+        data = await self._fetch(url, params=self.scraper._get_transaction_querystring(), as_json=True)
+        if data is None:
+            print("Unable to get information from {}".format(url))
+            return
+        file_name = self.scraper._save_shoe_transaction_data(sku, data)
+        print("JSON file: {} created".format(file_name))
+
+    async def _fetch(self, url, params=None, as_json=False):
+        """
+        GETs the url through a random proxy, retrying on errors and non 200 responses. Returns the body (parsed if
+        as_json) or None when every attempt failed
+        """
+        async with self.semaphore:
+            for _ in range(self.retries):
+                proxy = self.scraper.proxy_pool.get_proxy()
+                await self._wait_for_rate_limit(url)
+                start = time.perf_counter()
+                try:
+                    session = self._get_session(proxy)
+                    self.request_count += 1
+                    async with session.get(url, params=params, proxy=self._format_proxy(proxy)) as response:
+                        if self.scraper._is_proxy_failure(response.status):
+                            self.scraper.proxy_pool.report_failure(proxy)
+                            continue
+                        self.scraper.proxy_pool.report_success(proxy, time.perf_counter() - start)
+                        if response.status == 200:
+                            if as_json:
+                                return await response.json(content_type=None)
+                            return await response.text()
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    self.scraper.proxy_pool.report_failure(proxy)
+                    continue
+                except ValueError:
+                    continue
+        return None
+
+    async def _wait_for_rate_limit(self, url):
+        if not self.requests_per_second_per_host:
+            return
+        host = urlparse(url).netloc
+        if host not in self.rate_limiters:
+            self.rate_limiters[host] = RateLimiter(self.requests_per_second_per_host)
+        await self.rate_limiters[host].acquire()
+
+    def _get_session(self, proxy):
+        if proxy not in self.sessions:
+            connector = aiohttp.TCPConnector(limit=self.connections_per_proxy)
+            self.sessions[proxy] = aiohttp.ClientSession(connector=connector, headers=self._get_session_headers(), timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.sessions[proxy]
+
+    def _get_session_headers(self):
+        #aiohttp sets these itself per connection
+        return {key: value for key, value in self.scraper.headers.items() if key not in ["Host", "Connection", "Accept-Encoding"]}
+
+    def _format_proxy(self, proxy):
+        if proxy is None or "://" in proxy:
+            return proxy
+        return "http://" + proxy
+
+    async def _close_sessions(self):
+        for session in self.sessions.values():
+            await session.close()
+        self.sessions = {}
+
+if __name__ == '__main__':
+    #adidas, nike, retro-jordans, other-sneakers
+    brand = "other-sneakers"
+    async_scraper = StockXAsyncScraper(StockXScraper(brand), concurrency=100)
+
+    #async_scraper.run(["links", "info", "transactions"])
@@ -0,0 +1,28 @@
+"""
+Runs train_all_series over synthetic per shoe transaction files to size the nightly training job: series/sec, peak
+memory and the results table it writes
+
+Run from the repository root with: python -m benchmarks.batch_training
+"""
+import os
+import shutil
+import tempfile
+import pandas as pd
+from benchmarks.walk_forward import make_shoe_files
+from forecasting import train_all_series
+
+def run(shoes=40, transactions_per_shoe=1500):
+    cwd = os.getcwd()
+    directory = tempfile.mkdtemp(prefix="stockx-bench-")
+    os.chdir(directory)
+    try:
+        make_shoe_files(shoes, transactions_per_shoe)
+        results_df = train_all_series(brands=["adidas"], refit_interval=30)
+        print(pd.read_csv("shoe_data/model_results.csv")[["shoe", "shoeSize", "n", "fit_time", "mse", "params"]].head())
+        print("Mean fit time per series {:.2f}s, mean days per series {:.0f}".format(results_df["fit_time"].mean(), results_df["n"].mean()))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    run()
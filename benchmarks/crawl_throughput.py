@@ -0,0 +1,60 @@
+"""
+Compares requests/sec of the multiprocessing Pool(50) crawl against StockXAsyncScraper for the shoe info and
+transaction stages, both going through a local stub server (which also acts as the proxy)
+
+Run from the repository root with: python -m benchmarks.crawl_throughput
+"""
+import os
+import shutil
+import tempfile
+import time
+import multiprocessing_scraper
+from multiprocessing_scraper import StockXScraper
+from async_scraper import StockXAsyncScraper
+from benchmarks.stub_server import StubStockXServer
+
+BRAND = "adidas"
+
+def make_crawl_directory(links):
+    directory = tempfile.mkdtemp(prefix="stockx-bench-")
+    for data_type in ["links", "info", "transactions"]:
+        os.makedirs(os.path.join(directory, "shoe_{}".format(data_type), BRAND))
+    with open(os.path.join(directory, "shoe_links", "{}_links.csv".format(BRAND)), "w") as f:
+        f.write(",".join('"{}"'.format(link) for link in links))
+    return directory
+
+def time_stages(run_stages, server):
+    request_count = server.request_count
+    start = time.perf_counter()
+    run_stages()
+    elapsed = time.perf_counter() - start
+    requests = server.request_count - request_count
+    return requests, elapsed
+
+def run_pool(server):
+    scraper = StockXScraper(BRAND, proxies=[server.url.replace("http://", "")], base_url="http://stockx.test")
+    multiprocessing_scraper.scrape_shoe_info(scraper)
+    multiprocessing_scraper.scrape_transaction_data(scraper)
+
+def run_async(server, concurrency):
+    scraper = StockXScraper(BRAND, proxies=[server.url], base_url="http://stockx.test")
+    StockXAsyncScraper(scraper, concurrency=concurrency, connections_per_proxy=concurrency).run(["info", "transactions"])
+
+def run(link_count=500, latency=0.05, concurrency=100):
+    links = ["/{}-bench-shoe-{}".format(BRAND, i) for i in range(link_count)]
+    cwd = os.getcwd()
+    results = {}
+    with StubStockXServer(latency=latency) as server:
+        for name, run_stages in [("pool", lambda: run_pool(server)), ("async", lambda: run_async(server, concurrency))]:
+            directory = make_crawl_directory(links)
+            os.chdir(directory)
+            try:
+                results[name] = time_stages(run_stages, server)
+            finally:
+                os.chdir(cwd)
+                shutil.rmtree(directory)
+    for name, (requests, elapsed) in results.items():
+        print("{}: {} requests in {:.2f}s, {:.1f} requests/sec".format(name, requests, elapsed, requests / elapsed))
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,109 @@
+"""
+Checks html_extractor against the BeautifulSoup extraction the scraper used before on the saved pages in
+benchmarks/fixtures, the stub server pages and edge cases made from the product page fixture (no ld+json, truncated
+pages, ld+json mentioned in scripts, comments and tags after the product script), then measures pages/sec of both on
+the fixtures padded to the size of real StockX pages. Exits with status 1 if any result differs
+
+Run from the repository root with: python -m benchmarks.html_extraction
+"""
+import json
+import os
+import re
+import sys
+import time
+from bs4 import BeautifulSoup
+from benchmarks.stub_server import make_browse_page, make_product_page
+from html_extractor import extract_shoe_info, extract_shoe_links
+
+FIXTURES_DIRECTORY = os.path.join(os.path.dirname(__file__), "fixtures")
+
+def legacy_shoe_links(text):
+    soup = BeautifulSoup(text, 'lxml')
+    products_div = soup.find('div', attrs={'class': 'browse-grid'})
+    return [link['href'] for link in products_div.find_all('a', href=True)]
+
+def legacy_shoe_info(text):
+    soup = BeautifulSoup(text, 'lxml')
+    page_scripts = soup.find_all('script', type='application/ld+json')
+    return json.loads(page_scripts[-1].text, strict=False)
+
+def read_fixture(file_name):
+    with open(os.path.join(FIXTURES_DIRECTORY, file_name)) as f:
+        return f.read()
+
+def make_product_page_edge_cases(page):
+    """
+    {name: page} of product pages that the backward search of extract_shoe_info could get wrong
+    """
+    product_start = page.rindex('<script type="application/ld+json">')
+    product_end = page.index("</script>", product_start) + len("</script>")
+    def insert_after_product(html):
+        return page[:product_end] + html + page[product_end:]
+    return {
+        "no ld+json": re.sub(r'<script type="application/ld\+json">.*?</script>', "", page, flags=re.S),
+        "truncated in the product script": page[:(product_start + product_end) // 2],
+        "truncated after the product script": page[:product_end],
+        "ld+json written by a later script": insert_after_product(
+            """<script>document.write('<script type="application/ld+json">{"@type": "Decoy"}<\\/script>');</script>"""),
+        "ld+json in a later comment": insert_after_product('<!-- <script type="application/ld+json">{"@type": "Old"}</script> -->'),
+        "ld+json type on a later tag": insert_after_product('<link rel="alternate" type="application/ld+json" href="/product.json">'),
+        "ld+json mentioned in the product JSON": page[:product_end].replace('"sku": "D97046"',
+            '"sku": "D97046", "embed": "<script type=\\"application/ld+json\\">"') + page[product_end:],
+        "upper case product script": page[:product_start] + page[product_start:product_end].replace("script", "SCRIPT") + page[product_end:],
+    }
+
+def get_outcome(function, page):
+    #the parsed result, or the type of the error raised
+    try:
+        return function(page)
+    except Exception as e:
+        return type(e).__name__
+
+def check_results(browse_pages, product_pages):
+    """
+    Prints every page where html_extractor and BeautifulSoup disagree and returns whether they always agree
+    """
+    mismatches = []
+    for name, page in browse_pages.items():
+        if get_outcome(extract_shoe_links, page) != get_outcome(legacy_shoe_links, page):
+            mismatches.append(("links", name))
+    for name, page in product_pages.items():
+        outcome, legacy_outcome = get_outcome(extract_shoe_info, page), get_outcome(legacy_shoe_info, page)
+        if outcome != legacy_outcome:
+            mismatches.append(("shoe info", name))
+            print("  {}: html_extractor {!r}, BeautifulSoup {!r}".format(name, outcome, legacy_outcome))
+    for kind, name in mismatches:
+        print("Different {} for {}".format(kind, name))
+    print("Same results as BeautifulSoup on {} pages: {}".format(len(browse_pages) + len(product_pages), not mismatches))
+    return not mismatches
+
+def pad_page(text, kilobytes):
+    #real pages carry a lot of markup around the parts that are extracted
+    filler = '<div class="related-products">{}</div>'.format('<div class="tile"><a href="/related"><span class="name">Related shoe</span></a></div>' * (kilobytes * 12))
+    return text.replace("</main>", filler + "</main>")
+
+def pages_per_second(function, text, seconds=2.0):
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        function(text)
+        count += 1
+    return count / (time.perf_counter() - start)
+
+def run(kilobytes=300):
+    browse_pages = {"browse page fixture": read_fixture("browse_page.html"), "stub server browse page": make_browse_page("adidas", 3)}
+    product_pages = {"product page fixture": read_fixture("product_page.html"), "stub server product page": make_product_page("/adidas-bench-shoe-1")}
+    product_pages.update(make_product_page_edge_cases(product_pages["product page fixture"]))
+    matched = check_results(browse_pages, product_pages)
+
+    for name, page, legacy, extractor in [
+            ("browse page", pad_page(browse_pages["browse page fixture"], kilobytes), legacy_shoe_links, extract_shoe_links),
+            ("product page", pad_page(product_pages["product page fixture"], kilobytes), legacy_shoe_info, extract_shoe_info)]:
+        legacy_rate = pages_per_second(legacy, page)
+        extractor_rate = pages_per_second(extractor, page)
+        print("{} ({:.0f} KB): BeautifulSoup {:.1f} pages/sec, html_extractor {:.1f} pages/sec ({:.0f}x)".format(
+            name, len(page) / 1024, legacy_rate, extractor_rate, extractor_rate / legacy_rate))
+    return matched
+
+if __name__ == '__main__':
+    sys.exit(0 if run() else 1)
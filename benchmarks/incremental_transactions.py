@@ -0,0 +1,53 @@
+"""
+Measures the bytes and requests needed to refresh transaction data with a full re-crawl versus
+StockXScraper.update_shoe_transaction_data after a few new sales, against the local stub activity API
+
+Run from the repository root with: python -m benchmarks.incremental_transactions
+"""
+import json
+import os
+import shutil
+import tempfile
+from multiprocessing_scraper import StockXScraper
+from benchmarks.stub_server import StubStockXServer
+
+BRAND = "adidas"
+
+def fetch(server, scrape):
+    request_count, bytes_sent = server.request_count, server.bytes_sent
+    scrape()
+    return server.request_count - request_count, server.bytes_sent - bytes_sent
+
+def run(skus=20, transactions_per_sku=20000, new_transactions_per_sku=25):
+    cwd = os.getcwd()
+    directory = tempfile.mkdtemp(prefix="stockx-bench-")
+    os.chdir(directory)
+    try:
+        for data_type in ["links", "info", "transactions"]:
+            os.makedirs(os.path.join("shoe_{}".format(data_type), BRAND))
+        with StubStockXServer(latency=0, transactions_per_sku=transactions_per_sku) as server:
+            scraper = StockXScraper(BRAND, proxies=[server.url.replace("http://", "")], base_url="http://stockx.test")
+            sku_list = ["BENCH-{}".format(i) for i in range(skus)]
+            first = fetch(server, lambda: [scraper.get_shoe_transaction_data(sku) for sku in sku_list])
+
+            server.new_transactions_per_sku = new_transactions_per_sku
+            #scraped_sku_list was loaded before the first crawl so this fetches every SKU again
+            full = fetch(server, lambda: [scraper.get_shoe_transaction_data(sku) for sku in sku_list])
+
+            server.new_transactions_per_sku = 2 * new_transactions_per_sku
+            incremental = fetch(server, lambda: [scraper.update_shoe_transaction_data(sku) for sku in sku_list])
+            with open("shoe_transactions/{}/{}.json".format(BRAND, sku_list[0])) as f:
+                incremental_data = json.load(f)
+
+        expected = transactions_per_sku + 2 * new_transactions_per_sku
+        print("first crawl: {} requests, {:.1f} MB".format(first[0], first[1] / 1e6))
+        print("full re-crawl: {} requests, {:.1f} MB".format(full[0], full[1] / 1e6))
+        print("incremental: {} requests, {:.3f} MB, {}/{} transactions stored, no duplicates: {}".format(
+            incremental[0], incremental[1] / 1e6, len(incremental_data["ProductActivity"]), expected,
+            len(set(t["chainId"] for t in incremental_data["ProductActivity"])) == len(incremental_data["ProductActivity"])))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    run()
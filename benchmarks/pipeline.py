@@ -0,0 +1,65 @@
+"""
+Scrapes, formats and adds features to the transactions of a brand from the stub server twice: once stage after stage
+(scrape_transaction_data, format_brands, add_additional_features) and once with StockXPipeline, and compares the
+total time, how long after its fetch a SKU has its features and whether the feature files are the same
+
+Run from the repository root with: python -m benchmarks.pipeline
+"""
+import os
+import shutil
+import time
+import pandas as pd
+import multiprocessing_scraper
+from data_formatter import format_brands
+from feature_extractor import StockXFeatureExtractor
+from multiprocessing_scraper import StockXScraper
+from pipeline import StockXPipeline
+from benchmarks.crawl_throughput import make_crawl_directory
+from benchmarks.stub_server import StubStockXServer
+
+BRAND = "adidas"
+
+def run_stages(scraper):
+    multiprocessing_scraper.scrape_transaction_data(scraper)
+    format_brands([BRAND])
+    StockXFeatureExtractor(BRAND).add_additional_features()
+
+def run_pipeline(scraper):
+    pipeline = StockXPipeline(scraper)
+    pipeline.run()
+    return pipeline.metrics.get_snapshot()["histograms"]["pipeline.fetch_to_features"]
+
+def read_features():
+    directory = "shoe_data/shoe_transactions/{}/".format(BRAND)
+    return {file_name: pd.read_csv(directory + file_name) for file_name in sorted(os.listdir(directory))}
+
+def run_crawl(server, links, run_function):
+    cwd = os.getcwd()
+    directory = make_crawl_directory(links)
+    os.chdir(directory)
+    try:
+        os.makedirs("shoe_data")
+        scraper = StockXScraper(BRAND, proxies=[server.url.replace("http://", "")], base_url="http://stockx.test")
+        multiprocessing_scraper.scrape_shoe_info(scraper)
+        start = time.perf_counter()
+        latency = run_function(scraper)
+        elapsed = time.perf_counter() - start
+        return elapsed, latency, read_features()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+
+def run(link_count=100, latency=0.05, transactions_per_sku=2000):
+    links = ["/{}-bench-shoe-{}".format(BRAND, i) for i in range(link_count)]
+    with StubStockXServer(latency=latency, transactions_per_sku=transactions_per_sku) as server:
+        stages_time, _, stages_features = run_crawl(server, links, run_stages)
+        pipeline_time, pipeline_latency, pipeline_features = run_crawl(server, links, run_pipeline)
+    same = stages_features.keys() == pipeline_features.keys() and all(stages_features[k].equals(pipeline_features[k]) for k in stages_features)
+    print("{} SKUs, {} transactions each".format(link_count, transactions_per_sku))
+    print("  stage after stage: {:.1f}s, features of a SKU ready up to {:.1f}s after its fetch".format(stages_time, stages_time))
+    print("  pipeline:          {:.1f}s, features of a SKU ready {:.2f}s after its fetch on average, {:.2f}s at most".format(
+        pipeline_time, pipeline_latency["sum"] / pipeline_latency["count"], pipeline_latency["max"]))
+    print("  same feature files: {} ({} files)".format(same, len(pipeline_features)))
+
+if __name__ == '__main__':
+    run()
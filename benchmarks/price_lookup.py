@@ -0,0 +1,69 @@
+"""
+Compares the old linear-scan past/future price lookup against the sorted day index used by
+StockXFeatureExtractor._get_past_and_future_prices on synthetic transaction frames
+
+Run from the repository root with: python -m benchmarks.price_lookup
+"""
+import time
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from feature_extractor import StockXFeatureExtractor
+
+#the old lookup is O(n^2) so it is only timed up to this many rows
+LEGACY_MAX_ROWS = 10000
+
+def make_transactions_df(rows, days=730, seed=0):
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2018-01-01T00:00:00")
+    seconds = np.sort(rng.integers(0, days * 24 * 3600, rows))[::-1] #newest first like the activity API
+    created_at = [str(start + np.timedelta64(int(s), "s")) + "+00:00" for s in seconds]
+    return pd.DataFrame({
+        "sku": "BENCH-001",
+        "link_name": "adidas-bench-shoe",
+        "amount": rng.integers(80, 600, rows).astype(float),
+        "createdAt": created_at,
+        "shoeSize": rng.choice([7, 8, 8.5, 9, 9.5, 10, 10.5, 11, 12], rows),
+        "localCurrency": "USD",
+    })
+
+def legacy_past_and_future_prices(df, day_offsets):
+    """
+    The previous implementation: a linear nearest date search plus a full frame mask per lookup
+    """
+    def nearest_date(dates, date):
+        return min(dates, key=lambda x: abs(x - date))
+
+    df["transaction_date"] = pd.to_datetime(df["createdAt"]).dt.date
+    transaction_list = df["transaction_date"].tolist()
+    for direction, sign in [("ago", -1), ("future", 1)]:
+        for offset in day_offsets:
+            prices = []
+            for date_ in transaction_list:
+                nearest = nearest_date(transaction_list, date_ + timedelta(days=sign * offset))
+                prices.append(df.loc[df["transaction_date"] == nearest, "amount"].mean())
+            df["price_{}_days_{}".format(offset, direction)] = prices
+
+def time_call(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+def run(sizes=(10000, 100000)):
+    extractor = StockXFeatureExtractor("adidas")
+    offsets = extractor.price_day_offsets
+    price_columns = ["price_{}_days_{}".format(offset, direction) for direction in ["ago", "future"] for offset in offsets]
+    for rows in sizes:
+        df = make_transactions_df(rows)
+        new_df = df.copy()
+        new_time = time_call(extractor._get_past_and_future_prices, new_df)
+        if rows <= LEGACY_MAX_ROWS:
+            legacy_df = df.copy()
+            legacy_time = time_call(legacy_past_and_future_prices, legacy_df, offsets)
+            matches = np.allclose(new_df[price_columns].values, legacy_df[price_columns].values, equal_nan=True)
+            print("{} rows: legacy {:.2f}s, indexed {:.4f}s, speedup {:.0f}x, identical columns: {}".format(rows, legacy_time, new_time, legacy_time / new_time, matches))
+        else:
+            print("{} rows: legacy skipped (O(n^2)), indexed {:.4f}s".format(rows, new_time))
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,62 @@
+"""
+Simulates a crawl over a list of flaky proxies and compares how many requests are wasted when proxies are picked
+at random (the old behaviour) versus picked by ProxyPool
+
+Run from the repository root with: python -m benchmarks.proxy_pool
+"""
+import random
+from proxy_pool import ProxyPool
+
+def make_simulated_proxies(count=300, seed=0):
+    """
+    Free proxy lists are mostly dead: returns {proxy: (failure probability, latency in seconds)}
+    """
+    rng = random.Random(seed)
+    proxies = {}
+    for i in range(count):
+        kind = rng.random()
+        if kind < 0.6:
+            proxies["10.0.{}.{}:8080".format(i // 256, i % 256)] = (1.0, 10.0)
+        elif kind < 0.85:
+            proxies["10.0.{}.{}:8080".format(i // 256, i % 256)] = (0.5, rng.uniform(1, 5))
+        else:
+            proxies["10.0.{}.{}:8080".format(i // 256, i % 256)] = (0.05, rng.uniform(0.1, 1))
+    return proxies
+
+def simulate(get_proxy, report, simulated_proxies, urls=5000, retries=10, seed=1):
+    rng = random.Random(seed)
+    requests, failed_urls, network_time = 0, 0, 0.0
+    for _ in range(urls):
+        for _ in range(retries):
+            proxy = get_proxy()
+            failure_probability, latency = simulated_proxies[proxy]
+            requests += 1
+            network_time += latency
+            success = rng.random() >= failure_probability
+            report(proxy, success, latency)
+            if success:
+                break
+        else:
+            failed_urls += 1
+    return requests, failed_urls, network_time
+
+def run():
+    simulated_proxies = make_simulated_proxies()
+    proxies = list(simulated_proxies)
+
+    random_results = simulate(lambda: random.choice(proxies), lambda proxy, success, latency: None, simulated_proxies)
+
+    proxy_pool = ProxyPool(proxies)
+    def report(proxy, success, latency):
+        if success:
+            proxy_pool.report_success(proxy, latency)
+        else:
+            proxy_pool.report_failure(proxy)
+    pool_results = simulate(proxy_pool.get_proxy, report, simulated_proxies)
+
+    for name, (requests, failed_urls, network_time) in [("random", random_results), ("proxy pool", pool_results)]:
+        print("{}: {} requests, {} failed urls, {:.0f}s spent waiting on proxies".format(name, requests, failed_urls, network_time))
+    print("Proxy pool: {}".format(proxy_pool.get_summary()))
+
+if __name__ == '__main__':
+    run()
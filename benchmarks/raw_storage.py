@@ -0,0 +1,153 @@
+"""
+Writes the same synthetic shoe_info and transaction JSON to a JsonFileStore and a SegmentStore and compares disk usage,
+write and read time and listing time, including a second crawl where most feeds haven't changed. Then checks that the
+formatter gives the same csv and parquet output from both stores and that a writer killed halfway leaves a readable
+store
+
+Run from the repository root with: python -m benchmarks.raw_storage
+"""
+import os
+import shutil
+import signal
+import tempfile
+import time
+from multiprocessing import Process
+import pandas as pd
+from data_formatter import StockXDataFormatter
+from raw_store import SegmentStore, get_raw_store
+from benchmarks.stub_server import make_activity
+
+BRAND = "adidas"
+
+def make_shoe_info(sku):
+    return {"@type": "Product", "name": "adidas Bench Shoe {}".format(sku), "brand": "adidas", "sku": sku,
+        "releaseDate": "2019-06-01", "color": "Core Black/Cloud White", "description": "A shoe to benchmark with. " * 20,
+        "offers": {"@type": "AggregateOffer", "lowPrice": 120, "highPrice": 400, "priceCurrency": "USD",
+            "url": "https://stockx.com/adidas-bench-shoe-{}".format(sku.lower())}}
+
+def make_feeds(shoes, transactions_per_shoe, crawl=0):
+    #on every crawl a fifth of the shoes have sold something new, the rest return the same feed
+    feeds = {}
+    for i in range(shoes):
+        sku = "BENCH-{:05d}".format(i)
+        grown = crawl if i % 5 == 0 else 0
+        count = transactions_per_shoe + (i % 7) * 50 + grown * 10
+        feeds[sku] = {"ProductActivity": make_activity(sku, count, newest_time=1577836800 + grown * 36000)}
+    return feeds
+
+def get_directory_size(directory):
+    size = 0
+    files = 0
+    for root, _, file_names in os.walk(directory):
+        for file_name in file_names:
+            size += os.path.getsize(os.path.join(root, file_name))
+            files += 1
+    return size, files
+
+def put_all(stores, shoe_infos, feeds):
+    start = time.perf_counter()
+    for sku, shoe_info in shoe_infos.items():
+        stores["shoe_info"].put(sku, shoe_info)
+    for sku, feed in feeds.items():
+        stores["shoe_transactions"].put(sku, feed)
+    return time.perf_counter() - start
+
+def get_all(stores):
+    start = time.perf_counter()
+    for kind in ["shoe_info", "shoe_transactions"]:
+        for key in stores[kind].keys():
+            stores[kind].get(key)
+    return time.perf_counter() - start
+
+def list_all(stores, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for store in stores.values():
+            store.keys()
+    return (time.perf_counter() - start) / repeat
+
+def compare_backends(shoes, transactions_per_shoe):
+    shoe_infos = {sku: make_shoe_info(sku) for sku in make_feeds(shoes, 0)}
+    print("{} shoes, {}+ transactions each, two crawls".format(shoes, transactions_per_shoe))
+    outputs = {}
+    for backend in ["files", "segments"]:
+        stores = {kind: get_raw_store(BRAND, kind, backend) for kind in ["shoe_info", "shoe_transactions"]}
+        for store in stores.values():
+            os.makedirs(store.directory, exist_ok=True)
+        first_time = put_all(stores, shoe_infos, make_feeds(shoes, transactions_per_shoe, crawl=0))
+        second_time = put_all(stores, shoe_infos, make_feeds(shoes, transactions_per_shoe, crawl=1))
+        read_time = get_all(stores)
+        list_time = list_all(stores)
+        size, files = get_directory_size(stores["shoe_info"].directory)
+        transaction_size, transaction_files = get_directory_size(stores["shoe_transactions"].directory)
+        print("  {:<8} {:6.1f} MB in {:5} files, write {:.2f}s + {:.2f}s, read all {:.2f}s, list keys {:.1f} ms".format(
+            backend, (size + transaction_size) / 1e6, files + transaction_files, first_time, second_time, read_time, list_time * 1000))
+        if backend == "segments":
+            print("           {}".format(stores["shoe_transactions"].get_summary()))
+        outputs[backend] = format_brand(backend)
+    print("  formatter output identical: {}".format(outputs["files"] == outputs["segments"]))
+
+def format_brand(backend):
+    for directory in ["shoe_data/shoe_transactions/" + BRAND, "shoe_data/shoe_transactions_parquet/" + BRAND]:
+        shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs("shoe_data/shoe_transactions/" + BRAND)
+    formatter = StockXDataFormatter(BRAND, raw_storage=backend)
+    formatter.create_shoe_info_csv()
+    formatter.create_shoe_transaction_csvs()
+    formatter.create_shoe_transaction_parquet_files()
+    shoe_info = pd.read_csv("shoe_data/{}_shoe_info.csv".format(BRAND)).sort_values("sku").reset_index(drop=True)
+    parquet_directory = "shoe_data/shoe_transactions_parquet/" + BRAND
+    transactions = {file_name: pd.read_parquet(os.path.join(parquet_directory, file_name)) for file_name in sorted(os.listdir(parquet_directory))}
+    csv_directory = "shoe_data/shoe_transactions/" + BRAND
+    csvs = {file_name: pd.read_csv(os.path.join(csv_directory, file_name)) for file_name in sorted(os.listdir(csv_directory))}
+    return ShoeOutput(shoe_info, transactions, csvs)
+
+class ShoeOutput:
+    def __init__(self, shoe_info, transactions, csvs):
+        self.shoe_info = shoe_info
+        self.transactions = transactions
+        self.csvs = csvs
+
+    def __eq__(self, other):
+        return (self.shoe_info.equals(other.shoe_info)
+            and self.transactions.keys() == other.transactions.keys() and all(self.transactions[k].equals(other.transactions[k]) for k in self.transactions)
+            and self.csvs.keys() == other.csvs.keys() and all(self.csvs[k].equals(other.csvs[k]) for k in self.csvs))
+
+def keep_writing(directory):
+    store = SegmentStore(directory)
+    i = 0
+    while True:
+        sku = "KILL-{:06d}".format(i)
+        store.put(sku, {"ProductActivity": make_activity(sku, 2000 + i)})
+        i += 1
+
+def check_killed_writer(seconds=1.5):
+    directory = "raw_store/killed/"
+    writer = Process(target=keep_writing, args=(directory,))
+    writer.start()
+    time.sleep(seconds)
+    os.kill(writer.pid, signal.SIGKILL)
+    writer.join()
+
+    store = SegmentStore(directory)
+    #a half written record at the end of the segment, like a kill in the middle of f.write
+    with open(store._get_segment_file_name(store._list_segments()[-1]), 'ab') as f:
+        f.write(store.RECORD_HEADER.pack(store.MAGIC, 1 << 20, 0, 1 << 21) + b"\x78\x9c" * 100)
+    readable = sum(1 for key in store.keys() if len(store.get(key)["ProductActivity"]) > 0)
+    store.put("AFTER-KILL", {"ProductActivity": make_activity("AFTER-KILL", 10)})
+    print("Killed writer after {:.1f}s: {} of {} indexed keys readable, write after the kill readable: {}".format(
+        seconds, readable, len(store.keys()) - 1, len(store.get("AFTER-KILL")["ProductActivity"]) == 10))
+
+def run(shoes=500, transactions_per_shoe=300):
+    cwd = os.getcwd()
+    directory = tempfile.mkdtemp(prefix="stockx-bench-")
+    os.chdir(directory)
+    try:
+        compare_backends(shoes, transactions_per_shoe)
+        check_killed_writer()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    run()
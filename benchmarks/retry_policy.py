@@ -0,0 +1,82 @@
+"""
+Runs the shoe info stage against a FaultInjectingServer (rate limited, with random 403, 500, hanging and truncated
+responses and some shoes that are gone) once with the old retry loop (10 attempts, no delay, no timeout) and once
+with RetryPolicy, and compares shoes scraped, requests made, 429s caused and wall time
+
+Run from the repository root with: python -m benchmarks.retry_policy
+"""
+import os
+import shutil
+import time
+import multiprocessing_scraper
+from multiprocessing import current_process
+from multiprocessing_scraper import StockXScraper
+from retry_policy import CircuitBreaker, RetryPolicy
+from benchmarks.crawl_throughput import make_crawl_directory
+from benchmarks.stub_server import FaultInjectingServer
+
+BRAND = "adidas"
+FAULT_RATES = {"blocked": 0.05, "server_error": 0.05, "hang": 0.01, "truncated": 0.05}
+
+class LegacyStockXScraper(StockXScraper):
+    """
+    get_shoe_info as it was before RetryPolicy
+    """
+    def get_shoe_info(self, link):
+        url = "{}{}".format(self.base_url, link)
+        if self._check_if_shoe_info_already_scraped(url):
+            return
+        success = False
+        for _ in range(10):
+            try:
+                response = self._request(url, stage="info")
+                if response.status_code == 200:
+                    shoe_info = self._scrape_shoe_info(response.text)
+                    self._save_shoe_info(url, shoe_info)
+                    success = True
+                    break
+            except:
+                continue
+        if success == False:
+            print("Unable to get information from {}, Process ID: {}".format(url, current_process().pid))
+
+def make_retry_policy():
+    #the delays of the defaults shrunk so the benchmark finishes quickly
+    rules = {
+        "rate_limited": {"base_delay": 0.5, "max_delay": 2.0},
+        "server_error": {"base_delay": 0.2, "max_delay": 2.0},
+        "parse": {"base_delay": 0.1},
+    }
+    return RetryPolicy(rules=rules, timeout=(1, 1), breaker=CircuitBreaker(failure_threshold=10, window=2, cooldown=1, max_cooldown=4))
+
+def run_stage(scraper_class, server, links, **kwargs):
+    cwd = os.getcwd()
+    directory = make_crawl_directory(links)
+    os.chdir(directory)
+    request_count = server.request_count
+    server.fault_counts = {}
+    try:
+        scraper = scraper_class(BRAND, proxies=[server.url.replace("http://", "")], base_url="http://stockx.test", **kwargs)
+        start = time.perf_counter()
+        multiprocessing_scraper.scrape_shoe_info(scraper)
+        elapsed = time.perf_counter() - start
+        scraped = len(scraper.shoe_info_store.keys())
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+    return scraped, server.request_count - request_count, dict(server.fault_counts), elapsed
+
+def run(link_count=300, rate_limit=40, hang_seconds=10):
+    links = ["/{}-bench-shoe-{}".format(BRAND, i) for i in range(link_count)]
+    missing_links = links[::50]
+    results = {}
+    with FaultInjectingServer(fault_rates=FAULT_RATES, rate_limit=rate_limit, hang_seconds=hang_seconds, missing_paths=missing_links) as server:
+        results["old loop"] = run_stage(LegacyStockXScraper, server, links, retry_policy=RetryPolicy(timeout=None))
+        results["retry policy"] = run_stage(StockXScraper, server, links, retry_policy=make_retry_policy())
+    print("{} shoes ({} gone), site limited to {} requests/sec, fault rates {}".format(link_count, len(missing_links), rate_limit, FAULT_RATES))
+    for name, (scraped, requests, fault_counts, elapsed) in results.items():
+        print("  {:<12} {} shoes scraped, {} requests ({:.2f} per shoe), {} rate limited, {:.1f}s".format(
+            name, scraped, requests, requests / max(scraped, 1), fault_counts.get("rate_limited", 0), elapsed))
+
+if __name__ == '__main__':
+    run()
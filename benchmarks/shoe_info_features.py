@@ -0,0 +1,83 @@
+"""
+Compares the per-shoe shoe info features (five helpers that each scan the whole info frame per SKU) against
+StockXFeatureExtractor._get_shoe_info_features_grouped on a few thousand synthetic SKUs
+
+Run from the repository root with: python -m benchmarks.shoe_info_features
+"""
+import csv
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from feature_extractor import StockXFeatureExtractor
+from transaction_table import TransactionTable
+
+BRAND = "adidas"
+
+def make_catalog_and_transactions(skus, transactions_per_sku, seed=0):
+    rng = np.random.default_rng(seed)
+    sku_list = ["BENCH-{}".format(i) for i in range(skus)]
+    release_dates = ["2018-{:02d}-{:02d}".format(rng.integers(1, 13), rng.integers(1, 29)) for _ in sku_list]
+    release_dates[0] = "--" #no release date listed
+    shoe_info_df = pd.DataFrame({"link_name": ["adidas-bench-{}".format(i) for i in range(skus)], "sku": sku_list, "releaseDate": release_dates})
+
+    rows = skus * transactions_per_sku
+    milliseconds = rng.integers(0, 730 * 24 * 3600 * 1000, rows)
+    created_at = pd.Series(pd.to_datetime(np.datetime64("2018-01-01T00:00:00") + milliseconds.astype("timedelta64[ms]")))
+    #every other SKU has times with milliseconds and a Z, like some activity records
+    with_milliseconds = np.repeat(np.arange(skus) % 2 == 1, transactions_per_sku)
+    created_at_text = created_at.dt.strftime("%Y-%m-%dT%H:%M:%S+00:00").where(~with_milliseconds, created_at.dt.strftime("%Y-%m-%dT%H:%M:%S.%f").str[:-3] + "Z")
+    transactions_df = pd.DataFrame({
+        "sku": np.repeat(sku_list, transactions_per_sku),
+        "amount": rng.integers(80, 600, rows).astype(float),
+        "createdAt": created_at_text,
+        "shoeSize": rng.choice([7, 8, 8.5, 9, 9.5, 10, 10.5, 11, 12], rows),
+    })
+    return shoe_info_df, transactions_df
+
+def legacy_shoe_info_features(extractor, shoe_info_df, transactions_by_sku):
+    extractor._add_blank_columns_to_info_df(shoe_info_df)
+    for sku, shoe_transaction_df in transactions_by_sku.items():
+        try:
+            shoe_release_date = extractor._get_release_date_from_sku(sku)
+            extractor._add_release_date_delta(shoe_transaction_df, shoe_release_date)
+            extractor._get_max_price_and_date_and_days_since_release(sku, shoe_transaction_df, shoe_info_df)
+            extractor._get_min_price_and_date_and_days_since_release(sku, shoe_transaction_df, shoe_info_df)
+            extractor._get_month_and_year_with_most_transactions(sku, shoe_transaction_df, shoe_info_df)
+            extractor._get_most_popular_shoe_size(sku, shoe_transaction_df, shoe_info_df)
+        except:
+            continue
+
+def run(skus=3000, transactions_per_sku=200):
+    cwd = os.getcwd()
+    directory = tempfile.mkdtemp(prefix="stockx-bench-")
+    os.chdir(directory)
+    try:
+        os.makedirs("shoe_data")
+        shoe_info_df, transactions_df = make_catalog_and_transactions(skus, transactions_per_sku)
+        shoe_info_df.to_csv("shoe_data/{}_shoe_info.csv".format(BRAND), index=False, quoting=csv.QUOTE_ALL)
+        extractor = StockXFeatureExtractor(BRAND)
+        transactions_by_sku = {sku: df.reset_index(drop=True) for sku, df in transactions_df.groupby("sku")}
+
+        legacy_df = shoe_info_df.copy()
+        start = time.perf_counter()
+        legacy_shoe_info_features(extractor, legacy_df, transactions_by_sku)
+        legacy_time = time.perf_counter() - start
+
+        grouped_df = shoe_info_df.copy()
+        start = time.perf_counter()
+        extractor._add_shoe_info_features(grouped_df, {sku: {"sku": sku, "info_features": features} for sku, features in extractor._get_shoe_info_features_grouped(TransactionTable.from_dataframe(transactions_df, keep_created_at_text=True)).items()})
+        grouped_time = time.perf_counter() - start
+
+        columns = extractor.shoe_info_feature_columns
+        matches = (legacy_df[columns].astype(str).values == grouped_df[columns].astype(str).values).all()
+        print("{} SKUs x {} transactions: per shoe {:.2f}s, grouped {:.2f}s, speedup {:.0f}x, identical columns: {}".format(
+            skus, transactions_per_sku, legacy_time, grouped_time, legacy_time / grouped_time, matches))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    run()
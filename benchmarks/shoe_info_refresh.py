@@ -0,0 +1,85 @@
+"""
+Scrapes the shoe info of a brand from the stub server, changes some of the products and compares refetching all of
+them blindly against refresh_shoe_info with conditional requests (304s) and with only the hash of the extracted
+ld+json (a site that sends no validators): requests, bytes downloaded, records rewritten and changes found. Then
+refreshes a few more rounds where the same products keep changing and shows the refresh interval each one gets
+
+Run from the repository root with: python -m benchmarks.shoe_info_refresh
+"""
+import os
+import shutil
+import time
+import multiprocessing_scraper
+from crawl_state import RefreshSchedule
+from multiprocessing_scraper import StockXScraper
+from benchmarks.crawl_throughput import make_crawl_directory
+from benchmarks.stub_server import StubStockXServer
+
+BRAND = "adidas"
+
+def make_scraper(server):
+    scraper = StockXScraper(BRAND, proxies=[server.url.replace("http://", "")], base_url="http://stockx.test")
+    #every product is due right away
+    scraper.refresh_schedule = RefreshSchedule(min_interval=0, max_interval=0)
+    return scraper
+
+def run_refetch(scraper):
+    scraper.scraped_shoe_info_links = set()
+    multiprocessing_scraper.scrape_shoe_info(scraper)
+
+def measure(server, scraper, run_function):
+    request_count, bytes_sent, not_modified_count = server.request_count, server.bytes_sent, server.not_modified_count
+    scraper.metrics.pop_snapshot()
+    start = time.perf_counter()
+    run_function(scraper)
+    elapsed = time.perf_counter() - start
+    snapshot = scraper.metrics.get_snapshot()
+    return {
+        "requests": server.request_count - request_count,
+        "megabytes": (server.bytes_sent - bytes_sent) / 1e6,
+        "not modified": server.not_modified_count - not_modified_count,
+        "rewritten": snapshot["histograms"].get("info.write", {}).get("count", 0),
+        "changed": snapshot["counters"].get("refreshes", {}).get("info", {}).get("changed", 0),
+        "seconds": elapsed,
+    }
+
+def run(link_count=300, changed_share=0.1, rounds=4):
+    links = ["/{}-bench-shoe-{}".format(BRAND, i) for i in range(link_count)]
+    hot_links = links[:int(link_count * changed_share)]
+    cwd = os.getcwd()
+    directory = make_crawl_directory(links)
+    os.chdir(directory)
+    results = {}
+    try:
+        with StubStockXServer(latency=0.02) as server:
+            scraper = make_scraper(server)
+            multiprocessing_scraper.scrape_shoe_info(scraper)
+            for name, send_validators, run_function in [("refetch all", True, run_refetch), ("refresh, 304s", True, multiprocessing_scraper.refresh_shoe_info),
+                    ("refresh, hash only", False, multiprocessing_scraper.refresh_shoe_info)]:
+                for link in hot_links:
+                    server.product_versions[link] = server.product_versions.get(link, 0) + 1
+                server.send_validators = send_validators
+                results[name] = measure(server, make_scraper(server), run_function)
+
+            server.send_validators = True
+            for _ in range(rounds):
+                for link in hot_links:
+                    server.product_versions[link] += 1
+                multiprocessing_scraper.refresh_shoe_info(make_scraper(server))
+            schedule = RefreshSchedule()
+            intervals = {}
+            for name, group in [("changing", hot_links), ("static", links[len(hot_links):])]:
+                states = [scraper.crawl_state.get_refresh_state("info", scraper.base_url + link) for link in group]
+                intervals[name] = sum(schedule.get_interval(state["check_count"], state["change_count"]) for state in states) / len(states) / 86400
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+    print("{} products, {} of them changed before every refresh".format(link_count, len(hot_links)))
+    for name, result in results.items():
+        print("  {:<20} {requests} requests, {megabytes:.2f} MB, {not modified} not modified, {rewritten} records rewritten, {changed} changes found, "
+            "{seconds:.1f}s".format(name, **result))
+    print("  after {} refreshes, default schedule: products that keep changing every {:.1f} days, static ones every {:.1f} days".format(
+        rounds + 2, intervals["changing"], intervals["static"]))
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,208 @@
+"""
+Local stand-in for stockx.com used by the crawl benchmarks: serves browse pages, product pages with ld+json
+and the activity API with synthetic data. It also accepts absolute-URI requests so it can be used as the proxy
+"""
+import json
+import random
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+LINKS_PER_PAGE = 40
+
+def make_browse_page(brand, page):
+    anchors = "".join('<a href="/{}-shoe-{}-{}">Shoe</a>'.format(brand, page, i) for i in range(LINKS_PER_PAGE))
+    return '<html><body><div class="header"><a href="/">Home</a></div><div class="browse-grid">{}</div></body></html>'.format(anchors)
+
+def make_product_page(link, version=0):
+    """
+    Product page of the link, with its offers and colorway as they are at the given version of the product
+    """
+    sku = link.strip("/").upper()
+    shoe_info = {
+        "@type": "Product",
+        "name": link.strip("/").replace("-", " ").title(),
+        "brand": link.strip("/").split("-")[0],
+        "model": "Bench Model",
+        "color": "Core Black/Cloud White" if version % 2 == 0 else "Core Black/Solar Red",
+        "releaseDate": "2019-01-01",
+        "sku": sku,
+        "offers": {"@type": "AggregateOffer", "lowPrice": 100 + version, "highPrice": 300, "priceCurrency": "USD", "url": "https://stockx.com" + link},
+    }
+    return ('<html><head><script type="application/ld+json">{{"@type": "Organization"}}</script></head><body>'
+        '<div class="product">{}</div><script type="application/ld+json">{}</script></body></html>').format("x" * 2000, json.dumps(shoe_info))
+
+def make_activity(sku, count, newest_time=1577836800):
+    """
+    count transactions newest first, one per hour going back from newest_time. Ids count up from the oldest
+    transaction so a feed that grows (count and newest_time moving forward together) keeps its old transactions
+    """
+    activity = []
+    for i in range(count):
+        transaction_id = count - i
+        activity.append({
+            "chainId": "{}-{}".format(sku, transaction_id),
+            "amount": 100 + transaction_id % 250,
+            "createdAt": time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(newest_time - i * 3600)),
+            "shoeSize": str(7 + (transaction_id % 12) / 2),
+            "productId": sku,
+            "skuUuid": sku,
+            "localAmount": 100 + transaction_id % 250,
+            "localCurrency": "USD",
+        })
+    return activity
+
+class StubStockXHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.request_count += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path.startswith("/api/products/") and url.path.endswith("/activity"):
+            sku = url.path.split("/")[3]
+            limit = int(query.get("limit", ["100000"])[0])
+            page = int(query.get("page", ["1"])[0])
+            count = self.server.transactions_per_sku + self.server.new_transactions_per_sku
+            newest_time = 1577836800 + self.server.new_transactions_per_sku * 3600
+            activity = make_activity(sku, count, newest_time=newest_time)[(page - 1) * limit:page * limit]
+            body = json.dumps({"ProductActivity": activity})
+            self._send(200, body, "application/json")
+        elif "page" in query:
+            self._send(200, make_browse_page(url.path.strip("/"), query["page"][0]), "text/html")
+        else:
+            self._send_product_page(url.path)
+
+    def _send_product_page(self, link):
+        """
+        Sends the product page with an ETag and Last-Modified for its version when the server sends validators, and
+        a 304 without a body when the validators of the request still match
+        """
+        version = self.server.product_versions.get(link, 0)
+        if not self.server.send_validators:
+            self._send(200, make_product_page(link, version), "text/html")
+            return
+        etag = '"{}-{}"'.format(link.strip("/"), version)
+        headers = {"ETag": etag, "Last-Modified": formatdate(1577836800 + version * 3600, usegmt=True)}
+        if self.headers.get("If-None-Match") == etag:
+            self.server.not_modified_count += 1
+            self._send(304, "", "text/html", headers)
+        else:
+            self._send(200, make_product_page(link, version), "text/html", headers)
+
+    def _send(self, status, body, content_type, headers=None):
+        data = body.encode()
+        self.server.bytes_sent += len(data)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+class StubStockXServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, port=0, latency=0.05, transactions_per_sku=200, handler=StubStockXHandler):
+        super().__init__(("127.0.0.1", port), handler)
+        self.latency = latency
+        self.transactions_per_sku = transactions_per_sku
+        #transactions added on top of transactions_per_sku since the "first crawl"
+        self.new_transactions_per_sku = 0
+        #{link: version}, bump the version of a link to change its product page
+        self.product_versions = {}
+        #whether product pages have an ETag and Last-Modified and get a 304 when the ETag still matches
+        self.send_validators = True
+        self.not_modified_count = 0
+        self.request_count = 0
+        self.bytes_sent = 0
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+class FaultInjectingHandler(StubStockXHandler):
+    """
+    Answers like StubStockXHandler except for the faults FaultInjectingServer picks for the request
+    """
+    def do_GET(self):
+        fault = self.server.pick_fault(urlparse(self.path).path)
+        if fault is None or fault == "truncated":
+            self.truncate = fault == "truncated"
+            return super().do_GET()
+        self.server.request_count += 1
+        if fault == "rate_limited":
+            self._send(429, "Too Many Requests", "text/plain", {"Retry-After": str(self.server.retry_after)})
+        elif fault == "hang":
+            #longer than the read timeout of the client, which has hung up by the time this answers
+            time.sleep(self.server.hang_seconds)
+            try:
+                self._send(503, "Service Unavailable", "text/plain")
+            except OSError:
+                pass
+        else:
+            status = {"blocked": 403, "server_error": 500, "not_found": 404}[fault]
+            self._send(status, "Error", "text/plain")
+
+    def _send(self, status, body, content_type, headers=None):
+        if getattr(self, "truncate", False):
+            #a page or JSON cut off halfway, like a proxy that drops the connection
+            body = body[:len(body) // 2]
+        super()._send(status, body, content_type, headers)
+
+class FaultInjectingServer(StubStockXServer):
+    """
+    StubStockXServer that answers 429 with a Retry-After header once requests come in faster than rate_limit
+    per second, always answers 404 for the missing_paths and otherwise fails requests at random with the given rates:
+    "blocked" (403), "server_error" (500), "hang" (no answer for hang_seconds) and "truncated" (200 with half the body)
+    """
+    def __init__(self, port=0, latency=0.01, fault_rates=None, rate_limit=None, retry_after=1, hang_seconds=5, missing_paths=(), seed=0, **kwargs):
+        super().__init__(port=port, latency=latency, handler=FaultInjectingHandler, **kwargs)
+        self.fault_rates = fault_rates or {}
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.hang_seconds = hang_seconds
+        self.missing_paths = set(missing_paths)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.tokens = rate_limit or 0
+        self.updated_at = time.monotonic()
+        self.fault_counts = {}
+
+    def pick_fault(self, path):
+        with self.lock:
+            fault = "not_found" if path in self.missing_paths else None
+            if fault is None and self.rate_limit:
+                now = time.monotonic()
+                self.tokens = min(self.rate_limit, self.tokens + (now - self.updated_at) * self.rate_limit)
+                self.updated_at = now
+                if self.tokens < 1:
+                    fault = "rate_limited"
+                else:
+                    self.tokens -= 1
+            if fault is None:
+                roll = self.random.random()
+                for name, rate in self.fault_rates.items():
+                    if roll < rate:
+                        fault = name
+                        break
+                    roll -= rate
+            self.fault_counts[fault or "ok"] = self.fault_counts.get(fault or "ok", 0) + 1
+            return fault
@@ -0,0 +1,261 @@
+"""
+Times the parsing, formatting, feature and model code on synthetic data (see benchmarks/synthetic.py) at several
+scales: the scraper's _scrape_shoe_links and _scrape_shoe_info, the StockXDataFormatter conversions, every
+StockXFeatureExtractor feature function and model.py's walk-forward evaluation. Reports the best time of a few runs,
+the peak Python heap of one run (tracemalloc, which doesn't see pyarrow or numpy buffers allocated outside of it) and
+the peak RSS of one run in a forked process (which sees everything, child processes included) of every case, saves the results to benchmarks/results/<time>.json and
+compares them with the previous results file
+
+Run from the repository root with: python -m benchmarks.suite [scale ...] [--cases text] [--compare results.json]
+Scales: small, medium (the default) and large
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+import pandas as pd
+from data_formatter import StockXDataFormatter, format_brands
+from feature_extractor import StockXFeatureExtractor
+from forecasting import WalkForwardForecaster, get_shoe_size_series
+from multiprocessing_scraper import StockXScraper
+from transaction_table import TransactionTable
+from benchmarks import synthetic
+
+BRAND = "adidas"
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(__file__), "results")
+#a case counts as slower or faster than in the previous results when its time changed by more than this
+THRESHOLD = 1.2
+
+SCALES = {
+    "small": {"page_kilobytes": 50, "links_per_page": 40, "skus": 20, "transactions_per_sku": 1000, "series_length": 200},
+    "medium": {"page_kilobytes": 200, "links_per_page": 40, "skus": 50, "transactions_per_sku": 10000, "series_length": 500},
+    "large": {"page_kilobytes": 500, "links_per_page": 100, "skus": 100, "transactions_per_sku": 50000, "series_length": 1000},
+}
+
+def make_context(scale):
+    """
+    Writes a synthetic brand of the scale to the raw stores and formats it, then reads what the cases need. Runs in
+    the temporary directory of the scale
+    """
+    skus = synthetic.write_brand(BRAND, scale["skus"], scale["transactions_per_sku"])
+    os.makedirs("shoe_data/shoe_transactions/{}".format(BRAND))
+    formatter = StockXDataFormatter(BRAND)
+    formatter.create_shoe_info_csv()
+    formatter.create_shoe_transaction_csvs()
+    extractor = StockXFeatureExtractor(BRAND)
+    shoe_names = sorted(extractor._get_shoe_name_list())
+    shoe = shoe_names[0]
+    shoe_transaction_df = extractor._read_shoe_transactions(extractor._get_transactions_file_name(shoe))
+    transactions = TransactionTable.concat(TransactionTable.read_file(extractor._get_transactions_file_name(name)) for name in shoe_names)
+    shoe_info_df = pd.read_csv("shoe_data/{}_shoe_info.csv".format(BRAND))
+
+    #the model is evaluated on one long size series, like model.py does on its shoe
+    activity = synthetic.make_activity("SYN-MODEL", scale["series_length"], sizes=["10"])
+    model_df = TransactionTable.from_activity("SYN-MODEL", "synthetic-model-shoe", activity).to_dataframe()
+    return {
+        "scale": scale,
+        "scraper": StockXScraper(BRAND, proxies=[]),
+        "browse_page": synthetic.make_browse_page(BRAND, scale["links_per_page"], scale["page_kilobytes"]),
+        "product_page": synthetic.make_product_page(synthetic.make_shoe_info(BRAND, 1), scale["page_kilobytes"]),
+        "formatter": formatter,
+        "sku": skus[0],
+        "extractor": extractor,
+        "shoe_names": shoe_names,
+        "shoe": shoe,
+        "shoe_transaction_df": shoe_transaction_df[extractor.base_columns],
+        "release_date": extractor._get_release_date_from_sku(shoe_transaction_df["sku"].values[0]),
+        "transactions": transactions,
+        "shoe_info_df": shoe_info_df,
+        "model_df": model_df,
+    }
+
+def prepare_feature_records(context):
+    extractor = context["extractor"]
+    if not extractor.feature_records:
+        records = [extractor._add_additional_features_transaction_data(shoe) for shoe in context["shoe_names"]]
+        extractor.feature_records = {record["shoe"]: record for record in records if record is not None}
+
+def evaluate_model(context):
+    series = get_shoe_size_series(context["model_df"])["10"]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        #model.py's settings
+        return WalkForwardForecaster(order=(3, 1, 0), refit_interval=50, train_fraction=0.8).evaluate(series)
+
+def update_shoe_info_features(context):
+    prepare_feature_records(context)
+    return lambda: context["extractor"].update_shoe_info_features(context["shoe_names"], grouped_info_features=True)
+
+#(name, function that gets the context and returns what to time), the functions that change a frame get a copy
+CASES = [
+    ("scraper._scrape_shoe_links", lambda c: lambda: c["scraper"]._scrape_shoe_links(c["browse_page"])),
+    ("scraper._scrape_shoe_info", lambda c: lambda: c["scraper"]._scrape_shoe_info(c["product_page"])),
+    ("formatter.create_shoe_info_csv", lambda c: c["formatter"].create_shoe_info_csv),
+    ("formatter.create_shoe_transaction_csv", lambda c: lambda: c["formatter"].create_shoe_transaction_csv(c["sku"])),
+    ("formatter.create_shoe_transaction_parquet_file", lambda c: lambda: c["formatter"].create_shoe_transaction_parquet_file(c["sku"])),
+    ("formatter.format_brands", lambda c: lambda: format_brands([BRAND], processes=1)),
+    ("extractor._add_color_info", lambda c: lambda: c["extractor"]._add_color_info(c["shoe_info_df"].copy())),
+    ("extractor._format_model_col", lambda c: lambda: c["extractor"]._format_model_col(c["shoe_info_df"].copy())),
+    ("extractor._format_name_col", lambda c: lambda: c["extractor"]._format_name_col(c["shoe_info_df"].copy())),
+    ("extractor._add_date_info", lambda c: lambda: c["extractor"]._add_date_info(c["shoe_info_df"].copy())),
+    ("extractor._get_shoe_info_features", lambda c: lambda: c["extractor"]._get_shoe_info_features(c["shoe_transaction_df"]["sku"].values[0],
+        c["shoe_transaction_df"].copy())),
+    ("extractor._get_shoe_info_features_grouped", lambda c: lambda: c["extractor"]._get_shoe_info_features_grouped(c["transactions"])),
+    ("extractor._get_past_and_future_prices", lambda c: lambda: c["extractor"]._get_past_and_future_prices(c["shoe_transaction_df"].copy())),
+    ("extractor.transaction_features.add_features", lambda c: lambda: c["extractor"].transaction_features.add_features(c["shoe_transaction_df"].copy(),
+        c["release_date"])),
+    ("extractor._add_additional_features_transaction_data", lambda c: lambda: c["extractor"]._add_additional_features_transaction_data(c["shoe"])),
+    ("extractor.update_shoe_info_features", update_shoe_info_features),
+    ("forecasting.get_shoe_size_series", lambda c: lambda: get_shoe_size_series(c["model_df"])),
+    ("model.walk_forward_evaluation", lambda c: lambda: evaluate_model(c)),
+]
+
+def measure(function, min_seconds=0.5, max_runs=5):
+    """
+    Best time of up to max_runs runs (stopping once they took min_seconds together), the peak traced Python heap of one
+    more run and the peak RSS of another one (see get_peak_rss), in MB above where they started
+    """
+    times = []
+    while len(times) < max_runs and sum(times) < min_seconds:
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    function()
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    return {"seconds": min(times), "runs": len(times), "heap_peak_mb": peak / 1e6, "rss_peak_mb": get_peak_rss(function)}
+
+def get_peak_rss(function):
+    """
+    Runs the function in a forked process and returns how far its RSS went above the RSS it was forked with, plus the
+    same for the biggest child process it started (like the formatter's Pool workers), in MB. None if the function
+    raised
+    """
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        try:
+            #a forked process starts with the RSS it was forked with as its peak
+            start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            function()
+            os.write(write_end, json.dumps([start, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss]).encode())
+        finally:
+            os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end) as f:
+        message = f.read()
+    _, _, usage = os.wait4(pid, 0)
+    if not message:
+        return None
+    start, children_peak = json.loads(message)
+    peak = usage.ru_maxrss - start + max(children_peak - start, 0)
+    #ru_maxrss is in KB, except on macOS where it's in bytes
+    return peak * (1 if sys.platform == "darwin" else 1000) / 1e6
+
+def run_scale(name, case_filter=None):
+    scale = SCALES[name]
+    cwd = os.getcwd()
+    directory = tempfile.mkdtemp(prefix="stockx-bench-")
+    os.chdir(directory)
+    results = {}
+    try:
+        start = time.perf_counter()
+        #the code that is timed prints its progress
+        with contextlib.redirect_stdout(io.StringIO()):
+            context = make_context(scale)
+        print("{}: {} SKUs, {} transactions, {} KB pages, set up in {:.1f}s".format(name, scale["skus"], len(context["transactions"]),
+            scale["page_kilobytes"], time.perf_counter() - start))
+        for case_name, make_function in CASES:
+            if case_filter is not None and case_filter not in case_name:
+                continue
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    results[case_name] = measure(make_function(context))
+            except Exception as e:
+                results[case_name] = {"error": repr(e)}
+                print("Unable to run {}: {!r}".format(case_name, e))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+    return results
+
+def get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def get_previous_results_file(results_directory=RESULTS_DIRECTORY):
+    if not os.path.isdir(results_directory):
+        return None
+    file_names = sorted(file_name for file_name in os.listdir(results_directory) if file_name.endswith(".json"))
+    return os.path.join(results_directory, file_names[-1]) if file_names else None
+
+def save_results(report, results_directory=RESULTS_DIRECTORY):
+    os.makedirs(results_directory, exist_ok=True)
+    file_name = os.path.join(results_directory, "{}.json".format(time.strftime("%Y%m%d-%H%M%S", time.localtime(report["started_at"]))))
+    with open(file_name, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    return file_name
+
+def print_results(report, previous_report=None):
+    previous_results = previous_report["results"] if previous_report is not None else {}
+    if previous_report is not None:
+        print("Compared with the results of {} (commit {})".format(time.strftime("%Y-%m-%d %H:%M", time.localtime(previous_report["started_at"])),
+            previous_report.get("commit")))
+    for scale, results in report["results"].items():
+        print("{}:".format(scale))
+        print("  {:<52} {:>10} {:>9} {:>9} {:>14}".format("case", "ms", "heap MB", "RSS MB", "vs previous"))
+        for case_name, result in results.items():
+            if "error" in result:
+                print("  {:<52} {}".format(case_name, result["error"]))
+                continue
+            previous = previous_results.get(scale, {}).get(case_name, {})
+            comparison = ""
+            if "seconds" in previous:
+                ratio = result["seconds"] / max(previous["seconds"], 1e-9)
+                comparison = "{:.2f}x{}".format(ratio, " slower" if ratio > THRESHOLD else " faster" if ratio < 1 / THRESHOLD else "")
+            rss = "{:.1f}".format(result["rss_peak_mb"]) if result["rss_peak_mb"] is not None else "-"
+            print("  {:<52} {:>10.2f} {:>9.1f} {:>9} {:>14}".format(case_name, result["seconds"] * 1000, result["heap_peak_mb"], rss, comparison))
+
+def run(scales=("small", "medium"), case_filter=None, compare_file=None, save=True):
+    report = {"started_at": time.time(), "commit": get_commit(), "python": platform.python_version(), "platform": platform.platform(),
+        "cpu_count": os.cpu_count(), "results": {}}
+    compare_file = compare_file or get_previous_results_file()
+    for scale in scales:
+        report["results"][scale] = run_scale(scale, case_filter)
+    previous_report = None
+    if compare_file is not None:
+        with open(compare_file) as f:
+            previous_report = json.load(f)
+    print_results(report, previous_report)
+    if save:
+        print("Results saved to {}".format(save_results(report)))
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Times the parsing, formatting, feature and model code on synthetic data")
+    parser.add_argument("scales", nargs="*", help="any of {}, small and medium by default".format(", ".join(SCALES)))
+    parser.add_argument("--cases", help="only run the cases whose name contains this text")
+    parser.add_argument("--compare", help="results file to compare with, the latest one in benchmarks/results by default")
+    parser.add_argument("--no-save", action="store_true", help="don't save the results")
+    arguments = parser.parse_args()
+    for scale in arguments.scales:
+        if scale not in SCALES:
+            parser.error("unknown scale {}".format(scale))
+    run(arguments.scales or ["small", "medium"], arguments.cases, arguments.compare, not arguments.no_save)
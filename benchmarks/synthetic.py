@@ -0,0 +1,88 @@
+"""
+Synthetic StockX data for the benchmarks: browse and product pages padded to a given size, the ld+json shoe info of
+a product page, activity JSON with any amount of transactions and whole brands written to the raw stores
+"""
+import json
+import os
+import time
+import numpy as np
+from raw_store import get_raw_store
+
+SHOE_SIZES = ["7", "7.5", "8", "8.5", "9", "9.5", "10", "10.5", "11", "11.5", "12", "13"]
+COLORS = ["Core Black", "Cloud White", "Solar Red", "Grey Two", "Gum", "Royal Blue"]
+
+def make_filler(kilobytes):
+    #real pages carry a lot of markup around the parts that are extracted
+    tile = '<div class="tile"><a href="/related"><img src="/img.png" alt="Related"/><span class="name">Related shoe</span></a></div>'
+    return '<div class="related-products">{}</div>'.format(tile * (kilobytes * 1024 // len(tile)))
+
+def make_browse_page(brand, link_count=40, kilobytes=0, page=1):
+    anchors = "".join('<div class="tile"><a href="/{}-synthetic-{}-{}">Shoe</a></div>'.format(brand, page, i) for i in range(link_count))
+    return ('<html><head><title>{}</title></head><body><div class="header"><a href="/">Home</a></div><main>{}<div class="browse-grid">{}</div>'
+        '</main></body></html>').format(brand, make_filler(kilobytes), anchors)
+
+def make_shoe_info(brand, index, seed=0):
+    """
+    The ld+json shoe info of a synthetic product
+    """
+    rng = np.random.default_rng((seed, index))
+    sku = "SYN-{:06d}".format(index)
+    link_name = "{}-synthetic-shoe-{}".format(brand, index)
+    colors = rng.choice(COLORS, int(rng.integers(1, 4)), replace=False)
+    return {
+        "@context": "http://schema.org",
+        "@type": "Product",
+        "name": "{} Synthetic Shoe {}".format(brand.title(), index),
+        "brand": brand,
+        "model": "{} Synthetic {}".format(brand, index % 20),
+        "color": "/".join(colors),
+        "releaseDate": "--" if index % 25 == 0 else "2019-{:02d}-{:02d}".format(int(rng.integers(1, 13)), int(rng.integers(1, 29))),
+        "sku": sku,
+        "description": "Synthetic shoe " * 20,
+        "offers": {"@type": "AggregateOffer", "lowPrice": 100, "highPrice": 400, "priceCurrency": "USD", "url": "https://stockx.com/" + link_name},
+    }
+
+def make_product_page(shoe_info, kilobytes=0):
+    return ('<html><head><script type="application/ld+json">{{"@type": "Organization", "name": "StockX"}}</script></head><body><main>'
+        '<div class="product"><h1>{}</h1></div>{}<script type="application/ld+json">{}</script></main></body></html>').format(
+        shoe_info["name"], make_filler(kilobytes), json.dumps(shoe_info))
+
+def make_activity(sku, count, seed=0, newest_time=1577836800, sizes=SHOE_SIZES):
+    """
+    count transactions newest first, a random walk of prices about an hour apart on average, as the activity API
+    sends them
+    """
+    rng = np.random.default_rng(seed)
+    created_at = newest_time - np.cumsum(rng.integers(0, 7200, count))
+    amounts = np.maximum(50, 250 + np.cumsum(rng.normal(0, 3, count)).round())
+    shoe_sizes = rng.choice(sizes, count)
+    return [{
+        "chainId": "{}-{}".format(sku, count - i),
+        "amount": int(amount),
+        "createdAt": time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(int(timestamp))),
+        "shoeSize": str(shoe_size),
+        "productId": sku,
+        "skuUuid": sku,
+        "localAmount": int(amount),
+        "localCurrency": "USD",
+    } for i, (amount, timestamp, shoe_size) in enumerate(zip(amounts, created_at, shoe_sizes))]
+
+def write_brand(brand, sku_count, transactions_per_sku, seed=0, raw_storage="files"):
+    """
+    Writes the shoe info and transactions of sku_count synthetic shoes to the raw stores in the current directory,
+    with between half and one and a half times transactions_per_sku transactions each. Returns the SKUs
+    """
+    rng = np.random.default_rng(seed)
+    if raw_storage == "files":
+        for kind in ["shoe_info", "shoe_transactions"]:
+            os.makedirs("{}/{}/".format(kind, brand), exist_ok=True)
+    info_store = get_raw_store(brand, "shoe_info", raw_storage)
+    transaction_store = get_raw_store(brand, "shoe_transactions", raw_storage)
+    skus = []
+    for index in range(sku_count):
+        shoe_info = make_shoe_info(brand, index, seed)
+        count = int(rng.integers(transactions_per_sku // 2, transactions_per_sku * 3 // 2 + 1))
+        info_store.put(shoe_info["sku"], shoe_info)
+        transaction_store.put(shoe_info["sku"], {"ProductActivity": make_activity(shoe_info["sku"], count, seed=(seed, index))})
+        skus.append(shoe_info["sku"])
+    return skus
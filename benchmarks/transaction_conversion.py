@@ -0,0 +1,58 @@
+"""
+Compares time and peak Python memory of converting one transaction JSON file with create_shoe_transaction_csvs
+(json.load + lists of rows) versus the streaming create_shoe_transaction_parquet_files path
+
+Run from the repository root with: python -m benchmarks.transaction_conversion
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+from data_formatter import StockXDataFormatter
+from benchmarks.stub_server import make_activity
+
+BRAND = "adidas"
+SKU = "BENCH-001"
+
+def make_formatter_directory(transactions):
+    directory = tempfile.mkdtemp(prefix="stockx-bench-")
+    for sub_directory in ["shoe_info", "shoe_transactions", "shoe_data/shoe_transactions"]:
+        os.makedirs(os.path.join(directory, sub_directory, BRAND))
+    with open(os.path.join(directory, "shoe_info", BRAND, SKU + ".json"), "w") as f:
+        json.dump({"sku": SKU, "offers": {"url": "https://stockx.com/adidas-bench-shoe"}}, f)
+    with open(os.path.join(directory, "shoe_transactions", BRAND, SKU + ".json"), "w") as f:
+        json.dump({"ProductActivity": make_activity(SKU, transactions)}, f)
+    return directory
+
+def measure(function):
+    tracemalloc.start()
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+def run(sizes=(10000, 100000, 500000)):
+    cwd = os.getcwd()
+    for transactions in sizes:
+        directory = make_formatter_directory(transactions)
+        os.chdir(directory)
+        try:
+            formatter = StockXDataFormatter(BRAND)
+            formatter.create_shoe_info_csv()
+            csv_time, csv_peak = measure(formatter.create_shoe_transaction_csvs)
+            parquet_time, parquet_peak = measure(formatter.create_shoe_transaction_parquet_files)
+            csv_rows = len(pd.read_csv("shoe_data/shoe_transactions/{}/adidas-bench-shoe.csv".format(BRAND)))
+            parquet_rows = len(pd.read_parquet("shoe_data/shoe_transactions_parquet/{}/adidas-bench-shoe.parquet".format(BRAND)))
+            print("{} transactions: csv {:.2f}s peak {:.1f} MB, parquet {:.2f}s peak {:.1f} MB, rows {}/{}".format(
+                transactions, csv_time, csv_peak / 1e6, parquet_time, parquet_peak / 1e6, csv_rows, parquet_rows))
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    run()
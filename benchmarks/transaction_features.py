@@ -0,0 +1,65 @@
+"""
+Compares the old per transaction features of feature_extractor.py (rolling mean of the last 10 prices, average price
+per day, days since release as a list of timedeltas) plus pandas rolling per shoe size against TransactionFeatureBuilder
+on one shoe with 100k transactions, and checks both give the same values
+
+Run from the repository root with: python -m benchmarks.transaction_features
+"""
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from transaction_features import TransactionFeatureBuilder
+
+RELEASE_DATE = "2018-06-01"
+
+def make_transactions(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    seconds = rng.integers(0, 730 * 24 * 3600, rows)
+    created_at = pd.Series(pd.to_datetime(np.datetime64("2018-01-01T00:00:00") + seconds.astype("timedelta64[s]")))
+    return pd.DataFrame({
+        "sku": "BENCH-1",
+        "link_name": "adidas-bench-1",
+        "amount": rng.integers(80, 600, rows).astype(float),
+        "createdAt": created_at.dt.strftime("%Y-%m-%dT%H:%M:%S+00:00"),
+        "shoeSize": rng.choice([7, 8, 8.5, 9, 9.5, 10, 10.5, 11, 12], rows),
+        "localCurrency": "USD",
+    })
+
+def legacy_features(df):
+    #copies of _add_rolling_mean, _get_average_price_per_day and _add_release_date_delta before the builder
+    df["rolling_average_price_10"] = df.sort_values(by=['createdAt'], kind="stable")["amount"].rolling(10).mean()
+    df["average_price_per_day"] = df['amount'].groupby(pd.to_datetime(df['createdAt']).dt.to_period("D")).transform('mean')
+    release_date = datetime.strptime(RELEASE_DATE, "%Y-%m-%d")
+    transaction_dates = pd.to_datetime(df["createdAt"]).dt.tz_localize(None)
+    df["days_since_release"] = [(transaction_date - release_date).days for transaction_date in list(transaction_dates)]
+    #what the per size variants would cost with pandas rolling
+    by_size = df.assign(createdAt=transaction_dates).sort_values(["shoeSize", "createdAt"], kind="stable")
+    for window in [10, "30D"]:
+        rolling = by_size.set_index("createdAt").groupby("shoeSize")["amount"].rolling(window).mean()
+        df.loc[by_size.index, "rolling_average_price_size_{}".format(str(window).lower())] = rolling.values
+
+def run(rows=100000):
+    df = make_transactions(rows)
+    legacy_df = df.copy()
+    start = time.perf_counter()
+    legacy_features(legacy_df)
+    legacy_time = time.perf_counter() - start
+
+    builder = TransactionFeatureBuilder(count_windows=[10], time_windows=[], size_count_windows=[10], size_time_windows=["30D"])
+    builder_df = df.copy()
+    start = time.perf_counter()
+    builder.add_features(builder_df, RELEASE_DATE)
+    builder_time = time.perf_counter() - start
+
+    columns = ["rolling_average_price_10", "average_price_per_day", "days_since_release", "rolling_average_price_size_10", "rolling_average_price_size_30d"]
+    matches = {column: np.allclose(legacy_df[column].astype(float), builder_df[column].astype(float), equal_nan=True) for column in columns}
+    print("{} transactions: old features {:.2f}s, builder {:.3f}s ({:.0f}x faster)".format(rows, legacy_time, builder_time, legacy_time / builder_time))
+    print("Identical columns: {}".format(matches))
+
+    start = time.perf_counter()
+    TransactionFeatureBuilder().add_features(df.copy(), RELEASE_DATE)
+    print("Default windows ({}): {:.3f}s".format(TransactionFeatureBuilder().get_version(), time.perf_counter() - start))
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,128 @@
+"""
+Memory of the transactions of a whole brand held as lists of row values (what the formatter built before it streamed
+the rows) and as a pandas frame of the concatenated CSVs (with the default string columns and with object columns like
+older pandas) against TransactionTable, after formatting a synthetic brand with the formatter. Only the grouped shoe
+info features hold transactions in a TransactionTable, one file at a time. Also checks the CSV files hold the activity
+values as they were sent (one SKU has prices with cents and timestamps with milliseconds or another offset), that the
+table gives back the same rows as the CSV files and times a per SKU and size slice
+
+Run from the repository root with: python -m benchmarks.transaction_memory
+"""
+import csv
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from data_formatter import StockXDataFormatter
+from transaction_table import TransactionTable
+from benchmarks.stub_server import make_activity
+
+BRAND = "adidas"
+BASE_COLUMNS = ["sku", "link_name", "amount", "createdAt", "shoeSize", "localCurrency"]
+
+def make_brand_directory(sku_count, transactions_per_sku, seed=0):
+    rng = np.random.default_rng(seed)
+    directory = tempfile.mkdtemp(prefix="stockx-bench-")
+    for sub_directory in ["shoe_info", "shoe_transactions", "shoe_data/shoe_transactions"]:
+        os.makedirs(os.path.join(directory, sub_directory, BRAND))
+    for i in range(sku_count):
+        sku = "BENCH-{}".format(i)
+        with open(os.path.join(directory, "shoe_info", BRAND, sku + ".json"), "w") as f:
+            json.dump({"sku": sku, "offers": {"url": "https://stockx.com/adidas-bench-shoe-{}".format(i)}}, f)
+        count = int(rng.integers(transactions_per_sku // 2, transactions_per_sku * 3 // 2))
+        activity = make_activity(sku, count)
+        if i == 0:
+            for transaction in activity:
+                transaction["amount"] += 0.99
+            activity[0].update({"amount": 1999999.99, "createdAt": "2019-12-31T23:59:15.123Z"})
+            activity[1].update({"createdAt": "2019-12-31T17:59:15-05:00"})
+        with open(os.path.join(directory, "shoe_transactions", BRAND, sku + ".json"), "w") as f:
+            json.dump({"ProductActivity": activity}, f)
+    return directory
+
+def legacy_rows(sku, link_name, data):
+    #what _filter_shoe_transactions_keys built for every SKU
+    rows = [BASE_COLUMNS]
+    for transaction in data["ProductActivity"]:
+        rows.append([sku, link_name] + [transaction[key] for key in BASE_COLUMNS if key in transaction])
+    return rows
+
+def measure(function):
+    tracemalloc.start()
+    result = function()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+def run(sku_count=1000, transactions_per_sku=1000):
+    cwd = os.getcwd()
+    directory = make_brand_directory(sku_count, transactions_per_sku)
+    os.chdir(directory)
+    try:
+        formatter = StockXDataFormatter(BRAND)
+        formatter.create_shoe_info_csv()
+        formatter.create_shoe_transaction_csvs()
+        transactions_directory = "shoe_data/shoe_transactions/{}/".format(BRAND)
+        file_names = [transactions_directory + file_name for file_name in sorted(os.listdir(transactions_directory))]
+
+        sizes = {}
+        skus = formatter._get_sku_list()
+        data = {sku: formatter.shoe_transaction_store.get(sku) for sku in skus}
+        link_names = {sku: formatter._get_shoe_link_name(sku) for sku in skus}
+        _, sizes["row lists"] = measure(lambda: [legacy_rows(sku, link_names[sku], data[sku]) for sku in skus])
+        _, sizes["TransactionTables from the activity"] = measure(lambda: [TransactionTable.from_activity(sku, link_names[sku], data[sku]["ProductActivity"]) for sku in skus])
+        skus_by_file_name = {transactions_directory + link_names[sku] + ".csv": sku for sku in skus}
+        activity_rows = [tuple(str(value) for value in row) for file_name in file_names
+            for row in legacy_rows(skus_by_file_name[file_name], link_names[skus_by_file_name[file_name]], data[skus_by_file_name[file_name]])[1:]]
+        del data
+
+        start = time.perf_counter()
+        frame = pd.concat([pd.read_csv(file_name)[BASE_COLUMNS] for file_name in file_names], ignore_index=True)
+        frame_time = time.perf_counter() - start
+        sizes["pandas frame"] = frame.memory_usage(deep=True).sum()
+        sizes["pandas frame, object columns"] = frame.astype({column: object for column in ["sku", "link_name", "createdAt", "shoeSize", "localCurrency"]}).memory_usage(deep=True).sum()
+        start = time.perf_counter()
+        file_tables = [TransactionTable.read_file(file_name) for file_name in file_names]
+        table = TransactionTable.concat(file_tables)
+        table_time = time.perf_counter() - start
+        sizes["TransactionTable"] = table.get_memory_usage()
+
+        csv_rows = []
+        for file_name in file_names:
+            with open(file_name) as f:
+                csv_rows.extend(tuple(row) for row in list(csv.reader(f))[1:])
+        same_activity = csv_rows == activity_rows
+        del activity_rows
+        #file by file, as concat turns the integer amounts into floats when a file has prices with cents, and the
+        #table keeps createdAt as UTC seconds, so it's compared as a time
+        table_rows = [row for file_table in file_tables for row in file_table.to_rows()]
+        del file_tables
+        same_rows = [row[:3] + row[4:] for row in csv_rows] == [row[:3] + row[4:] for row in table_rows]
+        csv_times = pd.to_datetime(pd.Series([row[3] for row in csv_rows]), utc=True, format="ISO8601").dt.floor("s").dt.tz_localize(None)
+        same_rows = same_rows and bool((csv_times.to_numpy().astype("datetime64[s]") == table.get_created_at()).all())
+        del table_rows
+
+        sized_table = table.sort_by_size()
+        start = time.perf_counter()
+        slices = [sized_table.get_slice("BENCH-{}".format(i), "9.5") for i in range(sku_count)]
+        slice_time = time.perf_counter() - start
+        shares_memory = np.shares_memory(slices[0].amount, sized_table.amount)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+    print("{} SKUs, {} transactions".format(sku_count, len(table)))
+    print("  activity: row lists {:.1f} MB, TransactionTables {:.1f} MB ({:.1f}x less)".format(sizes["row lists"] / 1e6,
+        sizes["TransactionTables from the activity"] / 1e6, sizes["row lists"] / sizes["TransactionTables from the activity"]))
+    for name in ["pandas frame", "pandas frame, object columns"]:
+        print("  {}: {:.1f} MB, TransactionTable {:.1f} MB ({:.1f}x less)".format(name, sizes[name] / 1e6, sizes["TransactionTable"] / 1e6,
+            sizes[name] / sizes["TransactionTable"]))
+    print("  loading the brand: pandas {:.1f}s, TransactionTable {:.1f}s".format(frame_time, table_time))
+    print("  CSV files hold the activity values: {}".format(same_activity))
+    print("  same rows as the CSV files: {}, {} SKU + size slices in {:.1f} ms, views of the table: {}".format(same_rows, sku_count, slice_time * 1000, shares_memory))
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,79 @@
+"""
+Times the lookups model.py and shoe_trends.py do (one SKU/size series, a date range of a brand, weekly price bars)
+against StockXTransactionStore and against reading the per shoe CSV files with pandas and filtering them
+
+Run from the repository root with: python -m benchmarks.transaction_queries
+"""
+import csv
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from transaction_store import StockXTransactionStore
+
+BRAND = "adidas"
+
+def make_shoe_files(skus, transactions_per_sku, seed=0):
+    rng = np.random.default_rng(seed)
+    os.makedirs("shoe_data/shoe_transactions/{}".format(BRAND))
+    link_names = ["adidas-bench-{}".format(i) for i in range(skus)]
+    shoe_info_df = pd.DataFrame({"link_name": link_names, "sku": ["BENCH-{}".format(i) for i in range(skus)],
+        "model": ["Model {}".format(i % 20) for i in range(skus)], "releaseDate": "2018-01-01"})
+    shoe_info_df.to_csv("shoe_data/{}_shoe_info.csv".format(BRAND), index=False, quoting=csv.QUOTE_ALL)
+    for link_name, sku in zip(shoe_info_df["link_name"], shoe_info_df["sku"]):
+        seconds = np.sort(rng.integers(0, 730 * 24 * 3600, transactions_per_sku))
+        created_at = pd.Series(pd.to_datetime(np.datetime64("2018-01-01T00:00:00") + seconds.astype("timedelta64[s]")))
+        pd.DataFrame({
+            "sku": sku,
+            "link_name": link_name,
+            "amount": rng.integers(80, 600, transactions_per_sku).astype(float),
+            "createdAt": created_at.dt.strftime("%Y-%m-%dT%H:%M:%S+00:00"),
+            "shoeSize": rng.choice([7, 8, 8.5, 9, 9.5, 10, 10.5, 11, 12], transactions_per_sku),
+            "localCurrency": "USD",
+        }).to_csv("shoe_data/shoe_transactions/{}/{}.csv".format(BRAND, link_name), index=False)
+    return link_names
+
+def time_call(function, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+def run(skus=500, transactions_per_sku=2000):
+    cwd = os.getcwd()
+    directory = tempfile.mkdtemp(prefix="stockx-bench-")
+    os.chdir(directory)
+    try:
+        link_names = make_shoe_files(skus, transactions_per_sku)
+        store = StockXTransactionStore()
+        start = time.perf_counter()
+        store.load_brand(BRAND)
+        load_time = time.perf_counter() - start
+        link_name = link_names[skus // 2]
+
+        def read_series_csv():
+            df = pd.read_csv("shoe_data/shoe_transactions/{}/{}.csv".format(BRAND, link_name))
+            return df.loc[df["shoeSize"] == 10]
+        def read_range_csv():
+            df = pd.concat([pd.read_csv("shoe_data/shoe_transactions/{}/{}.csv".format(BRAND, name)) for name in link_names])
+            created_at = pd.to_datetime(df["createdAt"])
+            return df.loc[(created_at >= "2019-03-01T00:00:00+00:00") & (created_at < "2019-03-02T00:00:00+00:00")]
+
+        timings = [
+            ("one SKU/size series", time_call(read_series_csv), time_call(lambda: store.get_transactions(link_name=link_name, shoe_size=10))),
+            ("one day of the brand", time_call(read_range_csv, repeat=1), time_call(lambda: store.get_transactions(brand=BRAND, start="2019-03-01", end="2019-03-02"))),
+            ("weekly bars of a series", time_call(read_series_csv), time_call(lambda: store.get_price_bars("W", link_name=link_name, shoe_size=10))),
+            ("weekly bars of a model", time_call(read_range_csv, repeat=1), time_call(lambda: store.get_price_bars("W", brand=BRAND, model="Model 3"))),
+        ]
+        print("{} SKUs x {} transactions loaded in {:.1f}s".format(skus, transactions_per_sku, load_time))
+        for name, (csv_ms, csv_result), (store_ms, store_result) in timings:
+            print("{:<24} csv {:>9.1f} ms, store {:>7.1f} ms ({} rows)".format(name, csv_ms, store_ms, len(store_result)))
+        store.close()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,43 @@
+"""
+Runs TrendsFetcher against FakeTrendsBackend with a fixed latency per request: a cold run over a few keywords, the same
+range again and the range extended by one month (what a daily refresh does), compared with requesting every month one
+after the other like pytrends.dailydata.get_daily_data
+
+Run from the repository root with: python -m benchmarks.trends_fetcher
+"""
+import shutil
+import tempfile
+import time
+import pandas as pd
+from trends_fetcher import FakeTrendsBackend, TrendsFetcher
+
+KEYWORDS = ["adidas Yeezy Boost 350", "adidas Ultra Boost", "adidas NMD R1", "adidas ZX 500", "adidas Superstar"]
+
+def fetch_all(fetcher, stop_year, stop_mon):
+    start = time.perf_counter()
+    data = {keyword: fetcher.get_daily_data(keyword, 2018, 1, stop_year, stop_mon) for keyword in KEYWORDS}
+    return time.perf_counter() - start, data
+
+def run(latency=0.1, rate=20, max_workers=8):
+    cache_directory = tempfile.mkdtemp(prefix="stockx-trends-")
+    try:
+        backend = FakeTrendsBackend(latency=latency)
+        months = 24
+        sequential_time = len(KEYWORDS) * (months + 1) * latency
+        print("{} keywords x {} months, {:.0f} ms per request".format(len(KEYWORDS), months, latency * 1000))
+        print("  one request after the other (no cache): ~{:.1f}s".format(sequential_time))
+
+        for name, stop_year, stop_mon in [("cold cache", 2019, 12), ("same range again", 2019, 12), ("one more month", 2020, 1)]:
+            fetcher = TrendsFetcher(backend, cache_directory=cache_directory, rate=rate, burst=max_workers, max_workers=max_workers)
+            elapsed, data = fetch_all(fetcher, stop_year, stop_mon)
+            print("  {:<17} {:.2f}s, {} requests, {} cached months".format(name, elapsed, fetcher.request_count, fetcher.cache_hits))
+
+        uncached = TrendsFetcher(backend, cache_directory=tempfile.mkdtemp(prefix="stockx-trends-"), rate=rate, burst=max_workers, max_workers=max_workers)
+        _, expected = fetch_all(uncached, 2020, 1)
+        shutil.rmtree(uncached.cache_directory)
+        print("  cached data identical: {}".format(all(pd.DataFrame.equals(data[keyword], expected[keyword]) for keyword in KEYWORDS)))
+    finally:
+        shutil.rmtree(cache_directory)
+
+if __name__ == '__main__':
+    run()
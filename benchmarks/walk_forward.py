@@ -0,0 +1,72 @@
+"""
+Compares model.py's walk-forward loop (a new ARIMA fit on the whole history for every test observation) against
+WalkForwardForecaster with state updates only and with a refit every 25 steps, on a synthetic price series, then runs
+evaluate_shoes over a few synthetic shoe files
+
+Run from the repository root with: python -m benchmarks.walk_forward
+"""
+import os
+import shutil
+import tempfile
+import time
+import warnings
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.arima.model import ARIMA
+from forecasting import WalkForwardForecaster, evaluate_shoes
+
+def make_series(length, seed=0):
+    rng = np.random.default_rng(seed)
+    return 250 + np.cumsum(rng.normal(0, 5, length))
+
+def legacy_walk_forward(series, order=(3, 1, 0), train_fraction=0.8):
+    train_size = int(len(series) * train_fraction)
+    history = list(series[:train_size])
+    predictions = []
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for observation in series[train_size:]:
+            predictions.append(ARIMA(history, order=order).fit().forecast(1)[0])
+            history.append(observation)
+    return float(np.mean((series[train_size:] - np.array(predictions)) ** 2))
+
+def make_shoe_files(shoes, transactions_per_shoe, seed=0):
+    rng = np.random.default_rng(seed)
+    os.makedirs("shoe_data/shoe_transactions/adidas")
+    for i in range(shoes):
+        seconds = np.sort(rng.integers(0, 365 * 24 * 3600, transactions_per_shoe))
+        created_at = pd.Series(pd.to_datetime(np.datetime64("2019-01-01T00:00:00") + seconds.astype("timedelta64[s]")))
+        pd.DataFrame({
+            "sku": "BENCH-{}".format(i),
+            "link_name": "adidas-bench-{}".format(i),
+            "amount": 250 + np.cumsum(rng.normal(0, 5, transactions_per_shoe)).round(),
+            "createdAt": created_at.dt.strftime("%Y-%m-%dT%H:%M:%S+00:00"),
+            "shoeSize": rng.choice([9, 10, 11], transactions_per_shoe),
+            "localCurrency": "USD",
+        }).to_csv("shoe_data/shoe_transactions/adidas/adidas-bench-{}.csv".format(i), index=False)
+
+def run(length=400):
+    series = make_series(length)
+    start = time.perf_counter()
+    legacy_mse = legacy_walk_forward(series)
+    legacy_time = time.perf_counter() - start
+    print("{} observations, {} forecasts".format(length, length - int(length * 0.8)))
+    print("  refit from scratch every step: {:.2f}s, MSE {:.2f}".format(legacy_time, legacy_mse))
+    for refit_interval in [None, 25]:
+        evaluation = WalkForwardForecaster(refit_interval=refit_interval).evaluate(series)
+        print("  refit_interval={}: {:.2f}s ({} fits), MSE {:.2f}, {:.0f}x faster".format(
+            refit_interval, evaluation["fit_time"], evaluation["fits"], evaluation["mse"], legacy_time / evaluation["fit_time"]))
+
+    cwd = os.getcwd()
+    directory = tempfile.mkdtemp(prefix="stockx-bench-")
+    os.chdir(directory)
+    try:
+        make_shoe_files(shoes=20, transactions_per_shoe=600)
+        results = evaluate_shoes("adidas", refit_interval=25)
+        print(results.describe())
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    run()
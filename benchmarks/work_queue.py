@@ -0,0 +1,129 @@
+"""
+Runs the shoe info stage from a CrawlWorkQueue with several worker processes, one of which dies (os._exit, like a
+killed machine) in the middle of its lease. Checks the leases of the dead worker expire and are scraped by the others,
+so every shoe is scraped and every key ends up done. Runs it twice: with the workers sharing the database file on one
+machine, and with the work served by serve_crawl_work to workers that each run in their own empty directory like
+separate machines, checking everything they scraped was stored by the serving one
+
+Run from the repository root with: python -m benchmarks.work_queue
+"""
+import os
+import shutil
+import socket
+import tempfile
+import time
+from multiprocessing import Process
+import multiprocessing_scraper
+from multiprocessing_scraper import StockXScraper
+from work_queue import CrawlWorkQueue
+from benchmarks.crawl_throughput import make_crawl_directory
+from benchmarks.stub_server import StubStockXServer
+
+BRAND = "adidas"
+
+class CrashingStockXScraper(StockXScraper):
+    """
+    Dies without completing or failing anything when it's asked for its crash_after-th shoe, leaving its lease behind
+    """
+    def __init__(self, *args, crash_after=5, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.crash_after = crash_after
+        self.shoe_count = 0
+
+    def get_shoe_info(self, link):
+        self.shoe_count += 1
+        if self.shoe_count == self.crash_after:
+            print("Worker {} crashing while leasing {}".format(os.getpid(), link))
+            os._exit(1)
+        return super().get_shoe_info(link)
+
+def run(link_count=200, worker_count=4, lease_size=5, visibility_timeout=3):
+    links = ["/{}-bench-shoe-{}".format(BRAND, i) for i in range(link_count)]
+    cwd = os.getcwd()
+    directory = make_crawl_directory(links)
+    os.chdir(directory)
+    try:
+        with StubStockXServer(latency=0.02) as server:
+            scraper_arguments = dict(proxies=[server.url.replace("http://", "")], base_url="http://stockx.test")
+            work_queue = CrawlWorkQueue(BRAND, visibility_timeout=visibility_timeout)
+            multiprocessing_scraper.enqueue_crawl_work(StockXScraper(BRAND, **scraper_arguments), work_queue, "info")
+            #every worker is its own scraper, like the scrapers of separate machines
+            scrapers = [StockXScraper(BRAND, **scraper_arguments) for _ in range(worker_count - 1)]
+            scrapers.append(CrashingStockXScraper(BRAND, crash_after=lease_size + 2, **scraper_arguments))
+            start = time.perf_counter()
+            workers = [Process(target=multiprocessing_scraper.work_on_queue, args=(scraper, work_queue, "info", lease_size)) for scraper in scrapers]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+            scraped = len(StockXScraper(BRAND, **scraper_arguments).shoe_info_store.keys())
+        counts = work_queue.get_counts("info")
+        retried = work_queue._get_connection().execute("SELECT COUNT(*) FROM work_queue WHERE stage = 'info' AND attempts > 1").fetchone()[0]
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+    print("{} shoes, {} workers leasing {} at a time, one of them killed, {}s visibility timeout".format(link_count, worker_count, lease_size, visibility_timeout))
+    print("  worker exit codes: {}".format([worker.exitcode for worker in workers]))
+    print("  work queue: {}, {} keys leased again after their lease expired".format(counts, retried))
+    print("  {} of {} shoes scraped in {:.1f}s".format(scraped, link_count, elapsed))
+
+def work_on_served_queue(address, worker_directory, crash_after, scraper_arguments, lease_size):
+    #a separate machine: its own working directory, so nothing it stores locally can be seen by the serving machine
+    os.chdir(worker_directory)
+    if crash_after is None:
+        scraper = StockXScraper(BRAND, **scraper_arguments)
+    else:
+        scraper = CrashingStockXScraper(BRAND, crash_after=crash_after, **scraper_arguments)
+    work_queue = multiprocessing_scraper.connect_to_crawl_work(scraper, address)
+    multiprocessing_scraper.work_on_queue(scraper, work_queue, "info", lease_size)
+
+def get_free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def run_served(link_count=200, worker_count=4, lease_size=5, visibility_timeout=3):
+    links = ["/{}-bench-shoe-{}".format(BRAND, i) for i in range(link_count)]
+    cwd = os.getcwd()
+    directory = make_crawl_directory(links)
+    os.chdir(directory)
+    worker_directories = [tempfile.mkdtemp(prefix="stockx-bench-worker-") for _ in range(worker_count)]
+    try:
+        with StubStockXServer(latency=0.02) as server:
+            scraper_arguments = dict(proxies=[server.url.replace("http://", "")], base_url="http://stockx.test")
+            scraper = StockXScraper(BRAND, **scraper_arguments)
+            work_queue = CrawlWorkQueue(BRAND, visibility_timeout=visibility_timeout)
+            multiprocessing_scraper.enqueue_crawl_work(scraper, work_queue, "info")
+            address = ("127.0.0.1", get_free_port())
+            serving = Process(target=multiprocessing_scraper.serve_crawl_work, args=(scraper, work_queue, address))
+            serving.start()
+            time.sleep(1)
+            start = time.perf_counter()
+            crash_after = [None] * (worker_count - 1) + [lease_size + 2]
+            workers = [Process(target=work_on_served_queue, args=(address, worker_directory, crash, scraper_arguments, lease_size))
+                for worker_directory, crash in zip(worker_directories, crash_after)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+            serving.terminate()
+            serving.join()
+            scraped = len(StockXScraper(BRAND, **scraper_arguments).shoe_info_store.keys())
+        counts = work_queue.get_counts("info")
+        stored_by_workers = sum(len(os.listdir(os.path.join(worker_directory, "shoe_info", BRAND))) for worker_directory in worker_directories
+            if os.path.isdir(os.path.join(worker_directory, "shoe_info", BRAND)))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+        for worker_directory in worker_directories:
+            shutil.rmtree(worker_directory)
+    print("{} shoes, work served to {} workers in their own directories leasing {} at a time, one of them killed".format(link_count, worker_count, lease_size))
+    print("  worker exit codes: {}".format([worker.exitcode for worker in workers]))
+    print("  work queue: {}".format(counts))
+    print("  {} of {} shoes stored by the serving machine, {} stored by the workers themselves, in {:.1f}s".format(scraped, link_count, stored_by_workers, elapsed))
+
+if __name__ == '__main__':
+    run()
+    run_served()
@@ -0,0 +1,70 @@
+import csv
+import os
+import pickle
+
+class ShoeCatalogIndex:
+    """
+    In-memory SKU -> shoe info (link_name, releaseDate, model, color, name) index of shoe_data/<brand>_shoe_info.csv,
+    shared by the formatter and the feature extractor. A pickled copy is kept next to the CSV and both are rebuilt
+    whenever the CSV's mtime changes
+    """
+    def __init__(self, brand):
+        self.brand = brand
+        self.file_name = "shoe_data/{}_shoe_info.csv".format(brand.replace("-", "_"))
+        self.cache_file_name = "shoe_data/{}_shoe_info.index.pkl".format(brand.replace("-", "_"))
+        self.index = {}
+        self.mtime = None
+
+    def get(self, sku):
+        """
+        Returns the info dict of the SKU or None if it isn't in the catalog
+        """
+        self._load_if_changed()
+        return self.index.get(str(sku))
+
+    def get_value(self, sku, key):
+        info = self.get(sku)
+        if info is None:
+            return None
+        return info.get(key)
+
+    def get_skus(self):
+        self._load_if_changed()
+        return list(self.index.keys())
+
+    def _load_if_changed(self):
+        mtime = os.stat(self.file_name).st_mtime_ns
+        if mtime == self.mtime:
+            return
+        if not self._load_cache(mtime):
+            self.index = self._build_index()
+            self._save_cache(mtime)
+        self.mtime = mtime
+
+    def _build_index(self):
+        index = {}
+        with open(self.file_name, 'r') as f:
+            for row in csv.DictReader(f):
+                if row.get("sku"):
+                    index[row["sku"]] = row
+        return index
+
+    def _load_cache(self, mtime):
+        try:
+            with open(self.cache_file_name, 'rb') as f:
+                cache = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return False
+        if cache.get("mtime") != mtime:
+            return False
+        self.index = cache["index"]
+        return True
+
+    def _save_cache(self, mtime):
+        temp_file_name = "{}.{}.tmp".format(self.cache_file_name, os.getpid())
+        try:
+            with open(temp_file_name, 'wb') as f:
+                pickle.dump({"mtime": mtime, "index": self.index}, f)
+            os.replace(temp_file_name, self.cache_file_name)
+        except OSError: #the cache is only an optimization
+            pass
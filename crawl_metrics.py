@@ -0,0 +1,199 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing.managers import BaseManager
+
+class CrawlMetrics:
+    """
+    Latency histograms per stage (e.g. "info.request", "info.parse", "info.write") and counters per stage (requests by
+    status, retries by error type, bytes downloaded, rows written). Snapshots of the metrics of several workers can be
+    merged, and the totals exported as JSON or in the Prometheus text format
+    """
+    #upper bounds in seconds of the histogram buckets, the last bucket is +Inf
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    #name of the Prometheus label of the counters that have one
+    LABEL_NAMES = {"requests": "status", "retries": "error", "failures": "error", "refreshes": "result"}
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.histograms = {}
+        self.counters = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = self._new_histogram()
+            histogram["buckets"][self._get_bucket(seconds)] += 1
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+            histogram["max"] = max(histogram["max"], seconds)
+
+    def increment(self, name, stage, label="", value=1):
+        with self.lock:
+            labels = self.counters.setdefault(name, {}).setdefault(stage, {})
+            labels[label] = labels.get(label, 0) + value
+
+    def get_snapshot(self):
+        with self.lock:
+            return self._copy_snapshot()
+
+    def pop_snapshot(self):
+        """
+        Returns the snapshot and starts over, so a worker can hand its metrics over after every task
+        """
+        with self.lock:
+            snapshot = self._copy_snapshot()
+            self.histograms = {}
+            self.counters = {}
+            return snapshot
+
+    def merge(self, snapshot):
+        with self.lock:
+            self.started_at = min(self.started_at, snapshot["started_at"])
+            for stage, other in snapshot["histograms"].items():
+                histogram = self.histograms.get(stage)
+                if histogram is None:
+                    histogram = self.histograms[stage] = self._new_histogram()
+                histogram["buckets"] = [count + other_count for count, other_count in zip(histogram["buckets"], other["buckets"])]
+                histogram["count"] += other["count"]
+                histogram["sum"] += other["sum"]
+                histogram["max"] = max(histogram["max"], other["max"])
+            for name, stages in snapshot["counters"].items():
+                for stage, labels in stages.items():
+                    own_labels = self.counters.setdefault(name, {}).setdefault(stage, {})
+                    for label, value in labels.items():
+                        own_labels[label] = own_labels.get(label, 0) + value
+
+    def to_json(self):
+        snapshot = self.get_snapshot()
+        snapshot["bucket_bounds"] = list(self.BUCKETS)
+        snapshot["elapsed"] = time.time() - snapshot["started_at"]
+        return json.dumps(snapshot, indent=2, sort_keys=True)
+
+    def to_prometheus(self, prefix="stockx"):
+        snapshot = self.get_snapshot()
+        lines = ["# TYPE {}_stage_seconds histogram".format(prefix)]
+        for stage, histogram in sorted(snapshot["histograms"].items()):
+            cumulative = 0
+            for bound, count in zip(self.BUCKETS + ("+Inf",), histogram["buckets"]):
+                cumulative += count
+                lines.append('{}_stage_seconds_bucket{{stage="{}",le="{}"}} {}'.format(prefix, stage, bound, cumulative))
+            lines.append('{}_stage_seconds_sum{{stage="{}"}} {}'.format(prefix, stage, histogram["sum"]))
+            lines.append('{}_stage_seconds_count{{stage="{}"}} {}'.format(prefix, stage, histogram["count"]))
+        for name, stages in sorted(snapshot["counters"].items()):
+            lines.append("# TYPE {}_{}_total counter".format(prefix, name))
+            label_name = self.LABEL_NAMES.get(name)
+            for stage, labels in sorted(stages.items()):
+                for label, value in sorted(labels.items()):
+                    label_text = ',{}="{}"'.format(label_name, self._escape(label)) if label_name else ""
+                    lines.append('{}_{}_total{{stage="{}"{}}} {}'.format(prefix, name, stage, label_text, value))
+        return "\n".join(lines) + "\n"
+
+    def get_summary(self):
+        """
+        Returns a text table of the time spent in every stage followed by the counters
+        """
+        snapshot = self.get_snapshot()
+        lines = ["Run metrics after {:.1f}s:".format(time.time() - snapshot["started_at"]),
+            "  {:<28} {:>8} {:>10} {:>9} {:>9} {:>9} {:>9}".format("stage", "count", "total s", "mean ms", "p50 ms", "p95 ms", "max ms")]
+        for stage, histogram in sorted(snapshot["histograms"].items()):
+            lines.append("  {:<28} {:>8} {:>10.2f} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f}".format(stage, histogram["count"], histogram["sum"],
+                histogram["sum"] / histogram["count"] * 1000, self._get_quantile(histogram, 0.5) * 1000, self._get_quantile(histogram, 0.95) * 1000,
+                histogram["max"] * 1000))
+        for name, stages in sorted(snapshot["counters"].items()):
+            for stage, labels in sorted(stages.items()):
+                values = ", ".join("{} {}".format(label, value) if label else str(value) for label, value in sorted(labels.items(), key=lambda item: -item[1]))
+                lines.append("  {} {}: {}".format(stage, name, values))
+        return "\n".join(lines)
+
+    def report(self, name, directory="metrics"):
+        """
+        Prints the summary and writes metrics/<name>.json and metrics/<name>.prom (for the textfile collector of the
+        Prometheus node exporter)
+        """
+        print(self.get_summary())
+        os.makedirs(directory, exist_ok=True)
+        for extension, text in [("json", self.to_json()), ("prom", self.to_prometheus())]:
+            file_name = os.path.join(directory, "{}.{}".format(name, extension))
+            temp_file_name = "{}.{}.tmp".format(file_name, os.getpid())
+            with open(temp_file_name, 'w') as f:
+                f.write(text)
+            os.replace(temp_file_name, file_name)
+
+    def _copy_snapshot(self):
+        return {
+            "started_at": self.started_at,
+            "histograms": {stage: dict(histogram, buckets=list(histogram["buckets"])) for stage, histogram in self.histograms.items()},
+            "counters": {name: {stage: dict(labels) for stage, labels in stages.items()} for name, stages in self.counters.items()},
+        }
+
+    def _new_histogram(self):
+        return {"buckets": [0] * (len(self.BUCKETS) + 1), "count": 0, "sum": 0.0, "max": 0.0}
+
+    def _get_bucket(self, seconds):
+        for i, bound in enumerate(self.BUCKETS):
+            if seconds <= bound:
+                return i
+        return len(self.BUCKETS)
+
+    def _get_quantile(self, histogram, quantile):
+        #upper bound of the bucket the quantile falls in, capped by the slowest observation
+        target = quantile * histogram["count"]
+        cumulative = 0
+        for bound, count in zip(self.BUCKETS, histogram["buckets"]):
+            cumulative += count
+            if cumulative >= target:
+                return min(bound, histogram["max"])
+        return histogram["max"]
+
+    def _escape(self, label):
+        return str(label).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class CrawlMetricsManager(BaseManager):
+    """
+    Serves a single CrawlMetrics from a manager process so every worker in a multiprocessing Pool records to it
+    """
+    pass
+
+CrawlMetricsManager.register("CrawlMetrics", CrawlMetrics)
+
+@contextmanager
+def timed(metrics, stage):
+    """
+    Records how long the block took in the histogram of the stage. A function instead of a CrawlMetrics method so it
+    also works with the proxy of a shared CrawlMetrics
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe(stage, time.perf_counter() - start)
+
+@contextmanager
+def shared_metrics(owner):
+    """
+    Replaces owner.metrics with a CrawlMetrics served by a manager process for the duration of the block, so the
+    workers of a multiprocessing Pool that get a copy of the owner all record to it, then merges what they recorded
+    back into owner.metrics
+    """
+    local_metrics = owner.metrics
+    with CrawlMetricsManager() as manager:
+        owner.metrics = manager.CrawlMetrics()
+        try:
+            yield owner.metrics
+        finally:
+            local_metrics.merge(owner.metrics.pop_snapshot())
+            owner.metrics = local_metrics
@@ -0,0 +1,170 @@
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from raw_store import JsonFileStore
+
+class CrawlStateIndex:
+    """
+    SQLite index of everything that has been scraped for a brand, keyed by stage ("links" pages, "info" product urls
+    and "transactions" SKUs). Loading it replaces listing and parsing every file in the shoe_* directories on startup
+    """
+    def __init__(self, brand, db_file="crawl_state.db"):
+        self.brand = brand
+        self.db_file = db_file
+        self.connections = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["connections"] = {}
+        return state
+
+    def get_keys(self, stage, status="done"):
+        rows = self._get_connection().execute("SELECT key FROM crawl_state WHERE brand = ? AND stage = ? AND status = ?", (self.brand, stage, status))
+        return set(row[0] for row in rows)
+
+    def get_skus(self, stage, status="done"):
+        rows = self._get_connection().execute("SELECT sku FROM crawl_state WHERE brand = ? AND stage = ? AND status = ? AND sku IS NOT NULL", (self.brand, stage, status))
+        return set(row[0] for row in rows)
+
+    def get_entry(self, stage, key):
+        row = self._get_connection().execute("SELECT key, sku, status, updated_at, content_hash, cursor FROM crawl_state WHERE brand = ? AND stage = ? AND key = ?", (self.brand, stage, key)).fetchone()
+        if row is None:
+            return None
+        return {"key": row[0], "sku": row[1], "status": row[2], "updated_at": row[3], "content_hash": row[4], "cursor": row[5]}
+
+    def get_cursor(self, stage, key):
+        entry = self.get_entry(stage, key)
+        return entry["cursor"] if entry is not None else None
+
+    def mark(self, stage, key, sku=None, data=None, status="done", cursor=None):
+        """
+        Records that key was scraped for the stage, with a hash of the data that was written for it and optionally a
+        cursor to resume from (e.g. the newest transaction stored for a SKU)
+        """
+        content_hash = self.get_content_hash(data) if data is not None else None
+        self._mark_many(stage, [(key, sku, content_hash)], status, cursor)
+
+    def get_refresh_state(self, stage, key):
+        """
+        Returns what the last refresh of key learned (validators of the response, hash of what was extracted, how
+        often it was checked and changed and when it's next due) or None if it was never fetched with validators
+        """
+        row = self._get_connection().execute("""SELECT etag, last_modified, content_hash, checked_at, check_count, change_count, next_check_at
+            FROM refresh_state WHERE brand = ? AND stage = ? AND key = ?""", (self.brand, stage, key)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(["etag", "last_modified", "content_hash", "checked_at", "check_count", "change_count", "next_check_at"], row))
+
+    def record_refresh(self, stage, key, etag=None, last_modified=None, content_hash=None, changed=None, schedule=None):
+        """
+        Records a fetch of key: changed is None for the first fetch and True or False for a refresh. The validators
+        and hash are only replaced when given (a 304 has none of its own) and the next refresh is scheduled by how
+        often key changed so far
+        """
+        schedule = schedule if schedule is not None else RefreshSchedule()
+        state = self.get_refresh_state(stage, key) or {"etag": None, "last_modified": None, "content_hash": None, "check_count": 0, "change_count": 0}
+        check_count = state["check_count"] + (changed is not None)
+        change_count = state["change_count"] + bool(changed)
+        now = time.time()
+        connection = self._get_connection()
+        with connection:
+            connection.execute("""INSERT OR REPLACE INTO refresh_state (brand, stage, key, etag, last_modified, content_hash, checked_at, check_count,
+                change_count, next_check_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", (self.brand, stage, key, etag or state["etag"],
+                last_modified or state["last_modified"], content_hash or state["content_hash"], now, check_count, change_count,
+                now + schedule.get_interval(check_count, change_count)))
+
+    def get_keys_due_for_refresh(self, stage, keys):
+        """
+        Returns the keys that are due for a refresh, keys that were never fetched with validators included
+        """
+        rows = self._get_connection().execute("SELECT key, next_check_at FROM refresh_state WHERE brand = ? AND stage = ?", (self.brand, stage))
+        next_check_at = dict(rows.fetchall())
+        now = time.time()
+        return [key for key in keys if next_check_at.get(key, 0) <= now]
+
+    def is_empty(self):
+        row = self._get_connection().execute("SELECT 1 FROM crawl_state WHERE brand = ? LIMIT 1", (self.brand,)).fetchone()
+        return row is None
+
+    def rebuild(self, info_store=None, transaction_store=None):
+        """
+        One time import of what is already in the shoe_links directory and the shoe info and transaction stores
+        (defaults to the shoe_info and shoe_transactions directories)
+        """
+        info_store = info_store if info_store is not None else JsonFileStore("shoe_info/{}/".format(self.brand))
+        transaction_store = transaction_store if transaction_store is not None else JsonFileStore("shoe_transactions/{}/".format(self.brand))
+        self._get_connection().execute("DELETE FROM crawl_state WHERE brand = ?", (self.brand,))
+        self._get_connection().commit()
+
+        pages_directory = "shoe_links/{}/".format(self.brand)
+        pages = []
+        for file_name in self._list_directory(pages_directory):
+            with open(pages_directory + file_name, 'r') as f:
+                links = [link for row in csv.reader(f) for link in row]
+            pages.append((file_name.replace(".csv", ""), None, self.get_content_hash(links)))
+        self._mark_many("links", pages)
+
+        links = []
+        for sku in info_store.keys():
+            data = info_store.get(sku)
+            #keyed by SKU when there is no url, like _save_shoe_info does, so the SKU still gets its transactions scraped
+            links.append((data.get("offers", {}).get("url", sku), sku, self.get_content_hash(data)))
+        self._mark_many("info", links)
+
+        skus = [(sku, sku, transaction_store.get_hash(sku)) for sku in transaction_store.keys()]
+        self._mark_many("transactions", skus)
+        print("Crawl state for {} rebuilt: {} pages, {} shoe info links, {} transaction SKUs".format(self.brand, len(pages), len(links), len(skus)))
+
+    def get_content_hash(self, data):
+        return hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+    def _mark_many(self, stage, entries, status="done", cursor=None):
+        now = time.time()
+        connection = self._get_connection()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO crawl_state (brand, stage, key, sku, status, updated_at, content_hash, cursor) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(self.brand, stage, key, sku, status, now, content_hash, cursor) for key, sku, content_hash in entries])
+
+    def _list_directory(self, directory_name):
+        if not os.path.isdir(directory_name):
+            return []
+        return os.listdir(directory_name)
+
+    def _get_connection(self):
+        #sqlite connections can't be shared with forked worker processes or other threads (a served index is called from
+        #one thread per client) so each opens its own
+        owner = (os.getpid(), threading.get_ident())
+        if owner not in self.connections:
+            connection = sqlite3.connect(self.db_file, timeout=60)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""CREATE TABLE IF NOT EXISTS crawl_state (
+                brand TEXT NOT NULL, stage TEXT NOT NULL, key TEXT NOT NULL, sku TEXT, status TEXT NOT NULL,
+                updated_at REAL NOT NULL, content_hash TEXT, cursor TEXT, PRIMARY KEY (brand, stage, key))""")
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(crawl_state)")]
+            if "cursor" not in columns: #index created before cursors were tracked
+                connection.execute("ALTER TABLE crawl_state ADD COLUMN cursor TEXT")
+            connection.execute("""CREATE TABLE IF NOT EXISTS refresh_state (
+                brand TEXT NOT NULL, stage TEXT NOT NULL, key TEXT NOT NULL, etag TEXT, last_modified TEXT, content_hash TEXT, checked_at REAL NOT NULL,
+                check_count INTEGER NOT NULL, change_count INTEGER NOT NULL, next_check_at REAL NOT NULL, PRIMARY KEY (brand, stage, key))""")
+            connection.commit()
+            self.connections[owner] = connection
+        return self.connections[owner]
+
+class RefreshSchedule:
+    """
+    How long to wait before refreshing a page again, from how often it changed when it was refreshed before: a page
+    that changed on every refresh is refreshed every min_interval seconds and one that never changes backs off towards
+    max_interval. The change rate starts at 1/2 and moves towards what is observed as refreshes come in
+    """
+    def __init__(self, min_interval=24 * 3600, max_interval=30 * 24 * 3600):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+
+    def get_interval(self, check_count, change_count):
+        change_rate = (change_count + 1) / (check_count + 2)
+        return min(self.max_interval, max(self.min_interval, self.min_interval / change_rate))
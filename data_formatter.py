@@ -1,52 +1,182 @@
-import json
 import csv
+import itertools
 import os
+import time
+import traceback
+from multiprocessing import Pool, cpu_count
+import ijson
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from datetime import datetime
+from catalog_index import ShoeCatalogIndex
+from crawl_metrics import CrawlMetrics, timed
+from raw_store import get_raw_store
 
 class StockXDataFormatter:
-    def __init__(self, brand):
+    def __init__(self, brand, raw_storage="files"):
         self.brand = brand
+        #where the scraper stored the raw JSON, see raw_store.py
+        self.raw_storage = raw_storage
+        self.shoe_info_store = get_raw_store(brand, "shoe_info", raw_storage)
+        self.shoe_transaction_store = get_raw_store(brand, "shoe_transactions", raw_storage)
         self.shoe_info_keys = ["link_name", "sku", "name", "brand", "model", "color", "releaseDate"]
         self.shoe_transaction_keys = ["sku", "link_name", "amount", "createdAt", "shoeSize", "localCurrency"]
+        self.shoe_transaction_schema = pa.schema([
+            ("sku", pa.dictionary(pa.int32(), pa.string())),
+            ("link_name", pa.dictionary(pa.int32(), pa.string())),
+            ("amount", pa.float64()),
+            ("createdAt", pa.timestamp("s", tz="UTC")),
+            #sizes like "5.5W", "4Y" or "10.5K" aren't numeric so they are kept as text, like in the CSVs
+            ("shoeSize", pa.dictionary(pa.int32(), pa.string())),
+            ("localCurrency", pa.dictionary(pa.int32(), pa.string())),
+        ])
+        self.parquet_chunk_size = 50000
+        self.catalog = ShoeCatalogIndex(brand)
+        self.metrics = CrawlMetrics()
 
     def create_shoe_info_csv(self):
         sku_list = self._get_sku_list()
 
         rows = [self.shoe_info_keys] #starts with self.shoe_info_keys as header
-        for sku in sku_list:
-            file_name = "shoe_info/" + self.brand + "/" + sku + ".json"
-            values = self._filter_shoe_info_keys(file_name, self.shoe_info_keys)
-            rows.append(values)
+        with timed(self.metrics, "format.info.read"):
+            for sku in sku_list:
+                values = self._filter_shoe_info_keys(self.shoe_info_store.get(sku), self.shoe_info_keys)
+                rows.append(values)
         rows = [row for row in rows if row != []] #remove empty rows 
         file_name = "shoe_data/{}_shoe_info.csv".format(self.brand.replace("-", "_"))
-        self._write_to_csv(file_name, rows)
+        with timed(self.metrics, "format.info.write"):
+            self._write_to_csv(file_name, rows)
         print("CSV file {} created".format(file_name))
         
     def create_shoe_transaction_csvs(self):
         sku_list = self._get_sku_list()
 
-        header = self.shoe_transaction_keys #starts with filter_list as header
         for sku in sku_list:
             try:
-                link_name = self._get_shoe_link_name(sku)
-                file_name = "shoe_transactions/" + self.brand + "/" + sku + ".json"
-                rows = self._filter_shoe_transactions_keys(header, file_name, sku, link_name, self.shoe_transaction_keys)
-                rows = [row for row in rows if row != []] #remove empty rows 
-                output_file_name = "shoe_data/shoe_transactions/{}/{}.csv".format(self.brand, link_name)
-                self._write_to_csv(output_file_name, rows)
-            except FileNotFoundError:
-                print("{} does not exist".format(file_name))
+                self.create_shoe_transaction_csv(sku)
+            except (FileNotFoundError, KeyError):
+                print("Transactions of {} do not exist".format(sku))
                 continue
         print("CSV files created in shoe_data/shoe_transactions/{}/ directory".format(self.brand))
 
-    def _get_shoe_link_name(self, sku):
-        file_name = "shoe_data/{}_shoe_info.csv".format(self.brand.replace("-", "_"))
-        with open(file_name, 'r') as f:
-            reader = csv.reader(f)
-            file_content = list(reader)
+    def create_shoe_transaction_csv(self, sku):
+        """
+        Writes the transactions of one SKU to shoe_data/shoe_transactions/<brand>/<link_name>.csv and returns the amount
+        of transactions written
+        """
+        link_name = self._get_shoe_link_name(sku)
+        with timed(self.metrics, "format.csv.read"):
+            data = self.shoe_transaction_store.get(sku)
+        output_file_name = "shoe_data/shoe_transactions/{}/{}.csv".format(self.brand, link_name)
+        with timed(self.metrics, "format.csv.write"):
+            if "ProductActivity" not in data: #some shoes don't have any transaction data
+                self._write_to_csv(output_file_name, [])
+                row_count = 0
+            else:
+                rows = self._iterate_shoe_transaction_rows(data["ProductActivity"], sku, link_name, self.shoe_transaction_keys)
+                self._write_to_csv(output_file_name, itertools.chain([self.shoe_transaction_keys], rows))
+                row_count = len(data["ProductActivity"])
+        self.metrics.increment("rows", "format.csv", value=row_count)
+        return row_count
+
+    def create_shoe_transaction_parquet_files(self):
+        """
+        Columnar version of create_shoe_transaction_csvs: streams the ProductActivity records of every transaction JSON
+        file and writes them in chunks to shoe_data/shoe_transactions_parquet/<brand>/<link_name>.parquet with typed
+        columns, so memory stays flat no matter how big a shoe's transaction file is
+        """
+        sku_list = self._get_sku_list()
+        for sku in sku_list:
+            try:
+                self.create_shoe_transaction_parquet_file(sku)
+            except (FileNotFoundError, KeyError):
+                print("Transactions of {} do not exist".format(sku))
+                continue
+        print("Parquet files created in shoe_data/shoe_transactions_parquet/{}/ directory".format(self.brand))
+
+    def create_shoe_transaction_parquet_file(self, sku):
+        output_directory = "shoe_data/shoe_transactions_parquet/{}/".format(self.brand)
+        os.makedirs(output_directory, exist_ok=True)
+        link_name = self._get_shoe_link_name(sku)
+        #reading, converting and writing are interleaved chunk by chunk so they are timed together
+        with timed(self.metrics, "format.parquet"):
+            row_count = self._write_shoe_transactions_parquet(output_directory + "{}.parquet".format(link_name), sku, link_name)
+        self.metrics.increment("rows", "format.parquet", value=row_count)
+        return row_count
+
+    def _write_shoe_transactions_parquet(self, output_file_name, sku, link_name):
+        """
+        Returns the amount of rows written. Shoes without transactions get no file, like the empty CSVs
+        """
+        temp_file_name = output_file_name + ".tmp"
+        writer = None
+        row_count = 0
+        try:
+            with self.shoe_transaction_store.open(sku) as f:
+                for chunk in self._iterate_transaction_chunks(f, sku, link_name):
+                    if writer is None:
+                        writer = pq.ParquetWriter(temp_file_name, self.shoe_transaction_schema)
+                    writer.write_table(chunk)
+                    row_count += chunk.num_rows
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is not None:
+            os.replace(temp_file_name, output_file_name)
+        return row_count
+
+    def _iterate_transaction_chunks(self, json_file, sku, link_name):
+        columns = self._new_transaction_columns()
+        for transaction in ijson.items(json_file, "ProductActivity.item"):
+            columns["amount"].append(self._to_float(transaction.get("amount")))
+            columns["createdAt"].append(transaction.get("createdAt"))
+            columns["shoeSize"].append(self._to_string(transaction.get("shoeSize")))
+            columns["localCurrency"].append(transaction.get("localCurrency"))
+            if len(columns["amount"]) >= self.parquet_chunk_size:
+                yield self._transaction_columns_to_table(columns, sku, link_name)
+                columns = self._new_transaction_columns()
+        if columns["amount"]:
+            yield self._transaction_columns_to_table(columns, sku, link_name)
+
+    def _new_transaction_columns(self):
+        return {"amount": [], "createdAt": [], "shoeSize": [], "localCurrency": []}
+
+    def _transaction_columns_to_table(self, columns, sku, link_name):
+        row_count = len(columns["amount"])
+        arrays = [
+            pa.array([sku] * row_count).dictionary_encode(),
+            pa.array([link_name] * row_count).dictionary_encode(),
+            pa.array(columns["amount"], type=pa.float64()),
+            self._created_at_to_array(columns["createdAt"]),
+            pa.array(columns["shoeSize"], type=pa.string()).dictionary_encode(),
+            pa.array(columns["localCurrency"], type=pa.string()).dictionary_encode(),
+        ]
+        return pa.Table.from_arrays(arrays, schema=self.shoe_transaction_schema)
+
+    def _to_float(self, value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
 
-        for row in file_content:
-            if row[1] == sku:
-                return row[0]
+    def _to_string(self, value):
+        return str(value) if value is not None else None
+
+    def _created_at_to_array(self, created_at_values):
+        try:
+            return pc.cast(pa.array(created_at_values, type=pa.string()), pa.timestamp("s", tz="UTC"))
+        except pa.ArrowInvalid: #some timestamps aren't ISO 8601, parse them one by one
+            return pa.array([self._parse_created_at(created_at) for created_at in created_at_values], type=pa.timestamp("s", tz="UTC"))
+
+    def _parse_created_at(self, created_at):
+        try:
+            return datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+        except (AttributeError, ValueError):
+            return None
+
+    def _get_shoe_link_name(self, sku):
+        return self.catalog.get_value(sku, "link_name")
 
     def _get_list_from_csv(self, file_name):
         with open(file_name, 'r') as f:
@@ -60,21 +190,14 @@ class StockXDataFormatter:
         return flattened_list
 
     def _get_sku_list(self):
-        directory_name = "shoe_info/{}/".format(self.brand)
-        files = os.listdir(directory_name)
-        sku_list = []
-        for file in files:
-            sku_list.append(file.replace(".json", ""))
-        return sku_list
+        return self.shoe_info_store.keys()
 
     def _write_to_csv(self, file_name, data):
         with open(file_name, "w", newline="") as f:
             writer = csv.writer(f)
             writer.writerows(data)
 
-    def _filter_shoe_info_keys(self, json_file, filter_list):
-        with open(json_file) as f:
-            data = json.load(f)
+    def _filter_shoe_info_keys(self, data, filter_list):
         try:
             shoe_link = data["offers"]["url"].replace("https://stockx.com/", "")
             values = [shoe_link]
@@ -86,22 +209,73 @@ class StockXDataFormatter:
         except:
             return []
 
-    def _filter_shoe_transactions_keys(self, header, json_file, sku, link_name, filter_list):
-        with open(json_file) as f:
-            data = json.load(f)
+    def _iterate_shoe_transaction_rows(self, transactions, sku, link_name, filter_list):
+        #the values as the activity API sent them, so every price and timestamp is written exactly
+        for transaction in transactions:
+            yield [sku, link_name] + [transaction[filter_key] for filter_key in filter_list if filter_key in transaction]
 
-        values = [header]
-        try:
-            for transaction in data["ProductActivity"]:
-                transaction_values = [sku, link_name]
-                for filter_key in filter_list:
-                    if filter_key in transaction.keys():
-                        transaction_values.append(transaction[filter_key])
-                values.append(transaction_values)
-            return values
-        except KeyError: #some shoes don't have any transaction data
-            return []
-    
+_formatters = {} #one formatter (and catalog index) per brand in each worker process
+
+def _format_shoe_transactions(task):
+    """
+    Pool task: formats the transactions of one SKU and reports the amount of rows or the error instead of raising,
+    along with the metrics recorded while doing it
+    """
+    brand, sku, output_format, raw_storage = task
+    metrics = CrawlMetrics()
+    try:
+        if (brand, raw_storage) not in _formatters:
+            _formatters[(brand, raw_storage)] = StockXDataFormatter(brand, raw_storage)
+        formatter = _formatters[(brand, raw_storage)]
+        metrics = formatter.metrics
+        if output_format == "parquet":
+            rows = formatter.create_shoe_transaction_parquet_file(sku)
+        else:
+            rows = formatter.create_shoe_transaction_csv(sku)
+        return brand, sku, rows, None, metrics.pop_snapshot()
+    except Exception as e:
+        metrics.increment("failures", "format", type(e).__name__)
+        return brand, sku, 0, traceback.format_exc(limit=2), metrics.pop_snapshot()
+
+def format_brands(brands=("adidas", "nike", "retro-jordans", "other-sneakers"), output_format="csv", processes=None, chunksize=16, maxtasksperchild=100,
+        raw_storage="files"):
+    """
+    Does create_shoe_info_csv + create_shoe_transaction_csvs (or create_shoe_transaction_parquet_files) for every brand,
+    spreading the SKUs of all the brands over a process pool. Workers are replaced after maxtasksperchild chunks so
+    their memory stays bounded. Prints every failed SKU, the throughput and the metrics of all the workers (also written
+    to metrics/format.json and metrics/format.prom), and returns the list of failures
+    """
+    start = time.perf_counter()
+    metrics = CrawlMetrics()
+    tasks = []
+    for brand in brands:
+        formatter = StockXDataFormatter(brand, raw_storage)
+        formatter.create_shoe_info_csv()
+        metrics.merge(formatter.metrics.pop_snapshot())
+        if output_format == "csv":
+            os.makedirs("shoe_data/shoe_transactions/{}/".format(brand), exist_ok=True)
+        tasks.extend((brand, sku, output_format, raw_storage) for sku in formatter._get_sku_list())
+    print("Amount of SKUs to format: {}".format(len(tasks)))
+
+    files, rows, errors = 0, 0, []
+    pool = Pool(processes=processes or cpu_count(), maxtasksperchild=maxtasksperchild)
+    try:
+        for brand, sku, row_count, error, snapshot in pool.imap_unordered(_format_shoe_transactions, tasks, chunksize=chunksize):
+            metrics.merge(snapshot)
+            if error is not None:
+                errors.append((brand, sku, error))
+                print("Unable to format {} {}: {}".format(brand, sku, error.strip().splitlines()[-1]))
+                continue
+            files += 1
+            rows += row_count
+    finally:
+        pool.close()
+        pool.join()
+
+    elapsed = time.perf_counter() - start
+    print("Formatted {} files ({} rows) in {:.1f}s: {:.1f} files/sec, {:.0f} rows/sec, {} errors".format(files, rows, elapsed, files / elapsed, rows / elapsed, len(errors)))
+    metrics.report("format")
+    return errors
 
 if __name__ == '__main__':
     #adidas, nike, retro-jordans, other-sneakers
@@ -109,4 +283,10 @@ if __name__ == '__main__':
 
     print("Formatting scraped data:")
     formatter.create_shoe_info_csv()
-    formatter.create_shoe_transaction_csvs()
\ No newline at end of file
+    formatter.create_shoe_transaction_csvs()
+
+    #print("Formatting scraped data for every brand:")
+    #format_brands()
+
+    #print("Creating columnar transaction files:")
+    #formatter.create_shoe_transaction_parquet_files()
\ No newline at end of file
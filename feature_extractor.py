@@ -1,16 +1,38 @@
 import os
 import json
+import shutil
 import urllib.request
 from urllib.request import urlopen
 from datetime import datetime
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from catalog_index import ShoeCatalogIndex
+from crawl_metrics import CrawlMetrics, shared_metrics, timed
+from feature_store import FeatureStore
+from transaction_features import TransactionFeatureBuilder
+from transaction_table import TransactionTable
 from multiprocessing import Pool, Process, cpu_count, current_process
 
 class StockXFeatureExtractor:
-    def __init__(self, brand):
+    def __init__(self, brand, transactions_format="csv"):
         self.brand = brand
+        #"csv" for the files from create_shoe_transaction_csvs, "parquet" for create_shoe_transaction_parquet_files
+        self.transactions_format = transactions_format
+        self.catalog = ShoeCatalogIndex(brand)
         self.subreddits = ["r/Sneakers", "r/sneakermarket", "r/sneakerhead"]
         self.url = ""
+        self.price_day_offsets = [5, 15, 30]
+        self.transaction_features = TransactionFeatureBuilder()
+        self.base_columns = ["sku", "link_name", "amount", "createdAt", "shoeSize", "localCurrency"]
+        self.shoe_info_feature_columns = ["month_and_year_with_most_transactions", "min_price", "min_price_date", "min_price_days_since_release",
+            "max_price", "max_price_date", "max_price_days_since_release", "most_popular_size"]
+        #bump when the features change so every shoe gets recomputed
+        self.feature_version = "2-{}-{}".format("-".join(str(offset) for offset in self.price_day_offsets), self.transaction_features.get_version())
+        self.feature_store = FeatureStore(brand)
+        self.feature_records = {}
+        self.metrics = CrawlMetrics()
 
     def _read_json(self, file_name):
         with open(file_name) as json_file:
@@ -55,44 +77,46 @@ class StockXFeatureExtractor:
         return max(lens)
 
     def _get_release_date_from_sku(self, sku):
-        file_name = "shoe_data/{}_shoe_info.csv".format(self.brand.replace("-", "_"))
-        shoe_info_df = pd.read_csv(file_name)
-        info = shoe_info_df.loc[shoe_info_df["sku"] == sku, ["releaseDate"]]
-        return info["releaseDate"].values[0]
+        return self.catalog.get_value(sku, "releaseDate")
 
     def _get_shoe_name_list(self):
-        directory_name = "shoe_data/shoe_transactions/{}/".format(self.brand)
+        directory_name = self._get_transactions_directory()
         files = os.listdir(directory_name)
         shoe_names = []
         for file_name in files:
-            shoe_names.append(file_name.replace(".csv", ""))
+            if file_name.endswith("." + self.transactions_format):
+                shoe_names.append(file_name.replace("." + self.transactions_format, ""))
         return shoe_names
 
+    def _get_transactions_directory(self):
+        if self.transactions_format == "parquet":
+            return "shoe_data/shoe_transactions_parquet/{}/".format(self.brand)
+        return "shoe_data/shoe_transactions/{}/".format(self.brand)
+
+    def _get_transactions_file_name(self, shoe):
+        return self._get_transactions_directory() + "{}.{}".format(shoe, self.transactions_format)
+
+    def _read_shoe_transactions(self, file_name, dtype=None):
+        #dtype only applies to CSVs, the Parquet columns are typed
+        if self.transactions_format == "parquet":
+            return pd.read_parquet(file_name)
+        return pd.read_csv(file_name, dtype=dtype)
+
+    def _write_shoe_transactions(self, shoe_transaction_df, file_name):
+        if self.transactions_format == "parquet":
+            shoe_transaction_df.to_parquet(file_name, index=False)
+        else:
+            shoe_transaction_df.to_csv(file_name, index=False)
+
     def _add_blank_columns_to_info_df(self, shoe_info_df):
-        shoe_info_df["month_and_year_with_most_transactions"] = "N/A"
-        shoe_info_df["min_price"] = "N/A"
-        shoe_info_df["min_price_date"] = "N/A"
-        shoe_info_df["min_price_days_since_release"] = "N/A"
-        shoe_info_df["max_price"] = "N/A"
-        shoe_info_df["max_price_date"] = "N/A"
-        shoe_info_df["max_price_days_since_release"] = "N/A"
-        shoe_info_df["most_popular_size"] = "N/A"
-
-    def _add_rolling_mean(self, shoe_transaction_df):
-        shoe_transaction_df["rolling_average_price"] = shoe_transaction_df.sort_values(by=['createdAt'])["amount"].rolling(10).mean()
+        #object columns so the numbers, dates and periods of each shoe can be put in place of the N/A strings
+        for column in self.shoe_info_feature_columns:
+            shoe_info_df[column] = pd.Series("N/A", index=shoe_info_df.index, dtype=object)
 
     def _add_release_date_delta(self, shoe_transaction_df, shoe_release_date):
-        try:
-            date_format = "%Y-%m-%d"
-            shoe_release_date_formatted = datetime.strptime(shoe_release_date, date_format)
-            shoe_transactions_dates = list(pd.to_datetime(shoe_transaction_df["createdAt"]))
-            deltas = [transaction_date - shoe_release_date_formatted for transaction_date in shoe_transactions_dates]
-            days = [d.days for d in deltas]
-            shoe_transaction_df["days_since_release"] = days
-            shoe_transaction_df["release_date"] = shoe_release_date_formatted
-        except ValueError: #date is either -- or in different format
-            shoe_transaction_df["days_since_release"] = "N/A"
-            shoe_transaction_df["release_date"] = "N/A"
+        shoe_release_date_formatted = self.transaction_features.add_days_since_release(shoe_transaction_df, shoe_release_date)
+        #date is either -- or in different format
+        shoe_transaction_df["release_date"] = shoe_release_date_formatted if shoe_release_date_formatted is not None else "N/A"
 
     def _add_colorway_and_model(self, sku, shoe_transaction_df, shoe_info_df):
         colorway = shoe_info_df.loc[shoe_info_df["sku"] == sku, "color"]
@@ -129,122 +153,215 @@ class StockXFeatureExtractor:
         most_popular_size = shoe_transaction_df['shoeSize'].value_counts().idxmax()
         shoe_info_df.loc[shoe_info_df["sku"] == sku, "most_popular_size"] = most_popular_size
     
-    def _get_average_price_per_day(self, shoe_transaction_df):
-        shoe_transaction_df["average_price_per_day"] = shoe_transaction_df['amount'].groupby(pd.to_datetime(shoe_transaction_df['createdAt']).dt.to_period("D")).transform('mean')
-
-    def _nearest_date(self, dates, date):
-        return min(dates, key=lambda x: abs(x - date))
-
-    def _get_past_and_future_prices(self, shoe_transaction_df):
+    def _build_daily_price_index(self, day_numbers, amounts):
+        """
+        Builds a per-day index of the transactions as sorted arrays: the unique days (as day numbers), the mean price
+        on each day and the position of the first transaction on each day (used to break ties the same way a linear
+        scan over the transactions would)
+        """
+        days, first_positions = np.unique(day_numbers, return_index=True)
+        daily_means = pd.Series(amounts).groupby(day_numbers).mean().values
+        return days, daily_means, first_positions
+
+    def _nearest_day_prices(self, price_index, target_days):
+        """
+        For every target day finds the nearest day with transactions using a binary search over the sorted day index
+        and returns the mean price of that day
+        """
+        days, daily_means, first_positions = price_index
+        positions = np.searchsorted(days, target_days)
+        left = np.clip(positions - 1, 0, len(days) - 1)
+        right = np.clip(positions, 0, len(days) - 1)
+        left_distance = np.abs(target_days - days[left])
+        right_distance = np.abs(days[right] - target_days)
+        use_right = (right_distance < left_distance) | ((right_distance == left_distance) & (first_positions[right] < first_positions[left]))
+        nearest = np.where(use_right, right, left)
+        return daily_means[nearest]
+
+    def _get_past_and_future_prices(self, shoe_transaction_df, day_offsets=None, transaction_dates=None):
+        """
+        Adds the average price of the nearest day with transactions N days before and after each transaction for every
+        N in day_offsets (defaults to self.price_day_offsets). transaction_dates can be passed if createdAt was already
+        parsed
+        """
+        if day_offsets is None:
+            day_offsets = self.price_day_offsets
         df = shoe_transaction_df
-        df["transaction_date"] = pd.to_datetime(df["createdAt"]).dt.date
-
-        df["date_5_days_ago"] = pd.to_datetime(df["transaction_date"] - pd.DateOffset(days=5)).dt.date
-        df["date_15_days_ago"] = pd.to_datetime(df["transaction_date"] - pd.DateOffset(days=15)).dt.date
-        df["date_30_days_ago"] = pd.to_datetime(df["transaction_date"] - pd.DateOffset(days=30)).dt.date
-
-        df["date_5_days_future"] = pd.to_datetime(df["transaction_date"] + pd.DateOffset(days=5)).dt.date
-        df["date_15_days_future"] = pd.to_datetime(df["transaction_date"] + pd.DateOffset(days=15)).dt.date
-        df["date_30_days_future"] = pd.to_datetime(df["transaction_date"] + pd.DateOffset(days=30)).dt.date
-
-        p5 = df["date_5_days_ago"].tolist()
-        p15 = df["date_15_days_ago"].tolist()
-        p30 = df["date_30_days_ago"].tolist()
-
-        f5 = df["date_5_days_future"].tolist()
-        f15 = df["date_15_days_future"].tolist()
-        f30 = df["date_30_days_future"].tolist()
-
-        p5_amount_list = []
-        p15_amount_list = []
-        p30_amount_list = []
-
-        f5_amount_list = []
-        f15_amount_list = []
-        f30_amount_list = []
-
-        transaction_list = df["transaction_date"].tolist()
-        for index in range(len(p5)):
-            nearest_past_date_5 = self._nearest_date(transaction_list, p5[index])
-            nearest_past_date_15 = self._nearest_date(transaction_list, p15[index])
-            nearest_past_date_30 = self._nearest_date(transaction_list, p30[index])
-
-            nearest_future_date_5 = self._nearest_date(transaction_list, f5[index])
-            nearest_future_date_15 = self._nearest_date(transaction_list, f15[index])
-            nearest_future_date_30 = self._nearest_date(transaction_list, f30[index])
-
-            p5_amount = df.loc[df["transaction_date"] == nearest_past_date_5, "amount"].mean()
-            p15_amount = df.loc[df["transaction_date"] == nearest_past_date_15, "amount"].mean()
-            p30_amount = df.loc[df["transaction_date"] == nearest_past_date_30, "amount"].mean()
-
-            f5_amount = df.loc[df["transaction_date"] == nearest_future_date_5, "amount"].mean()
-            f15_amount = df.loc[df["transaction_date"] == nearest_future_date_15, "amount"].mean()
-            f30_amount = df.loc[df["transaction_date"] == nearest_future_date_30, "amount"].mean()
-
-            p5_amount_list.append(p5_amount)
-            p15_amount_list.append(p15_amount)
-            p30_amount_list.append(p30_amount)
-
-            f5_amount_list.append(f5_amount)
-            f15_amount_list.append(f15_amount)
-            f30_amount_list.append(f30_amount)
-
-        shoe_transaction_df["price_5_days_ago"] = p5_amount_list
-        shoe_transaction_df["price_15_days_ago"] = p15_amount_list
-        shoe_transaction_df["price_30_days_ago"] = p30_amount_list
-
-        shoe_transaction_df["price_5_days_future"] = f5_amount_list
-        shoe_transaction_df["price_15_days_future"] = f15_amount_list
-        shoe_transaction_df["price_30_days_future"] = f30_amount_list
-
-    def _add_shoe_info_features(self, shoe_info_df, shoe_names):
-        for shoe in shoe_names:
+        if transaction_dates is None:
+            transaction_dates = self.transaction_features.parse_created_at(df["createdAt"])
+        transaction_days = transaction_dates.dt.normalize()
+        df["transaction_date"] = transaction_days.dt.date
+
+        for offset in day_offsets:
+            df["date_{}_days_ago".format(offset)] = (transaction_days - pd.Timedelta(days=offset)).dt.date
+        for offset in day_offsets:
+            df["date_{}_days_future".format(offset)] = (transaction_days + pd.Timedelta(days=offset)).dt.date
+
+        day_numbers = transaction_days.values.astype("datetime64[D]").astype(np.int64)
+        price_index = self._build_daily_price_index(day_numbers, df["amount"].values.astype(float))
+
+        for offset in day_offsets:
+            shoe_transaction_df["price_{}_days_ago".format(offset)] = self._nearest_day_prices(price_index, day_numbers - offset)
+        for offset in day_offsets:
+            shoe_transaction_df["price_{}_days_future".format(offset)] = self._nearest_day_prices(price_index, day_numbers + offset)
+
+    def _get_shoe_info_features(self, sku, shoe_transaction_df):
+        """
+        Computes the shoe info summary features of one shoe on a single row info frame and returns them as a dict, or
+        None if they can't be computed (the columns are then left as N/A)
+        """
+        shoe_info_df = pd.DataFrame({"sku": [sku]})
+        self._add_blank_columns_to_info_df(shoe_info_df)
+        try:
+            shoe_release_date = self._get_release_date_from_sku(sku)
+
+            self._add_release_date_delta(shoe_transaction_df, shoe_release_date)
+            self._get_max_price_and_date_and_days_since_release(sku, shoe_transaction_df, shoe_info_df)
+            self._get_min_price_and_date_and_days_since_release(sku, shoe_transaction_df, shoe_info_df)
+            self._get_month_and_year_with_most_transactions(sku, shoe_transaction_df, shoe_info_df)
+            self._get_most_popular_shoe_size(sku, shoe_transaction_df, shoe_info_df)
+        except Exception:
+            return None
+        return {column: shoe_info_df[column].values[0] for column in self.shoe_info_feature_columns}
+
+    def _get_shoe_info_features_grouped(self, transactions):
+        """
+        Computes the same features as _get_shoe_info_features for every SKU of a TransactionTable holding the
+        transactions of all the shoes, one zero-copy SKU slice at a time. Returns a dict of SKU -> features dict, with
+        None for SKUs without a known release date
+        """
+        features = {}
+        for sku, shoe_transactions in transactions.iterate_slices():
+            release_date = self._get_release_date_from_sku(sku)
+            if release_date is None:
+                features[sku] = None
+                continue
             try:
-                file_name = "shoe_data/shoe_transactions/{}/{}.csv".format(self.brand, shoe)
-                shoe_transaction_df = pd.read_csv(file_name)
-                sku = shoe_transaction_df["sku"].values[0]
-                shoe_release_date = self._get_release_date_from_sku(sku)
-
-                self._add_release_date_delta(shoe_transaction_df, shoe_release_date)
-                self._get_max_price_and_date_and_days_since_release(sku, shoe_transaction_df, shoe_info_df)
-                self._get_min_price_and_date_and_days_since_release(sku, shoe_transaction_df, shoe_info_df)
-                self._get_month_and_year_with_most_transactions(sku, shoe_transaction_df, shoe_info_df)
-                self._get_most_popular_shoe_size(sku, shoe_transaction_df, shoe_info_df)
-                self._add_colorway_and_model(sku, shoe_transaction_df, shoe_info_df)
-            except:
+                features[sku] = self._get_shoe_info_features_from_table(shoe_transactions, release_date)
+            except ValueError: #no prices
                 continue
-        
-    def _drop_util_columns_from_df(self, shoe):
+        return features
+
+    def _get_shoe_info_features_from_table(self, shoe_transactions, release_date):
+        amounts = shoe_transactions.amount
+        max_row = int(np.nanargmax(amounts))
+        min_row = int(np.nanargmin(amounts))
+        created_at = shoe_transactions.get_created_at()
+        min_date, max_date = shoe_transactions.get_created_at_values([min_row, max_row])
+
+        #np.unique sorts the months, so ties go to the earliest month like groupby().size().idxmax()
+        months, month_counts = np.unique(created_at[~np.isnat(created_at)].astype("datetime64[M]"), return_counts=True)
+        #the size that appears first among the most common ones, like value_counts().idxmax() (which skips missing sizes)
+        size_codes = shoe_transactions.codes["shoeSize"]
+        codes, first_rows, size_counts = np.unique(size_codes, return_index=True, return_counts=True)
+        codes, first_rows, size_counts = codes[codes >= 0], first_rows[codes >= 0], size_counts[codes >= 0]
+        most_popular_code = codes[np.lexsort((first_rows, -size_counts))[0]] if len(codes) else -1
+        #pandas reads the sizes of a CSV as numbers only when every size of the file is one
+        numeric_sizes = not shoe_transactions.text_shoe_sizes and all(self._is_number(size) for size in shoe_transactions.dictionaries["shoeSize"][codes])
+
         try:
-            file_name = "shoe_data/shoe_transactions/{}/{}.csv".format(self.brand, shoe)
-            shoe_transaction_df = pd.read_csv(file_name)
-            shoe_transaction_df = shoe_transaction_df.drop(columns=["date_5_days_future", "date_15_days_future", "date_30_days_future", "date_5_days_ago", "date_15_days_ago", "date_30_days_ago"])
-            shoe_transaction_df.to_csv(file_name, index=False)
-        except:
-            pass
+            parsed_release_date = np.datetime64(datetime.strptime(release_date, "%Y-%m-%d"), "s")
+        except ValueError:
+            parsed_release_date = None
+        def days_since_release(row):
+            if parsed_release_date is None:
+                return "N/A"
+            return int((created_at[row] - parsed_release_date) // np.timedelta64(1, "D"))
+        return {
+            "month_and_year_with_most_transactions": pd.Period(months[np.argmax(month_counts)], "M"),
+            "min_price": amounts[min_row].item(),
+            "min_price_date": min_date,
+            "min_price_days_since_release": days_since_release(min_row),
+            "max_price": amounts[max_row].item(),
+            "max_price_date": max_date,
+            "max_price_days_since_release": days_since_release(max_row),
+            "most_popular_size": self._get_shoe_size_value(shoe_transactions.dictionaries["shoeSize"][most_popular_code], numeric_sizes) if most_popular_code >= 0 else None,
+        }
+
+    def _get_shoe_size_value(self, shoe_size, numeric_sizes):
+        return float(shoe_size) if numeric_sizes else shoe_size
+
+    def _is_number(self, value):
+        try:
+            float(value)
+            return True
+        except ValueError:
+            return False
 
-    def _add_additional_features_transaction_data(self, shoe):
-        expected_columns = ['sku', 'link_name', 'amount', 'createdAt', 'shoeSize', 'localCurrency', 'average_price_per_day',
-            'days_since_release', 'release_date', 'rolling_average_price', 'color', 'model', 'transaction_date',
-            'price_5_days_ago', 'price_15_days_ago', 'price_30_days_ago', 'price_5_days_future',
-            'price_15_days_future', 'price_30_days_future']
+    def _add_shoe_info_features(self, shoe_info_df, feature_records):
+        features_by_sku = {record["sku"]: record["info_features"] for record in feature_records.values() if record["info_features"]}
+        skus = [str(sku) for sku in shoe_info_df["sku"]]
+        for column in self.shoe_info_feature_columns:
+            shoe_info_df[column] = [features_by_sku[sku][column] if sku in features_by_sku else "N/A" for sku in skus]
+
+    def _get_util_columns(self):
+        return ["date_{}_days_{}".format(offset, direction) for direction in ["future", "ago"] for offset in self.price_day_offsets]
 
+    def _add_additional_features_transaction_data(self, shoe):
+        """
+        Computes the transaction features and the shoe info features of one shoe from its base columns and writes the
+        file once. Returns the feature store record of the shoe, or None if it couldn't be processed
+        """
         try:
-            file_name = "shoe_data/shoe_transactions/{}/{}.csv".format(self.brand, shoe)
-            shoe_transaction_df = pd.read_csv(file_name)
-            #if data already has features
-            if len(list(shoe_transaction_df.columns)) == len(expected_columns):
-                pass
+            file_name = self._get_transactions_file_name(shoe)
+            with timed(self.metrics, "features.read"):
+                shoe_transaction_df = self._read_shoe_transactions(file_name)
+            has_features = "price_5_days_ago" in shoe_transaction_df.columns
+            shoe_transaction_df = shoe_transaction_df[self.base_columns]
+            sku = shoe_transaction_df["sku"].values[0]
+            source_hash = self.feature_store.get_source_hash(shoe_transaction_df)
+
+            previous_record = self.feature_records.get(shoe)
+            if has_features and previous_record is not None and previous_record["source_hash"] == source_hash and previous_record["feature_version"] == self.feature_version:
+                #file was touched but its transactions are the same
+                info_features = previous_record["info_features"]
             else:
                 print("Creating columns for: {}".format(file_name))
-                self._get_average_price_per_day(shoe_transaction_df)
-                self._add_rolling_mean(shoe_transaction_df)
-                self._get_past_and_future_prices(shoe_transaction_df)
-                shoe_transaction_df.to_csv(file_name, index=False)
-        except:
-            pass
-
-    def add_additional_features(self):
+                with timed(self.metrics, "features.compute"):
+                    info_features = self._get_shoe_info_features(sku, shoe_transaction_df.copy())
+                    transaction_dates = self.transaction_features.parse_created_at(shoe_transaction_df["createdAt"])
+                    self.transaction_features.add_features(shoe_transaction_df, self._get_release_date_from_sku(sku), transaction_dates)
+                    self._get_past_and_future_prices(shoe_transaction_df, transaction_dates=transaction_dates)
+                    shoe_transaction_df = shoe_transaction_df.drop(columns=self._get_util_columns())
+                with timed(self.metrics, "features.write"):
+                    self._write_shoe_transactions(shoe_transaction_df, file_name)
+                self.metrics.increment("rows", "features", value=len(shoe_transaction_df))
+
+            stat = os.stat(file_name)
+            return {"shoe": shoe, "sku": str(sku), "feature_version": self.feature_version, "source_hash": source_hash, "row_count": len(shoe_transaction_df),
+                "file_mtime": stat.st_mtime_ns, "file_size": stat.st_size, "info_features": info_features}
+        except Exception as e:
+            self.metrics.increment("failures", "features", type(e).__name__)
+            print("Unable to create columns for {}: {!r}".format(shoe, e))
+            return None
+
+    def add_additional_features(self, force=False, grouped_info_features=False):
+        """
+        Adds the transaction features to every shoe whose transactions changed since the last run (or every shoe with
+        force=True) and the shoe info features of all the shoes to the shoe info CSV. With grouped_info_features=True
+        the shoe info features of every shoe are recomputed in one grouped pass over all the transactions
+        """
+        shoe_names = self._get_shoe_name_list()
+        self.feature_records = self.feature_store.get_records()
+        changed_shoes = [shoe for shoe in shoe_names if force or not self.feature_store.is_up_to_date(self.feature_records.get(shoe), self._get_transactions_file_name(shoe), self.feature_version)]
+        print("Amount of shoes to process: {} of {}".format(len(changed_shoes), len(shoe_names)))
+
+        with shared_metrics(self):
+            pool = Pool(processes=30)
+            records = pool.map(self._add_additional_features_transaction_data, changed_shoes)
+            pool.close()
+            pool.join()
+        records = [record for record in records if record is not None]
+        self.feature_store.save_records(records)
+        self.feature_records.update((record["shoe"], record) for record in records)
+        self.update_shoe_info_features(shoe_names, grouped_info_features)
+        self.metrics.report("features_{}".format(self.brand))
+
+    def update_shoe_info_features(self, shoe_names=None, grouped_info_features=False):
+        """
+        Writes the shoe info features of the feature records of the shoes (every shoe with a transactions file by
+        default) to the shoe info CSV
+        """
         shoe_info_file_name = "shoe_data/{}_shoe_info.csv".format(self.brand.replace("-", "_"))
         shoe_info_df = pd.read_csv(shoe_info_file_name)
         
@@ -253,37 +370,142 @@ class StockXFeatureExtractor:
             self._format_name_col(shoe_info_df)
         self._add_color_info(shoe_info_df)
         self._add_date_info(shoe_info_df)
-        self._add_blank_columns_to_info_df(shoe_info_df)
 
-        shoe_names = self._get_shoe_name_list()
-        self._add_shoe_info_features(shoe_info_df, shoe_names)
+        if shoe_names is None:
+            shoe_names = self._get_shoe_name_list()
+        if not self.feature_records:
+            self.feature_records = self.feature_store.get_records()
+        current_records = {shoe: self.feature_records[shoe] for shoe in shoe_names if shoe in self.feature_records}
+        if grouped_info_features:
+            info_features = {}
+            #one file at a time, so the amounts, createdAt text and sizes of every shoe come out like pandas reads its
+            #file, and only the createdAt text of one file is held at a time
+            for shoe in current_records:
+                transactions = TransactionTable.read_file(self._get_transactions_file_name(shoe), keep_created_at_text=True)
+                info_features.update(self._get_shoe_info_features_grouped(transactions))
+            for record in current_records.values():
+                record["info_features"] = info_features.get(record["sku"])
+            self.feature_store.save_records(current_records.values())
+        self._add_shoe_info_features(shoe_info_df, current_records)
         shoe_info_df.to_csv(shoe_info_file_name, index=False)
         print("CSV file {} created".format(shoe_info_file_name))
 
-        pool = Pool(processes=30)
-        pool.map(self._add_additional_features_transaction_data, shoe_names)
-        pool.close()
-        pool.join()
-
-        for shoe in shoe_names:
-            self._drop_util_columns_from_df(shoe)
-
     def concatenate_transactions_data(self):
-        path = "shoe_data/shoe_transactions/{}/".format(self.brand)
+        path = self._get_transactions_directory()
         all_filenames = [i for i in os.listdir(path)]
 
         for i, f in enumerate(all_filenames):
             try:
                 if i == 0:
-                    combined_csv = pd.read_csv(path + f)
+                    combined_csv = self._read_shoe_transactions(path + f)
                 else:
-                    combined_csv = pd.concat([combined_csv, pd.read_csv(path + f)], sort=True)
+                    combined_csv = pd.concat([combined_csv, self._read_shoe_transactions(path + f)], sort=True)
             except:
                 continue
         output_filename = "shoe_data/{}_transactions.csv".format(self.brand.replace("-", "_"))
         combined_csv.to_csv(output_filename, index=False)
         print("CSV file {} created".format(output_filename))
 
+    def concatenate_transactions_dataset(self, output_directory="shoe_data/shoe_transactions_dataset", row_group_size=100000, max_buffered_rows=1000000):
+        """
+        Streaming version of concatenate_transactions_data: reads one shoe at a time and appends its rows to a Parquet
+        dataset partitioned by brand and month (<output_directory>/brand=<brand>/month=<YYYY-MM>/), holding at most
+        max_buffered_rows rows in memory. Shoes with different columns are written with the union of all the columns
+        """
+        shoe_names = self._get_shoe_name_list()
+        schema = self._get_transactions_dataset_schema(shoe_names)
+        brand_directory = os.path.join(output_directory, "brand={}".format(self.brand))
+        temp_directory = brand_directory + ".tmp"
+        shutil.rmtree(temp_directory, ignore_errors=True)
+
+        writers = {}
+        buffers = {}
+        buffered_rows = 0
+        row_count = 0
+        try:
+            for shoe in shoe_names:
+                try:
+                    #sizes are read as text, pandas would turn "10" into 10.0 in files without sizes like "5.5W"
+                    shoe_transaction_df = self._read_shoe_transactions(self._get_transactions_file_name(shoe), dtype={"shoeSize": str})
+                    table = self._to_transactions_dataset_table(shoe_transaction_df, schema)
+                except Exception as e:
+                    print("Unable to add {} to the dataset: {!r}".format(shoe, e))
+                    continue
+                months = pd.to_datetime(shoe_transaction_df["createdAt"], utc=True).dt.strftime("%Y-%m").fillna("unknown")
+                for month, positions in months.groupby(months).indices.items():
+                    buffers.setdefault(month, []).append(table.take(positions))
+                    buffered_rows += len(positions)
+                    if sum(chunk.num_rows for chunk in buffers[month]) >= row_group_size:
+                        buffered_rows -= self._flush_dataset_partition(writers, buffers, month, temp_directory, schema)
+                row_count += len(shoe_transaction_df)
+                if buffered_rows >= max_buffered_rows:
+                    for month in list(buffers):
+                        buffered_rows -= self._flush_dataset_partition(writers, buffers, month, temp_directory, schema)
+            for month in list(buffers):
+                self._flush_dataset_partition(writers, buffers, month, temp_directory, schema)
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+        shutil.rmtree(brand_directory, ignore_errors=True)
+        if os.path.exists(temp_directory):
+            os.replace(temp_directory, brand_directory)
+        print("Dataset {} created: {} rows in {} month partitions".format(brand_directory, row_count, len(writers)))
+
+    def _get_transactions_dataset_schema(self, shoe_names):
+        """
+        Union of the columns of every shoe file (only the headers/footers are read). Known numeric and date columns get
+        their type, everything else is stored as strings
+        """
+        columns = []
+        for shoe in shoe_names:
+            file_name = self._get_transactions_file_name(shoe)
+            try:
+                if self.transactions_format == "parquet":
+                    shoe_columns = pq.read_schema(file_name).names
+                else:
+                    shoe_columns = list(pd.read_csv(file_name, nrows=0).columns)
+            except Exception:
+                continue
+            columns.extend(column for column in shoe_columns if column not in columns)
+        return pa.schema([(column, self._get_dataset_column_type(column)) for column in columns])
+
+    def _get_dataset_column_type(self, column):
+        if column == "createdAt":
+            return pa.timestamp("s", tz="UTC")
+        if column == "shoeSize":
+            #sizes like "5.5W", "4Y" or "10.5K" aren't numeric, stored like in the formatter's Parquet files
+            return pa.dictionary(pa.int32(), pa.string())
+        if column == "amount" or column.startswith(("price_",) + TransactionFeatureBuilder.NUMERIC_COLUMN_PREFIXES):
+            return pa.float64()
+        return pa.string()
+
+    def _to_transactions_dataset_table(self, shoe_transaction_df, schema):
+        arrays = []
+        for field in schema:
+            if field.name not in shoe_transaction_df.columns:
+                arrays.append(pa.nulls(len(shoe_transaction_df), type=field.type))
+            elif field.type == pa.float64():
+                arrays.append(pa.array(pd.to_numeric(shoe_transaction_df[field.name], errors="coerce"), type=field.type, from_pandas=True))
+            elif pa.types.is_timestamp(field.type):
+                arrays.append(pa.array(pd.to_datetime(shoe_transaction_df[field.name], utc=True), type=field.type, from_pandas=True))
+            else:
+                values = shoe_transaction_df[field.name]
+                arrays.append(pa.array(values.astype(str).where(values.notna(), None), type=field.type, from_pandas=True))
+        return pa.Table.from_arrays(arrays, schema=schema)
+
+    def _flush_dataset_partition(self, writers, buffers, month, directory, schema):
+        chunks = buffers.pop(month, [])
+        if not chunks:
+            return 0
+        if month not in writers:
+            partition_directory = os.path.join(directory, "month={}".format(month))
+            os.makedirs(partition_directory, exist_ok=True)
+            writers[month] = pq.ParquetWriter(os.path.join(partition_directory, "part-0.parquet"), schema)
+        table = pa.concat_tables(chunks)
+        writers[month].write_table(table)
+        return table.num_rows
+
 if __name__ == '__main__':
     #adidas, nike, retro-jordans, other-sneakers
     extractor = StockXFeatureExtractor("adidas")
@@ -292,4 +514,7 @@ if __name__ == '__main__':
     #extractor.add_additional_features()
 
     #print("Creating a consolidated transactions file:")
-    #extractor.concatenate_transactions_data()
\ No newline at end of file
+    #extractor.concatenate_transactions_data()
+
+    #print("Creating a partitioned transactions dataset:")
+    #extractor.concatenate_transactions_dataset()
\ No newline at end of file
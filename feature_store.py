@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import numpy as np
+import pandas as pd
+
+class FeatureStore:
+    """
+    SQLite record of the features computed for every shoe of a brand: the feature version, a hash and row count of
+    the source transactions, the stat of the file that was written and the shoe info features of the shoe. Used to
+    only recompute the shoes whose transactions changed since the last run
+    """
+    def __init__(self, brand, db_file="feature_store.db"):
+        self.brand = brand
+        self.db_file = db_file
+        self.connection = None
+        self.pid = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["connection"] = None
+        state["pid"] = None
+        return state
+
+    def get_records(self):
+        rows = self._get_connection().execute(
+            "SELECT shoe, sku, feature_version, source_hash, row_count, file_mtime, file_size, info_features FROM feature_store WHERE brand = ?", (self.brand,))
+        records = {}
+        for shoe, sku, feature_version, source_hash, row_count, file_mtime, file_size, info_features in rows:
+            records[shoe] = {"shoe": shoe, "sku": sku, "feature_version": feature_version, "source_hash": source_hash, "row_count": row_count,
+                "file_mtime": file_mtime, "file_size": file_size, "info_features": json.loads(info_features) if info_features else None}
+        return records
+
+    def save_records(self, records):
+        now = time.time()
+        connection = self._get_connection()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO feature_store (brand, shoe, sku, feature_version, source_hash, row_count, file_mtime, file_size, info_features, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(self.brand, record["shoe"], record["sku"], record["feature_version"], record["source_hash"], record["row_count"], record["file_mtime"],
+                    record["file_size"], json.dumps(record["info_features"], default=self._to_json_value), now) for record in records])
+
+    def is_up_to_date(self, record, file_name, feature_version):
+        """
+        True if the file is exactly the one written when the record was saved, for the same feature version
+        """
+        if record is None or record["feature_version"] != feature_version:
+            return False
+        try:
+            stat = os.stat(file_name)
+        except OSError:
+            return False
+        return stat.st_mtime_ns == record["file_mtime"] and stat.st_size == record["file_size"]
+
+    def get_source_hash(self, shoe_transaction_df):
+        row_hashes = pd.util.hash_pandas_object(shoe_transaction_df.astype(str), index=False).values
+        return hashlib.sha1(row_hashes.tobytes()).hexdigest()
+
+    def _to_json_value(self, value):
+        if isinstance(value, np.generic):
+            return value.item()
+        return str(value)
+
+    def _get_connection(self):
+        #sqlite connections can't be shared with forked worker processes so each process opens its own
+        if self.connection is None or self.pid != os.getpid():
+            self.connection = sqlite3.connect(self.db_file, timeout=60)
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS feature_store (
+                brand TEXT NOT NULL, shoe TEXT NOT NULL, sku TEXT, feature_version TEXT NOT NULL, source_hash TEXT NOT NULL,
+                row_count INTEGER, file_mtime INTEGER, file_size INTEGER, info_features TEXT, updated_at REAL NOT NULL,
+                PRIMARY KEY (brand, shoe))""")
+            self.connection.commit()
+            self.pid = os.getpid()
+        return self.connection
@@ -0,0 +1,178 @@
+import json
+import os
+import resource
+import time
+import traceback
+import warnings
+from multiprocessing import Pool, cpu_count
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.arima.model import ARIMA
+from feature_extractor import StockXFeatureExtractor
+
+class WalkForwardForecaster:
+    """
+    One step ahead walk-forward evaluation of an ARIMA model on a price series. The model is fit once on the first
+    train_fraction of the series and after every forecast the observed price is filtered into the fitted state
+    (results.extend) instead of refitting on the whole history. With refit_interval set the parameters are re-estimated
+    every refit_interval steps, warm started from the previous parameters
+    """
+    def __init__(self, order=(3, 1, 0), refit_interval=None, train_fraction=0.8, min_train_size=30):
+        self.order = order
+        self.refit_interval = refit_interval
+        self.train_fraction = train_fraction
+        self.min_train_size = min_train_size
+
+    def evaluate(self, series):
+        """
+        Returns a dict with the predictions and actual values of the test part of the series, the MSE, the amount of
+        fits and the time spent. Raises a ValueError if the series is too short
+        """
+        series = np.asarray(series, dtype=float)
+        train_size = max(self.min_train_size, int(len(series) * self.train_fraction))
+        if train_size >= len(series):
+            raise ValueError("Series of {} observations is too short, needs more than {}".format(len(series), train_size))
+
+        start = time.perf_counter()
+        results = self._fit(series[:train_size])
+        fits = 1
+        predictions = np.empty(len(series) - train_size)
+        for i, t in enumerate(range(train_size, len(series))):
+            predictions[i] = results.forecast(1)[0]
+            if self.refit_interval and (i + 1) % self.refit_interval == 0:
+                results = self._fit(series[:t + 1], start_params=results.params)
+                fits += 1
+            else:
+                results = results.extend(series[t:t + 1])
+        actuals = series[train_size:]
+        return {"predictions": predictions, "actuals": actuals, "mse": float(np.mean((actuals - predictions) ** 2)),
+            "n": len(series), "train_size": train_size, "fits": fits, "fit_time": time.perf_counter() - start,
+            "params": dict(zip(results.param_names, results.params.tolist()))}
+
+    def _fit(self, history, start_params=None):
+        with warnings.catch_warnings():
+            #short and flat price series trigger a lot of convergence and frequency warnings
+            warnings.simplefilter("ignore")
+            return ARIMA(history, order=self.order).fit(start_params=start_params)
+
+def get_shoe_size_series(shoe_transaction_df, min_length=None, frequency=None):
+    """
+    Returns {shoeSize: amounts ordered by createdAt} for a per shoe transaction DataFrame, leaving out the sizes with
+    less than min_length values. With a frequency (e.g. "D") every size is resampled to a regular grid of mean prices,
+    carrying the last price over the periods without transactions
+    """
+    shoe_transaction_df = shoe_transaction_df.assign(createdAt=pd.to_datetime(shoe_transaction_df["createdAt"], utc=True, format="ISO8601"))
+    shoe_transaction_df = shoe_transaction_df.sort_values("createdAt", kind="stable")
+    series = {}
+    for shoe_size, size_df in shoe_transaction_df.groupby("shoeSize"):
+        amounts = size_df["amount"].astype(float)
+        if frequency is not None:
+            amounts = amounts.set_axis(size_df["createdAt"]).resample(frequency).mean().ffill()
+        if min_length is None or len(amounts) >= min_length:
+            series[shoe_size] = amounts.to_numpy()
+    return series
+
+def _iterate_series_tasks(brand, settings, shoes=None, shoe_sizes=None, transactions_format="csv", min_length=None, frequency=None):
+    extractor = StockXFeatureExtractor(brand, transactions_format=transactions_format)
+    for shoe in shoes or extractor._get_shoe_name_list():
+        try:
+            shoe_transaction_df = extractor._read_shoe_transactions(extractor._get_transactions_file_name(shoe))
+        except Exception as e:
+            print("Unable to read {}: {!r}".format(shoe, e))
+            continue
+        if shoe_transaction_df.empty:
+            continue
+        sku = str(shoe_transaction_df["sku"].values[0])
+        for shoe_size, series in get_shoe_size_series(shoe_transaction_df, min_length=min_length, frequency=frequency).items():
+            if shoe_sizes is None or shoe_size in shoe_sizes:
+                yield brand, shoe, sku, shoe_size, series, settings
+
+def _get_settings(order, refit_interval, train_fraction, min_train_size):
+    #hashable so each worker can keep one forecaster per settings
+    return tuple(sorted({"order": tuple(order), "refit_interval": refit_interval, "train_fraction": train_fraction, "min_train_size": min_train_size}.items()))
+
+_forecasters = {} #one forecaster per settings in each worker process
+
+def _evaluate_series(task):
+    """
+    Pool task: walk-forward evaluation of one shoe size series, reports the error instead of raising
+    """
+    brand, shoe, sku, shoe_size, series, settings = task
+    result = {"brand": brand, "shoe": shoe, "sku": sku, "shoeSize": shoe_size, "n": len(series), "mse": None, "fits": 0, "fit_time": 0.0, "params": None, "error": None}
+    try:
+        if settings not in _forecasters:
+            _forecasters[settings] = WalkForwardForecaster(**dict(settings))
+        evaluation = _forecasters[settings].evaluate(series)
+        result.update({"mse": evaluation["mse"], "fits": evaluation["fits"], "fit_time": evaluation["fit_time"], "params": json.dumps(evaluation["params"])})
+    except Exception:
+        result["error"] = traceback.format_exc(limit=2)
+    return result
+
+def _run_series_tasks(tasks, processes, chunksize, maxtasksperchild=None):
+    results = []
+    pool = Pool(processes=processes or cpu_count(), maxtasksperchild=maxtasksperchild)
+    try:
+        for result in pool.imap_unordered(_evaluate_series, tasks, chunksize=chunksize):
+            if result["error"] is not None:
+                print("Unable to evaluate {} size {}: {}".format(result["shoe"], result["shoeSize"], result["error"].strip().splitlines()[-1]))
+            results.append(result)
+    finally:
+        pool.close()
+        pool.join()
+    return pd.DataFrame(results, columns=["brand", "shoe", "sku", "shoeSize", "n", "mse", "fits", "fit_time", "params", "error"])
+
+def evaluate_shoes(brand, shoes=None, shoe_sizes=None, transactions_format="csv", order=(3, 1, 0), refit_interval=None, train_fraction=0.8,
+        min_train_size=30, processes=None, chunksize=4):
+    """
+    Walk-forward evaluates every (shoe, shoeSize) series of the per shoe transaction files written by feature_extractor.py
+    on a process pool. shoes and shoe_sizes restrict the series that are evaluated. Returns a DataFrame with the MSE of
+    every series
+    """
+    start = time.perf_counter()
+    settings = _get_settings(order, refit_interval, train_fraction, min_train_size)
+    tasks = list(_iterate_series_tasks(brand, settings, shoes, shoe_sizes, transactions_format, min_length=min_train_size + 1))
+    #longest series first so a popular shoe doesn't end up alone at the end of the run
+    tasks.sort(key=lambda task: len(task[4]), reverse=True)
+    print("Amount of series to evaluate: {}".format(len(tasks)))
+
+    results_df = _run_series_tasks(tasks, processes, chunksize)
+    elapsed = time.perf_counter() - start
+    print("Evaluated {} series in {:.1f}s: {:.1f} series/sec".format(len(results_df), elapsed, len(results_df) / elapsed if elapsed else 0))
+    return results_df
+
+def train_all_series(brands=("adidas", "nike", "retro-jordans", "other-sneakers"), transactions_format="csv", frequency="D", min_periods=60,
+        order=(3, 1, 0), refit_interval=None, train_fraction=0.8, results_file="shoe_data/model_results.csv", processes=None, chunksize=8,
+        maxtasksperchild=200):
+    """
+    Nightly batch job: resamples every (SKU, shoeSize) series of every brand to a regular grid, skips the ones with less
+    than min_periods periods, walk-forward evaluates the rest on a process pool and writes one row per series (n, fit
+    time, MSE, fitted parameters as JSON or the error) to results_file. Prints the throughput and peak memory of the
+    main and worker processes and returns the results DataFrame
+    """
+    start = time.perf_counter()
+    settings = _get_settings(order, refit_interval, train_fraction, min(min_periods - 1, 30))
+    #a generator so the series are read while the workers are already fitting
+    tasks = (task for brand in brands for task in _iterate_series_tasks(brand, settings, transactions_format=transactions_format,
+        min_length=min_periods, frequency=frequency))
+    results_df = _run_series_tasks(tasks, processes, chunksize, maxtasksperchild)
+
+    temp_file_name = "{}.{}.tmp".format(results_file, os.getpid())
+    results_df.to_csv(temp_file_name, index=False)
+    os.replace(temp_file_name, results_file)
+
+    elapsed = time.perf_counter() - start
+    fitted = int(results_df["error"].isnull().sum())
+    print("Trained {} series ({} failed) in {:.1f}s: {:.1f} series/sec".format(fitted, len(results_df) - fitted, elapsed, len(results_df) / elapsed if elapsed else 0))
+    print("Peak memory: main process {:.0f} MB, largest worker {:.0f} MB".format(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024))
+    return results_df
+
+if __name__ == '__main__':
+    #adidas, nike, retro-jordans, other-sneakers
+    print(evaluate_shoes("adidas", shoes=["adidas-zx-500-dragon-ball-z-son-goku"], refit_interval=50))
+
+    #print("Evaluating every shoe size series:")
+    #print(evaluate_shoes("adidas"))
+
+    #print("Training a model for every SKU and shoe size:")
+    #train_all_series()
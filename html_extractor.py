@@ -0,0 +1,68 @@
+import json
+import re
+import lxml.html
+
+#an ld+json script tag starting at the position it is matched at, with its contents (scripts can't contain </script)
+LD_JSON_SCRIPT = re.compile(r"""<script\b[^>]*?\btype\s*=\s*["']?application/ld\+json["']?[^>]*>(.*?)</script\s*>""", re.S | re.I)
+LD_JSON_SCRIPT_START = re.compile(r"""<script\b[^>]*?\btype\s*=\s*["']?application/ld\+json["']?[^>]*>""", re.I)
+BROWSE_GRID_LINKS = "(//div[contains(concat(' ', normalize-space(@class), ' '), ' browse-grid ')])[1]//a/@href"
+LD_JSON_SCRIPTS = "//script[@type='application/ld+json']/text()"
+
+def extract_shoe_links(text):
+    """
+    Returns the href of every link in the first browse-grid div of a browse page, in page order. Uses lxml's parser and
+    a single XPath query instead of building a BeautifulSoup tree. Raises a ValueError if the page has no browse grid
+    """
+    document = lxml.html.fromstring(text)
+    if not document.xpath("boolean(//div[contains(concat(' ', normalize-space(@class), ' '), ' browse-grid ')])"):
+        raise ValueError("Page has no browse-grid")
+    return [str(href) for href in document.xpath(BROWSE_GRID_LINKS)]
+
+def extract_shoe_info(text):
+    """
+    Returns the parsed JSON of the last application/ld+json script of a product page (the one with the shoe info). The
+    page is searched backwards from the end for the script tag, so usually only its last few kilobytes are looked at.
+    Mentions of ld+json inside other scripts or comments are skipped. Falls back to parsing the whole page with lxml if
+    the last ld+json script isn't closed (a truncated page) and raises an IndexError if there is no ld+json script at all
+    """
+    position = len(text)
+    while True:
+        position = text.rfind("application/ld+json", 0, position)
+        if position == -1:
+            break
+        start = text.rfind("<", 0, position)
+        comment_start = _get_enclosing_comment_start(text, start)
+        if comment_start != -1:
+            position = comment_start
+            continue
+        script_start = _get_enclosing_script_start(text, start)
+        if script_start != -1:
+            #the script around it can be the ld+json one itself (its JSON mentions ld+json), so its tag is looked at next
+            tag_end = text.find(">", script_start)
+            if tag_end == -1:
+                break
+            position = tag_end + 1
+            continue
+        match = LD_JSON_SCRIPT.match(text, start)
+        if match is not None:
+            return json.loads(match.group(1), strict=False)
+        if LD_JSON_SCRIPT_START.match(text, start):
+            break
+        position = start
+    scripts = lxml.html.fromstring(text).xpath(LD_JSON_SCRIPTS)
+    return json.loads(scripts[-1], strict=False)
+
+def _get_enclosing_comment_start(text, position):
+    """
+    Start of the HTML comment that position is in, or -1
+    """
+    comment_start = text.rfind("<!--", 0, position)
+    return comment_start if comment_start > text.rfind("-->", 0, position) else -1
+
+def _get_enclosing_script_start(text, position):
+    """
+    Start of the script element whose text position is in, or -1
+    """
+    script_start = max(text.rfind("<script", 0, position), text.rfind("<SCRIPT", 0, position))
+    script_end = max(text.rfind("</script", 0, position), text.rfind("</SCRIPT", 0, position))
+    return script_start if script_start > script_end else -1
@@ -1,36 +1,18 @@
 from pandas import read_csv
-from pandas import datetime
 from matplotlib import pyplot
-from statsmodels.tsa.arima_model import ARIMA
-from sklearn.metrics import mean_squared_error
-from sklearn.model_selection import train_test_split
+from forecasting import WalkForwardForecaster, get_shoe_size_series
 
 df = read_csv('shoe_data/shoe_transactions/adidas/adidas-zx-500-dragon-ball-z-son-goku.csv')
 print(df.columns)
-test_df = df.loc[df["shoeSize"] == 9, "amount"]
-df = df.loc[df["shoeSize"] == 10, "amount"]
-size = int(df.shape[0] * 0.8)
+series = get_shoe_size_series(df)[10]
 
-train, test = list(df[:size]), list(df[size+1:df.shape[0]])
-print(len(train), len(test))
-
-history = [x for x in train]
-
-history = [x for x in list(df)]
-
-predictions = []
-for i in range(len(list(test_df))):
-	model = ARIMA(history, order=(3,1,0))	
-	model_fit = model.fit(disp=0)
-	output = model_fit.forecast()
-	yhat = output[0]
-	predictions.append(yhat)
-	obs = list(test_df)[i]
-	history.append(obs)
+#fit once on the first 80% and update the model state with every new price, refitting every 50 observations
+evaluation = WalkForwardForecaster(order=(3,1,0), refit_interval=50, train_fraction=0.8).evaluate(series)
+print(evaluation["train_size"], len(evaluation["actuals"]))
+for yhat, obs in zip(evaluation["predictions"], evaluation["actuals"]):
 	print('predicted=%f, expected=%f' % (yhat, obs))
-error = mean_squared_error(test, predictions)
-print('Test MSE: %.3f' % error)
+print('Test MSE: %.3f' % evaluation["mse"])
 # plot
-pyplot.plot(test)
-pyplot.plot(predictions, color='red')
-pyplot.show()
\ No newline at end of file
+pyplot.plot(evaluation["actuals"])
+pyplot.plot(evaluation["predictions"], color='red')
+pyplot.show()
@@ -1,18 +1,43 @@
 import requests
 import csv
-import json
 from bs4 import BeautifulSoup
-from random import randint
 import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
 from multiprocessing import Pool, Process, cpu_count, current_process
+from multiprocessing.managers import BaseProxy, public_methods
+from proxy_pool import ProxyPool, ProxyPoolManager
+from crawl_state import CrawlStateIndex, RefreshSchedule
+from crawl_metrics import CrawlMetrics, shared_metrics, timed
+from html_extractor import extract_shoe_info, extract_shoe_links
+from raw_store import get_raw_store
+from retry_policy import RetryError, RetryPolicy, shared_retry_state
+from work_queue import CrawlWorkManager, CrawlWorkQueue, LeaseKeeper, get_worker_id
 
 class StockXScraper:
-    def __init__(self, brand):
+    def __init__(self, brand, proxies=None, base_url="https://stockx.com", raw_storage="files", retry_policy=None):
         self.brand = brand
-        self.proxies = self._get_proxies()
+        self.base_url = base_url
+        #"files" for one JSON file per SKU, "segments" for compressed segment files (see raw_store.py)
+        self.raw_storage = raw_storage
+        self.shoe_info_store = get_raw_store(brand, "shoe_info", raw_storage)
+        self.shoe_transaction_store = get_raw_store(brand, "shoe_transactions", raw_storage)
+        self.proxies = proxies if proxies is not None else self._get_proxies()
+        self.proxy_pool = ProxyPool(self.proxies, stats_file="proxy_stats.json")
+        self.transaction_page_size = 1000
+        self.max_transactions = 100000
+        self.crawl_state = CrawlStateIndex(brand)
+        self.metrics = CrawlMetrics()
+        #how failed requests are retried, see retry_policy.py
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        #how often refresh_shoe_info refetches a product page
+        self.refresh_schedule = RefreshSchedule()
+        if self.crawl_state.is_empty():
+            self.crawl_state.rebuild(self.shoe_info_store, self.shoe_transaction_store)
         self.scraped_pages = self._get_scraped_pages()
         self.scraped_shoe_info_links = self._get_scraped_shoe_info_links()
-        self.scraped_sku_list = self._get_sku_list("transactions")
+        self.scraped_sku_list = self.crawl_state.get_keys("transactions")
         self.headers = {
                 'User-Agent': "PostmanRuntime/7.19.0",
                 'Accept': "*/*",
@@ -28,89 +53,266 @@ class StockXScraper:
     def get_shoe_links(self, page):
         """
         Takes in a shoe brand (nike or adidas) and amount of pages up to 25 pages total and creates a list of all the links
-        and stores in a csv in the shoe_links directory
+        and stores in a csv in the shoe_links directory. Returns the file name, or None if the page couldn't be scraped
         """
-        shoe_links = []
-        url = "https://stockx.com/{}?page={}".format(self.brand, page)
+        url = "{}/{}?page={}".format(self.base_url, self.brand, page)
         #print("StockX Page Number: {}".format(page))
-        success = False
-        for _ in range(10):
-            try:
-                proxy = self.proxies[randint(0, len(self.proxies))]
-                response = requests.request("GET", url, headers=self.headers, proxies={'https': proxy, 'http': proxy})
-                #print("Proxy Value: {}, Request Status Code: {}".format(proxy, response.status_code))
-                if response.status_code == 200:
-                    shoe_links = self._scrape_shoe_links(response.text)
-                    file_name = "shoe_links/{}/{}.csv".format(self.brand, page)
-                    self._write_to_csv(file_name, shoe_links)
-                    print("Shoe links scraped from page {}, Process ID: {}".format(page, current_process().pid))
-                    success = True
-                    break
-            except:
-                continue
-        if success == False:
-            print("Unable to get information from {}, Process ID: {}".format(url, current_process().pid))
+        try:
+            shoe_links = self._fetch("links", url, lambda response: self._scrape_shoe_links(response.text))
+        except RetryError as e:
+            self._report_failure("links", url, e)
+            return
+        file_name = self._save_shoe_links(page, shoe_links)
+        print("Shoe links scraped from page {}, Process ID: {}".format(page, current_process().pid))
+        return file_name
 
     def get_shoe_info(self, link):
         """
         Takes in a csv file containing links to different shoes and gets a json file containing information about the shoe
         such as name, brand, release date, colorway, and sku and stores it as a JSON file in the shoe_info directory writes
-        SKUs to csv in shoe_transactions directory
+        SKUs to csv in shoe_transactions directory. Returns the file name, or None if nothing was written
         """
-        url = "https://stockx.com{}".format(link)
+        url = "{}{}".format(self.base_url, link)
         if self._check_if_shoe_info_already_scraped(url):
             #print("Already exists: JSON file for {}".format(url))
             return
 
         print("Extracting shoe info from {}".format(url))
-        success = False
-        for _ in range(10):
-            try:
-                proxy = self.proxies[randint(0, len(self.proxies))]
-                response = requests.request("GET", url, headers=self.headers, proxies={'https': proxy, 'http': proxy})
-                #print("Proxy Value: {}, Request Status Code: {}, Shoe Link: {}".format(proxy, response.status_code, link))
-                if response.status_code == 200:
-                    shoe_info = self._scrape_shoe_info(response.text)
-                    file_name = "shoe_info/{}/{}.json".format(self.brand, shoe_info["sku"])
-                    self._write_to_json(file_name, shoe_info)
-                    print("JSON file: {} created, Process ID: {}".format(file_name, current_process().pid))
-                    success = True
-                    break
-            except:
-                continue
-        if success == False:
-            print("Unable to get information from {}, Process ID: {}".format(url, current_process().pid))
-        
+        try:
+            shoe_info, validators = self._fetch_shoe_info(url)
+        except RetryError as e:
+            self._report_failure("info", url, e)
+            return
+        file_name = self._save_shoe_info(url, shoe_info)
+        self.crawl_state.record_refresh("info", url, content_hash=self.crawl_state.get_content_hash(shoe_info), schedule=self.refresh_schedule, **validators)
+        print("JSON file: {} created, Process ID: {}".format(file_name, current_process().pid))
+        return file_name
+
+    def refresh_shoe_info(self, link):
+        """
+        Refresh mode of get_shoe_info: asks for the product page only if it changed since it was last fetched (using
+        the ETag and Last-Modified of the last response) and rewrites the stored shoe info only if what is extracted
+        from the page changed. Returns the file name, or None if nothing was rewritten
+        """
+        url = "{}{}".format(self.base_url, link)
+        refresh_state = self.crawl_state.get_refresh_state("info", url)
+        try:
+            shoe_info, validators = self._fetch_shoe_info(url, refresh_state)
+        except RetryError as e:
+            self._report_failure("info", url, e)
+            return
+        if shoe_info is None:
+            self.crawl_state.record_refresh("info", url, changed=False, schedule=self.refresh_schedule)
+            self.metrics.increment("refreshes", "info", "not_modified")
+            return
+
+        content_hash = self.crawl_state.get_content_hash(shoe_info)
+        stored_hash = refresh_state["content_hash"] if refresh_state is not None else self._get_stored_shoe_info_hash(url)
+        if content_hash == stored_hash:
+            self.crawl_state.record_refresh("info", url, content_hash=content_hash, changed=False, schedule=self.refresh_schedule, **validators)
+            self.metrics.increment("refreshes", "info", "unchanged")
+            return
+        file_name = self._save_shoe_info(url, shoe_info)
+        #never stored before is a first fetch rather than a change
+        changed = True if stored_hash is not None else None
+        self.crawl_state.record_refresh("info", url, content_hash=content_hash, changed=changed, schedule=self.refresh_schedule, **validators)
+        self.metrics.increment("refreshes", "info", "changed" if changed else "new")
+        print("JSON file: {} refreshed, Process ID: {}".format(file_name, current_process().pid))
+        return file_name
+
+    def _fetch_shoe_info(self, url, refresh_state=None):
+        """
+        Returns the shoe info of the product page and the validators (ETag and Last-Modified) of the response, or
+        None and no validators if the page wasn't modified since the validators of refresh_state
+        """
+        headers = {}
+        if refresh_state is not None and refresh_state["etag"]:
+            headers["If-None-Match"] = refresh_state["etag"]
+        if refresh_state is not None and refresh_state["last_modified"]:
+            headers["If-Modified-Since"] = refresh_state["last_modified"]
+
+        def parse(response):
+            if response.status_code == 304:
+                return None, {}
+            return self._parse_shoe_info_response(response), {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+        return self._fetch("info", url, parse, headers=headers)
+
+    def _get_stored_shoe_info_hash(self, url):
+        #scraped before refresh state was tracked
+        entry = self.crawl_state.get_entry("info", url)
+        return entry["content_hash"] if entry is not None else None
+
     def get_shoe_transaction_data(self, sku):
         """
         reads each SKU from the shoe_info directory and for each SKU grabs up 100,000 transactions with information about date of transaction, size, and price and stores it as a JSON file
-        in the shoe_transactions directory
+        in the shoe_transactions directory. Returns the file name, or None if nothing was written
         """
         if self._check_if_shoe_transaction_already_scraped(sku):
             #print("Already exists: JSON file for {}".format(sku))
             return
 
-        url = "https://stockx.com/api/products/{}/activity".format(sku)
-        querystring = {"state":"480","currency":"USD","limit":"100000","page":"1","sort":"createdAt","order":"DESC"}
+        url = "{}/api/products/{}/activity".format(self.base_url, sku)
+        querystring = self._get_transaction_querystring()
 
         print("Extracting shoe info from {}".format(url))
-        success = False
-        for _ in range(10):
+        try:
+            data = self._fetch("transactions", url, lambda response: response.json(), params=querystring)
+        except RetryError as e:
+            self._report_failure("transactions", url, e)
+            return
+        file_name = self._save_shoe_transaction_data(sku, data)
+        print("JSON file: {} created, Process ID: {}".format(file_name, current_process().pid))
+        return file_name
+
+    def update_shoe_transaction_data(self, sku):
+        """
+        Incremental version of get_shoe_transaction_data: pages through the activity feed newest first in chunks of
+        transaction_page_size, stops once it reaches the newest transaction already stored for the SKU and adds only
+        the new transactions to its stored JSON. Returns the file name, or None if nothing was new
+        """
+        url = "{}/api/products/{}/activity".format(self.base_url, sku)
+        data = self.shoe_transaction_store.get(sku) if sku in self.shoe_transaction_store else None
+        newest_stored = self._get_newest_stored_transaction_date(sku, data)
+        #a sale that lands between two page fetches shifts the feed by one, so the last transaction of a page comes
+        #back as the first one of the next page, and transactions at or after the cursor may already be stored
+        seen_ids = self._get_stored_transaction_ids(data, newest_stored)
+
+        new_transactions = []
+        page = 1
+        complete = False
+        while len(new_transactions) < self.max_transactions:
             try:
-                proxy = self.proxies[randint(0, len(self.proxies))]
-                response = requests.request("GET", url, headers=self.headers, params=querystring, proxies={'https': proxy, 'http': proxy})
-                #print("Proxy Value: {}, Request Status Code: {}, SKU Value: {}, Process ID: {}".format(proxy, response.status_code, sku, current_process().pid))
-                if response.status_code == 200:
-                    data = response.json()
-                    file_name = 'shoe_transactions/{}/{}.json'.format(self.brand, sku)
-                    self._write_to_json(file_name, data)
-                    print("JSON file: {} created, Process ID: {}".format(file_name, current_process().pid))
-                    success = True
+                transactions = self._get_transaction_page(url, page)
+            except RetryError as e:
+                self._report_failure("transactions", url, e)
+                return
+            reached_stored = False
+            for transaction in transactions:
+                if newest_stored is not None and self._parse_created_at(transaction["createdAt"]) < newest_stored:
+                    reached_stored = True
                     break
-            except:
-                continue
-        if success == False:
-            print("Unable to get information from {}, Process ID: {}".format(url, current_process().pid))
+                chain_id = transaction.get("chainId")
+                if chain_id is not None:
+                    if chain_id in seen_ids:
+                        continue
+                    seen_ids.add(chain_id)
+                new_transactions.append(transaction)
+            if reached_stored or len(transactions) < self.transaction_page_size:
+                complete = True
+                break
+            page += 1
+
+        #when max_transactions stopped the paging early the transactions between the cursor and the oldest one fetched
+        #are still missing, so the cursor stays where it was and the next update carries on from there
+        cursor = newest_stored.isoformat() if not complete and newest_stored is not None else None
+        file_name = self._merge_shoe_transaction_data(sku, new_transactions, data, cursor)
+        if file_name is not None:
+            print("JSON file: {} updated, Process ID: {}".format(file_name, current_process().pid))
+        return file_name
+
+    def _get_transaction_page(self, url, page):
+        querystring = self._get_transaction_querystring()
+        querystring["limit"] = str(self.transaction_page_size)
+        querystring["page"] = str(page)
+        return self._fetch("transactions", url, lambda response: response.json().get("ProductActivity", []), params=querystring)
+
+    def _fetch(self, stage, url, parse, params=None, headers=None):
+        """
+        GETs the url and returns parse(response). Error responses, timeouts and pages that can't be parsed are retried
+        as the retry policy says and a RetryError is raised when it gives up
+        """
+        def attempt():
+            response = self._request(url, params=params, stage=stage, headers=headers)
+            response.raise_for_status()
+            with timed(self.metrics, stage + ".parse"):
+                return parse(response)
+        return self.retry_policy.call(stage, attempt, self.metrics)
+
+    def _report_failure(self, stage, url, retry_error):
+        self.metrics.increment("failures", stage, retry_error.error_class)
+        print("Unable to get information from {} ({}), Process ID: {}".format(url, retry_error.error_class, current_process().pid))
+
+    def _merge_shoe_transaction_data(self, sku, new_transactions, data, cursor=None):
+        """
+        Puts the new transactions in front of the stored data (the feed is newest first). Returns the file name or None
+        when nothing was new
+        """
+        if not new_transactions and data is not None:
+            return None
+        if data is None:
+            data = {"ProductActivity": []}
+        data["ProductActivity"] = new_transactions + data.get("ProductActivity", [])
+        return self._save_shoe_transaction_data(sku, data, cursor)
+
+    def _get_newest_stored_transaction_date(self, sku, data):
+        cursor = self.crawl_state.get_cursor("transactions", sku)
+        if cursor is not None:
+            return self._parse_created_at(cursor)
+        #scraped before cursors were tracked
+        transactions = data.get("ProductActivity", []) if data is not None else []
+        if not transactions:
+            return None
+        return max(self._parse_created_at(transaction["createdAt"]) for transaction in transactions)
+
+    def _get_stored_transaction_ids(self, data, newest_stored):
+        """
+        chainIds of the stored transactions from newest_stored on (all of them without a cursor)
+        """
+        transactions = data.get("ProductActivity", []) if data is not None else []
+        return set(transaction.get("chainId") for transaction in transactions
+            if transaction.get("chainId") is not None and (newest_stored is None or self._parse_created_at(transaction["createdAt"]) >= newest_stored))
+
+    def _parse_created_at(self, created_at):
+        return datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+
+    def _request(self, url, params=None, stage="request", headers=None):
+        """
+        Makes a GET request (with the headers added to the default ones) through a proxy picked by the proxy pool and reports back how the proxy did. Blocked or
+        rate limited responses and server errors count as failures of the proxy. The latency, status and size of the
+        response are recorded in the metrics of the stage
+        """
+        with timed(self.metrics, stage + ".proxy"):
+            proxy = self.proxy_pool.get_proxy()
+        start = time.perf_counter()
+        try:
+            response = requests.request("GET", url, headers=dict(self.headers, **(headers or {})), params=params, proxies={'https': proxy, 'http': proxy}, timeout=self.retry_policy.timeout)
+        except requests.exceptions.RequestException:
+            self.metrics.observe(stage + ".request", time.perf_counter() - start)
+            self.proxy_pool.report_failure(proxy)
+            raise
+        latency = time.perf_counter() - start
+        self.metrics.observe(stage + ".request", latency)
+        self.metrics.increment("requests", stage, str(response.status_code))
+        self.metrics.increment("bytes", stage, value=len(response.content))
+        if self._is_proxy_failure(response.status_code):
+            self.proxy_pool.report_failure(proxy)
+        else:
+            self.proxy_pool.report_success(proxy, latency)
+        return response
+
+    def _is_proxy_failure(self, status_code):
+        return status_code in [403, 407, 429] or status_code >= 500
+
+    @contextmanager
+    def shared_proxy_pool(self):
+        """
+        Moves the proxy pool into a manager process for the duration of the block so all the workers of a
+        multiprocessing Pool share the same proxy stats, then copies the stats back and saves them
+        """
+        local_proxy_pool = self.proxy_pool
+        with ProxyPoolManager() as manager:
+            self.proxy_pool = manager.ProxyPool([])
+            self.proxy_pool.update_proxy_stats(local_proxy_pool.get_proxy_stats())
+            try:
+                yield self.proxy_pool
+            finally:
+                local_proxy_pool.update_proxy_stats(self.proxy_pool.get_proxy_stats())
+                self.proxy_pool = local_proxy_pool
+        local_proxy_pool.save()
+        print("Proxy pool: {}".format(local_proxy_pool.get_summary()))
+
+    def _get_transaction_querystring(self):
+        return {"state":"480","currency":"USD","limit":"100000","page":"1","sort":"createdAt","order":"DESC"}
 
     def join_shoe_links_csv_files(self):
         directory_name = "shoe_links/{}/".format(self.brand)
@@ -123,25 +325,18 @@ class StockXScraper:
         self._write_to_csv(output_path, file_contents_flattened)
 
     def _scrape_shoe_links(self, text):
-        soup = BeautifulSoup(text, 'lxml')
-        products_div = soup.find('div', attrs={'class': 'browse-grid'})
-        products = products_div.findAll('a', href=True)
-        shoe_links = []
-        for link in products:
-            if link['href'] not in products:
-                shoe_links.append(link['href'])
-        return shoe_links
+        return extract_shoe_links(text)
 
     def _scrape_shoe_info(self, text):
-        soup = BeautifulSoup(text, 'lxml')
-        page_scripts = soup.findAll('script', type='application/ld+json')
-        #gets the last script which has shoe info
-        raw_shoe_info = page_scripts[-1].text
-        #removes script tags to have only the JSON object
-        raw_shoe_info = raw_shoe_info.replace("</script>", "")
-        json_formatted_shoe_info = raw_shoe_info.replace('<script type="application/ld+json">', "")
-        shoe_data = json.loads(json_formatted_shoe_info, strict=False)
-        return shoe_data
+        #the last ld+json script of the page has the shoe info
+        return extract_shoe_info(text)
+
+    def _parse_shoe_info_response(self, response):
+        shoe_info = self._scrape_shoe_info(response.text)
+        if "sku" not in shoe_info:
+            #a page cut off before the product script, the last script is another one
+            raise ValueError("No shoe info on {}".format(response.url))
+        return shoe_info
 
     def _get_proxies(self):
         """
@@ -162,24 +357,35 @@ class StockXScraper:
         return proxies
 
     def _get_scraped_pages(self):
-        directory_name = "shoe_links/{}/".format(self.brand)
-        file_names = os.listdir(directory_name)
-        return [file_name.replace(".csv", "") for file_name in file_names]
+        return self.crawl_state.get_keys("links")
 
     def _get_scraped_shoe_info_links(self):
-        directory_name = "shoe_info/{}/".format(self.brand)
-        file_names = os.listdir(directory_name)
-        scraped_links = []
-        for file_name in file_names:
-            file_path = directory_name + file_name
-            with open(file_path) as json_file:
-                data = json.load(json_file)
-                try:
-                    scraped_link = data["offers"]["url"]
-                    scraped_links.append(scraped_link)
-                except KeyError:
-                    continue
-        return scraped_links
+        return self.crawl_state.get_keys("info")
+
+    def _save_shoe_links(self, page, shoe_links):
+        file_name = "shoe_links/{}/{}.csv".format(self.brand, page)
+        with timed(self.metrics, "links.write"):
+            self._write_to_csv(file_name, shoe_links)
+            self.crawl_state.mark("links", str(page), data=shoe_links)
+        return file_name
+
+    def _save_shoe_info(self, url, shoe_info):
+        with timed(self.metrics, "info.write"):
+            file_name = self.shoe_info_store.put(shoe_info["sku"], shoe_info)
+            self.crawl_state.mark("info", shoe_info.get("offers", {}).get("url", url), sku=shoe_info["sku"], data=shoe_info)
+        return file_name
+
+    def _save_shoe_transaction_data(self, sku, data, cursor=None):
+        """
+        Stores the transaction data of the SKU, with the newest stored transaction as its cursor unless one is given
+        """
+        with timed(self.metrics, "transactions.write"):
+            file_name = self.shoe_transaction_store.put(sku, data)
+            transactions = data.get("ProductActivity") or []
+            if cursor is None and transactions:
+                cursor = max((transaction["createdAt"] for transaction in transactions), key=self._parse_created_at)
+            self.crawl_state.mark("transactions", sku, sku=sku, data=data, cursor=cursor)
+        return file_name
 
     def _get_list_from_csv(self, file_name):
         with open(file_name, 'r') as f:
@@ -188,33 +394,23 @@ class StockXScraper:
     
         return self._flatten_list(unflattened_list)
 
-    def _get_sku_list(self, data_type):
-        directory_name = "shoe_{}/{}/".format(data_type, self.brand)
-        file_names = os.listdir(directory_name)
-        sku_list = []
-        for file_name in file_names:
-            sku_list.append(file_name.replace(".json", ""))
-        return sku_list
-
     def _write_to_csv(self, file_name, data_list):
         with open(file_name, 'w') as f:
             wr = csv.writer(f, quoting=csv.QUOTE_ALL)
             wr.writerow(data_list)
 
-    def _write_to_json(self, file_name, data):
-        with open(file_name, 'w') as f:
-            json.dump(data, f)
-
     def _check_if_shoe_info_already_scraped(self, shoe_link):
-        for scraped_link in self.scraped_shoe_info_links:
-            if scraped_link == shoe_link:
-                return True
-        return False
+        return shoe_link in self.scraped_shoe_info_links
 
     def _check_if_shoe_transaction_already_scraped(self, sku):
-        if sku in self.scraped_sku_list:
-            return True
-        return False
+        return sku in self.scraped_sku_list
+
+    def _check_if_already_scraped(self, stage, key):
+        if stage == "links":
+            return key in self.scraped_pages
+        if stage == "info":
+            return self._check_if_shoe_info_already_scraped(self.base_url + key)
+        return self._check_if_shoe_transaction_already_scraped(key)
 
     def _flatten_list(self, unflattened_list): 
         flattened_list = []
@@ -227,34 +423,173 @@ class StockXScraper:
         return flattened_list
 
 def scrape_shoe_links(stock_x_scraper):
-    pages = range(1, 26)
-    pages = [str(page) for page in pages]
-    pages_to_scrape = [page for page in pages if page not in stock_x_scraper.scraped_pages]
+    pages_to_scrape = _get_pages_to_scrape(stock_x_scraper)
     print("Amount of pages to scrape: {}".format(len(pages_to_scrape)))
-    pool = Pool(processes=cpu_count())
-    pool.map_async(stock_x_scraper.get_shoe_links, pages_to_scrape)
-    pool.close()
-    pool.join()
+    with stock_x_scraper.shared_proxy_pool(), shared_metrics(stock_x_scraper), shared_retry_state(stock_x_scraper.retry_policy):
+        pool = Pool(processes=cpu_count())
+        pool.map_async(stock_x_scraper.get_shoe_links, pages_to_scrape)
+        pool.close()
+        pool.join()
     stock_x_scraper.join_shoe_links_csv_files()
+    stock_x_scraper.metrics.report("scrape_{}".format(stock_x_scraper.brand))
 
 def scrape_shoe_info(stock_x_scraper):
-    links = stock_x_scraper._get_list_from_csv("shoe_links/{}_links.csv".format(stock_x_scraper.brand.replace("-", "_")))
-    links_to_scrape = [link for link in links if "https://stockx.com" + link not in stock_x_scraper.scraped_shoe_info_links]
+    links_to_scrape = _get_links_to_scrape(stock_x_scraper)
     print("Amount of links to scrape: {}".format(len(links_to_scrape)))
-    pool = Pool(processes=50)
-    pool.map(stock_x_scraper.get_shoe_info, links_to_scrape)
-    pool.close()
-    pool.join()
-
-def scrape_transaction_data(stock_x_scraper):
-    sku_list = stock_x_scraper._get_sku_list("info")
-    skus_to_scrape = [sku for sku in sku_list if sku not in stock_x_scraper.scraped_sku_list]
+    with stock_x_scraper.shared_proxy_pool(), shared_metrics(stock_x_scraper), shared_retry_state(stock_x_scraper.retry_policy):
+        pool = Pool(processes=50)
+        pool.map(stock_x_scraper.get_shoe_info, links_to_scrape)
+        pool.close()
+        pool.join()
+    stock_x_scraper.metrics.report("scrape_{}".format(stock_x_scraper.brand))
+
+def refresh_shoe_info(stock_x_scraper):
+    """
+    Refetches the shoe info of the products that are due for a refresh, see StockXScraper.refresh_shoe_info
+    """
+    links_to_refresh = _get_links_to_refresh(stock_x_scraper)
+    print("Amount of links to refresh: {}".format(len(links_to_refresh)))
+    with stock_x_scraper.shared_proxy_pool(), shared_metrics(stock_x_scraper), shared_retry_state(stock_x_scraper.retry_policy):
+        pool = Pool(processes=50)
+        pool.map(stock_x_scraper.refresh_shoe_info, links_to_refresh)
+        pool.close()
+        pool.join()
+    stock_x_scraper.metrics.report("refresh_{}".format(stock_x_scraper.brand))
+
+def scrape_transaction_data(stock_x_scraper, incremental=False):
+    """
+    Scrapes the transactions of every SKU that has none yet, or with incremental=True fetches only the new
+    transactions of every SKU
+    """
+    skus_to_scrape = _get_skus_to_scrape(stock_x_scraper, incremental)
+    if incremental:
+        scrape_function = stock_x_scraper.update_shoe_transaction_data
+    else:
+        scrape_function = stock_x_scraper.get_shoe_transaction_data
     print("Amount of SKUs to scrape: {}".format(len(skus_to_scrape)))
-    pool = Pool(processes=50)
-    pool.map_async(stock_x_scraper.get_shoe_transaction_data, skus_to_scrape)
-    pool.close()
-    pool.join()
-    
+    with stock_x_scraper.shared_proxy_pool(), shared_metrics(stock_x_scraper), shared_retry_state(stock_x_scraper.retry_policy):
+        pool = Pool(processes=50)
+        pool.map_async(scrape_function, skus_to_scrape)
+        pool.close()
+        pool.join()
+    stock_x_scraper.metrics.report("scrape_{}".format(stock_x_scraper.brand))
+
+def enqueue_crawl_work(stock_x_scraper, work_queue, stage):
+    """
+    Work queue mode: adds what is left to scrape of the stage ("links", "info" or "transactions") to the work queue.
+    Run once, then run scrape_from_work_queue on this machine and serve_crawl_work for the workers of other machines
+    """
+    keys = {"links": _get_pages_to_scrape, "info": _get_links_to_scrape, "transactions": _get_skus_to_scrape}[stage](stock_x_scraper)
+    added = work_queue.enqueue(stage, keys)
+    print("Added {} of {} {} keys to the work queue: {}".format(added, len(keys), stage, work_queue.get_counts(stage)))
+
+def serve_crawl_work(stock_x_scraper, work_queue, address=("", 50000), authkey=b"stockx"):
+    """
+    Work queue mode across machines: serves the work queue and the raw stores and crawl state of the scraper on
+    address until interrupted. Workers on other machines connect_to_crawl_work, so only this machine opens the SQLite
+    files and everything scraped ends up here
+    """
+    class ServedCrawlWork(CrawlWorkManager):
+        pass
+
+    served_objects = {"get_work_queue": work_queue, "get_shoe_info_store": stock_x_scraper.shoe_info_store,
+        "get_shoe_transaction_store": stock_x_scraper.shoe_transaction_store, "get_crawl_state": stock_x_scraper.crawl_state}
+    for typeid, served_object in served_objects.items():
+        #"sku in store" is used by the scraper so __contains__ is served along with the public methods
+        exposed = public_methods(served_object) + (["__contains__"] if hasattr(served_object, "__contains__") else [])
+        ServedCrawlWork.register(typeid, callable=lambda served_object=served_object: served_object, exposed=exposed)
+    print("Serving the crawl work of {} on {}".format(stock_x_scraper.brand, address))
+    ServedCrawlWork(address=address, authkey=authkey).get_server().serve_forever()
+
+def connect_to_crawl_work(stock_x_scraper, address, authkey=b"stockx"):
+    """
+    Work queue mode across machines: connects to the serve_crawl_work of another machine and points the scraper at its
+    raw stores and crawl state, so what this machine scrapes is stored there. Returns the served work queue to pass to
+    scrape_from_work_queue
+    """
+    manager = CrawlWorkManager(address=address, authkey=authkey)
+    manager.connect()
+    stock_x_scraper.shoe_info_store = manager.get_shoe_info_store()
+    stock_x_scraper.shoe_transaction_store = manager.get_shoe_transaction_store()
+    stock_x_scraper.crawl_state = manager.get_crawl_state()
+    stock_x_scraper.scraped_pages = stock_x_scraper._get_scraped_pages()
+    stock_x_scraper.scraped_shoe_info_links = stock_x_scraper._get_scraped_shoe_info_links()
+    stock_x_scraper.scraped_sku_list = stock_x_scraper.crawl_state.get_keys("transactions")
+    return manager.get_work_queue()
+
+def scrape_from_work_queue(stock_x_scraper, work_queue, stage, processes=50, lease_size=1):
+    """
+    Work queue mode: runs processes workers that lease keys of the stage from the work queue until every key is done
+    or failed. Workers on other machines run it with the work queue from connect_to_crawl_work
+    """
+    if stage == "links" and isinstance(stock_x_scraper.crawl_state, BaseProxy):
+        raise ValueError("The links stage writes shoe_links CSV files where it runs, scrape it on the machine that serves the crawl work")
+    #plain processes rather than a Pool: a worker that dies takes its Pool task with it and map would never return
+    with stock_x_scraper.shared_proxy_pool(), shared_metrics(stock_x_scraper), shared_retry_state(stock_x_scraper.retry_policy):
+        workers = [Process(target=work_on_queue, args=(stock_x_scraper, work_queue, stage, lease_size)) for _ in range(processes)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    if stage == "links":
+        stock_x_scraper.join_shoe_links_csv_files()
+    print("Work queue after scraping {}: {}".format(stage, work_queue.get_counts(stage)))
+    stock_x_scraper.metrics.report("scrape_{}".format(stock_x_scraper.brand))
+
+def work_on_queue(stock_x_scraper, work_queue, stage, lease_size=1, poll_seconds=1):
+    """
+    One work queue worker: leases keys of the stage and scrapes them until the stage is finished, waiting for the
+    leases of other workers to be completed or to expire when there is nothing to lease. Returns the amount of keys
+    it completed and failed
+    """
+    scrape_functions = {"links": stock_x_scraper.get_shoe_links, "info": stock_x_scraper.get_shoe_info, "transactions": stock_x_scraper.get_shoe_transaction_data}
+    worker_id = get_worker_id()
+    done, failed = 0, 0
+    #the leased keys, including the ones still waiting for their turn in the lease, stay leased while retries wait
+    with LeaseKeeper(work_queue, stage, worker_id) as lease_keeper:
+        while True:
+            keys = work_queue.lease(stage, worker_id, lease_size)
+            if not keys:
+                if work_queue.is_finished(stage):
+                    return done, failed
+                time.sleep(poll_seconds)
+                continue
+            lease_keeper.add(keys)
+            for key in keys:
+                try:
+                    file_name = scrape_functions[stage](key)
+                except Exception as e:
+                    file_name = None
+                    error = repr(e)
+                else:
+                    error = "not scraped"
+                if file_name is not None or stock_x_scraper._check_if_already_scraped(stage, key):
+                    work_queue.complete(stage, key, worker_id)
+                    done += 1
+                else:
+                    work_queue.fail(stage, key, worker_id, error)
+                    failed += 1
+                lease_keeper.remove(key)
+
+def _get_pages_to_scrape(stock_x_scraper):
+    pages = [str(page) for page in range(1, 26)]
+    return [page for page in pages if page not in stock_x_scraper.scraped_pages]
+
+def _get_links_to_scrape(stock_x_scraper):
+    links = stock_x_scraper._get_list_from_csv("shoe_links/{}_links.csv".format(stock_x_scraper.brand.replace("-", "_")))
+    return [link for link in links if stock_x_scraper.base_url + link not in stock_x_scraper.scraped_shoe_info_links]
+
+def _get_links_to_refresh(stock_x_scraper):
+    links = stock_x_scraper._get_list_from_csv("shoe_links/{}_links.csv".format(stock_x_scraper.brand.replace("-", "_")))
+    due_urls = set(stock_x_scraper.crawl_state.get_keys_due_for_refresh("info", [stock_x_scraper.base_url + link for link in links]))
+    return [link for link in links if stock_x_scraper.base_url + link in due_urls]
+
+def _get_skus_to_scrape(stock_x_scraper, incremental=False):
+    sku_list = stock_x_scraper.crawl_state.get_skus("info")
+    if incremental:
+        return list(sku_list)
+    return [sku for sku in sku_list if sku not in stock_x_scraper.scraped_sku_list]
+
 if __name__ == '__main__':
     #adidas, nike, retro-jordans, other-sneakers
     brand = "other-sneakers"
@@ -267,4 +602,20 @@ if __name__ == '__main__':
     #scrape_shoe_info(stock_x_scraper)
 
     #print("Getting Shoe Transaction Data:")
-    #scrape_transaction_data(stock_x_scraper)
\ No newline at end of file
+    #scrape_transaction_data(stock_x_scraper)
+
+    #print("Refreshing Shoe Info that may have changed:")
+    #refresh_shoe_info(stock_x_scraper)
+
+    #print("Getting New Shoe Transactions:")
+    #scrape_transaction_data(stock_x_scraper, incremental=True)
+
+    #print("Getting Shoe Info from the work queue shared with the other machines:")
+    #work_queue = CrawlWorkQueue(brand)
+    #enqueue_crawl_work(stock_x_scraper, work_queue, "info")
+    #scrape_from_work_queue(stock_x_scraper, work_queue, "info")
+    #serve_crawl_work(stock_x_scraper, work_queue) #in another process, for the other machines
+
+    #print("Getting Shoe Info from the work queue of another machine:")
+    #work_queue = connect_to_crawl_work(stock_x_scraper, ("crawl-host", 50000))
+    #scrape_from_work_queue(stock_x_scraper, work_queue, "info")
\ No newline at end of file
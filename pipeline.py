@@ -0,0 +1,163 @@
+import os
+import threading
+import time
+import traceback
+from multiprocessing import Process, Queue
+from crawl_metrics import CrawlMetrics, timed
+from data_formatter import StockXDataFormatter
+from feature_extractor import StockXFeatureExtractor
+from multiprocessing_scraper import StockXScraper
+from retry_policy import shared_retry_state
+
+class StockXPipeline:
+    """
+    Scrapes, formats and adds the features of the transactions of a brand one SKU at a time: fetch, format and
+    feature worker processes are connected by bounded queues, so a SKU is formatted as soon as its transactions are
+    stored and gets its features as soon as it's formatted, without rescanning any directory. When a later stage falls
+    behind its queue fills up and the stage before it blocks instead of piling up work in memory
+    """
+    def __init__(self, stock_x_scraper, output_format="csv", fetch_processes=8, format_processes=2, feature_processes=2, queue_size=16,
+            incremental=False, save_every=50):
+        self.scraper = stock_x_scraper
+        self.brand = stock_x_scraper.brand
+        #"csv" or "parquet", the format the formatter writes and the feature extractor reads
+        self.output_format = output_format
+        self.formatter = StockXDataFormatter(self.brand, stock_x_scraper.raw_storage)
+        self.extractor = StockXFeatureExtractor(self.brand, output_format)
+        self.processes = {"fetch": fetch_processes, "format": format_processes, "features": feature_processes}
+        self.queue_size = queue_size
+        self.incremental = incremental
+        self.save_every = save_every
+        self.metrics = CrawlMetrics()
+
+    def run(self, skus=None):
+        """
+        Runs the SKUs (every SKU with shoe info by default) through the pipeline, saving the feature records as they
+        come in, then updates the shoe info CSV. Returns the feature records
+        """
+        if skus is None:
+            skus = sorted(self.scraper.crawl_state.get_skus("info"))
+        print("Amount of SKUs in the pipeline: {}".format(len(skus)))
+        start = time.perf_counter()
+        self.formatter.create_shoe_info_csv()
+        if self.output_format == "csv":
+            os.makedirs("shoe_data/shoe_transactions/{}/".format(self.brand), exist_ok=True)
+        self.extractor.feature_records = self.extractor.feature_store.get_records()
+
+        stages = [("fetch", self._fetch, self.scraper), ("format", self._format, self.formatter), ("features", self._add_features, self.extractor)]
+        queues = [Queue(maxsize=self.queue_size) for _ in stages]
+        results = Queue(maxsize=self.queue_size)
+        records = []
+        with self.scraper.shared_proxy_pool(), shared_retry_state(self.scraper.retry_policy):
+            workers = []
+            for i, (name, function, owner) in enumerate(stages):
+                output_queue = queues[i + 1] if i + 1 < len(stages) else results
+                workers.append([Process(target=_run_stage_worker, args=(name, function, owner.metrics, queues[i], output_queue, results))
+                    for _ in range(self.processes[name])])
+            for stage_workers in workers:
+                for worker in stage_workers:
+                    worker.start()
+            threads = [threading.Thread(target=self._feed, args=(skus, queues[0])), threading.Thread(target=self._close_stages, args=(workers, queues, results))]
+            for thread in threads:
+                thread.start()
+
+            unsaved_records = []
+            for message in iter(results.get, None):
+                if message[0] == "metrics":
+                    self.metrics.merge(message[1])
+                    continue
+                record, fetched_at = message
+                self.metrics.observe("pipeline.fetch_to_features", time.time() - fetched_at)
+                print("Features of {} ready {:.1f}s after its transactions were fetched".format(record["shoe"], time.time() - fetched_at))
+                records.append(record)
+                unsaved_records.append(record)
+                if len(unsaved_records) >= self.save_every:
+                    self._save_records(unsaved_records)
+                    unsaved_records = []
+            self._save_records(unsaved_records)
+            for thread in threads:
+                thread.join()
+
+        if records:
+            self.extractor.update_shoe_info_features()
+        elapsed = time.perf_counter() - start
+        print("Pipeline done in {:.1f}s: {} of {} SKUs have new features ({:.1f} SKUs/sec)".format(elapsed, len(records), len(skus), len(records) / elapsed))
+        self.metrics.report("pipeline_{}".format(self.brand))
+        return records
+
+    def _fetch(self, sku):
+        if self.incremental:
+            file_name = self.scraper.update_shoe_transaction_data(sku)
+        else:
+            file_name = self.scraper.get_shoe_transaction_data(sku)
+        if file_name is None:
+            return None
+        return sku, time.time()
+
+    def _format(self, item):
+        sku, fetched_at = item
+        if self.output_format == "parquet":
+            rows = self.formatter.create_shoe_transaction_parquet_file(sku)
+        else:
+            rows = self.formatter.create_shoe_transaction_csv(sku)
+        if not rows:
+            #no file to add features to
+            return None
+        return self.formatter._get_shoe_link_name(sku), fetched_at
+
+    def _add_features(self, item):
+        shoe, fetched_at = item
+        record = self.extractor._add_additional_features_transaction_data(shoe)
+        if record is None:
+            return None
+        return record, fetched_at
+
+    def _save_records(self, records):
+        self.extractor.feature_store.save_records(records)
+        self.extractor.feature_records.update((record["shoe"], record) for record in records)
+
+    def _feed(self, skus, queue):
+        for sku in skus:
+            queue.put(sku)
+        for _ in range(self.processes["fetch"]):
+            queue.put(None)
+
+    def _close_stages(self, workers, queues, results):
+        """
+        Once every worker of a stage is done, tells the workers of the next stage there is nothing more coming, and
+        the consumer of the results once the last stage is done
+        """
+        for i, stage_workers in enumerate(workers):
+            for worker in stage_workers:
+                worker.join()
+            if i + 1 < len(workers):
+                for _ in workers[i + 1]:
+                    queues[i + 1].put(None)
+        results.put(None)
+
+def _run_stage_worker(name, function, metrics, input_queue, output_queue, results):
+    """
+    Worker process of a stage: calls function on every item of the input queue until it gets None and puts what it
+    returns (if not None) on the output queue, which blocks while the next stage is behind. Errors are printed and the
+    item dropped. Sends the metrics it recorded to the results queue at the end
+    """
+    #forked with whatever the parent had recorded so far
+    metrics.pop_snapshot()
+    for item in iter(input_queue.get, None):
+        try:
+            with timed(metrics, "pipeline." + name):
+                result = function(item)
+        except Exception as e:
+            metrics.increment("failures", "pipeline." + name, type(e).__name__)
+            print("Pipeline stage {} failed on {}: {}".format(name, item, traceback.format_exc(limit=2).strip().splitlines()[-1]))
+            continue
+        if result is not None:
+            output_queue.put(result)
+    results.put(("metrics", metrics.pop_snapshot()))
+
+if __name__ == '__main__':
+    #adidas, nike, retro-jordans, other-sneakers
+    brand = "adidas"
+    pipeline = StockXPipeline(StockXScraper(brand), incremental=True)
+
+    #pipeline.run()
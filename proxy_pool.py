@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+import time
+from random import choices
+from multiprocessing.managers import BaseManager
+
+class ProxyPool:
+    """
+    Keeps health stats for every proxy (success rate, latency and consecutive failures), quarantines proxies that keep
+    failing with an exponential backoff, evicts the ones that never recover and picks proxies weighted towards the fast
+    and reliable ones
+    """
+    def __init__(self, proxies, stats_file=None, max_consecutive_failures=3, quarantine_seconds=30, max_quarantine_seconds=3600, max_quarantines=5):
+        self.stats_file = stats_file
+        self.max_consecutive_failures = max_consecutive_failures
+        self.quarantine_seconds = quarantine_seconds
+        self.max_quarantine_seconds = max_quarantine_seconds
+        self.max_quarantines = max_quarantines
+        self.lock = threading.Lock()
+        self.proxy_stats = {proxy: self._new_stats() for proxy in proxies}
+        if stats_file is not None and os.path.exists(stats_file):
+            self._load(stats_file)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def get_proxy(self):
+        """
+        Returns a random available proxy weighted by its score. If every proxy is quarantined the one that gets
+        released first is returned and if there are no proxies left at all None is returned (direct connection)
+        """
+        with self.lock:
+            now = time.time()
+            available = [proxy for proxy, stats in self.proxy_stats.items() if not stats["evicted"] and stats["quarantined_until"] <= now]
+            if available:
+                weights = [self._score(self.proxy_stats[proxy]) for proxy in available]
+                return choices(available, weights=weights)[0]
+            quarantined = [proxy for proxy, stats in self.proxy_stats.items() if not stats["evicted"]]
+            if quarantined:
+                return min(quarantined, key=lambda proxy: self.proxy_stats[proxy]["quarantined_until"])
+            return None
+
+    def report_success(self, proxy, latency):
+        with self.lock:
+            stats = self.proxy_stats.get(proxy)
+            if stats is None:
+                return
+            stats["successes"] += 1
+            stats["consecutive_failures"] = 0
+            stats["quarantine_count"] = 0
+            stats["latency"] = latency if stats["latency"] is None else 0.8 * stats["latency"] + 0.2 * latency
+
+    def report_failure(self, proxy):
+        with self.lock:
+            stats = self.proxy_stats.get(proxy)
+            if stats is None:
+                return
+            stats["failures"] += 1
+            stats["consecutive_failures"] += 1
+            if stats["consecutive_failures"] >= self.max_consecutive_failures:
+                stats["consecutive_failures"] = 0
+                stats["quarantine_count"] += 1
+                if stats["quarantine_count"] > self.max_quarantines:
+                    stats["evicted"] = True
+                else:
+                    backoff = min(self.max_quarantine_seconds, self.quarantine_seconds * 2 ** (stats["quarantine_count"] - 1))
+                    stats["quarantined_until"] = time.time() + backoff
+
+    def add_proxies(self, proxies):
+        with self.lock:
+            for proxy in proxies:
+                if proxy not in self.proxy_stats:
+                    self.proxy_stats[proxy] = self._new_stats()
+
+    def get_stats(self):
+        """
+        Returns a dict with the stats of every proxy plus its success rate and current state
+        """
+        with self.lock:
+            now = time.time()
+            stats = {}
+            for proxy, proxy_stats in self.proxy_stats.items():
+                requests = proxy_stats["successes"] + proxy_stats["failures"]
+                stats[proxy] = dict(proxy_stats)
+                stats[proxy]["success_rate"] = proxy_stats["successes"] / requests if requests else None
+                stats[proxy]["state"] = self._get_state(proxy_stats, now)
+            return stats
+
+    def get_summary(self):
+        stats = self.get_stats()
+        summary = {"active": 0, "quarantined": 0, "evicted": 0}
+        for proxy_stats in stats.values():
+            summary[proxy_stats["state"]] += 1
+        summary["successes"] = sum(proxy_stats["successes"] for proxy_stats in stats.values())
+        summary["failures"] = sum(proxy_stats["failures"] for proxy_stats in stats.values())
+        requests = summary["successes"] + summary["failures"]
+        summary["success_rate"] = summary["successes"] / requests if requests else None
+        return summary
+
+    def get_proxy_stats(self):
+        with self.lock:
+            return {proxy: dict(stats) for proxy, stats in self.proxy_stats.items()}
+
+    def update_proxy_stats(self, proxy_stats):
+        with self.lock:
+            self.proxy_stats.update(proxy_stats)
+
+    def save(self, file_name=None):
+        file_name = file_name or self.stats_file
+        with open(file_name, 'w') as f:
+            json.dump(self.get_proxy_stats(), f)
+
+    def _load(self, file_name):
+        """
+        Restores the stats that a previous run saved for the proxies in the current list. The stats of proxies that are
+        no longer in the list are dropped (they are usually dead free proxies), so the next save leaves them out
+        """
+        with open(file_name) as f:
+            saved_stats = json.load(f)
+        for proxy, stats in saved_stats.items():
+            if proxy in self.proxy_stats:
+                self.proxy_stats[proxy] = stats
+
+    def _new_stats(self):
+        return {"successes": 0, "failures": 0, "consecutive_failures": 0, "latency": None, "quarantined_until": 0, "quarantine_count": 0, "evicted": False}
+
+    def _score(self, stats):
+        #success rate with one imaginary success and failure so new proxies still get tried
+        success_rate = (stats["successes"] + 1) / (stats["successes"] + stats["failures"] + 2)
+        latency = stats["latency"] if stats["latency"] is not None else 1.0
+        return success_rate / max(latency, 0.01)
+
+    def _get_state(self, stats, now):
+        if stats["evicted"]:
+            return "evicted"
+        if stats["quarantined_until"] > now:
+            return "quarantined"
+        return "active"
+
+class ProxyPoolManager(BaseManager):
+    """
+    Serves a single ProxyPool from a manager process so every worker in a multiprocessing Pool reports to the same stats
+    """
+    pass
+
+ProxyPoolManager.register("ProxyPool", ProxyPool)
@@ -0,0 +1,239 @@
+import fcntl
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+
+class JsonFileStore:
+    """
+    Raw scraped JSON as one file per key (shoe_info/<brand>/<sku>.json, shoe_transactions/<brand>/<sku>.json), the
+    layout the scraper has always used
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def put(self, key, data):
+        """
+        Stores the data of the key and returns the name of the file it was written to
+        """
+        file_name = self._get_file_name(key)
+        #written to a temporary file first so an interrupted write never leaves half a JSON file behind
+        temp_file_name = "{}.{}.{}.tmp".format(file_name, os.getpid(), threading.get_ident())
+        with open(temp_file_name, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp_file_name, file_name)
+        return file_name
+
+    def get(self, key):
+        with open(self._get_file_name(key)) as f:
+            return json.load(f)
+
+    def open(self, key):
+        return open(self._get_file_name(key), 'rb')
+
+    def keys(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return [file_name[:-len(".json")] for file_name in os.listdir(self.directory) if file_name.endswith(".json")]
+
+    def get_hash(self, key):
+        sha1 = hashlib.sha1()
+        with self.open(key) as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha1.update(chunk)
+        return sha1.hexdigest()
+
+    def __contains__(self, key):
+        return os.path.exists(self._get_file_name(key))
+
+    def _get_file_name(self, key):
+        return os.path.join(self.directory, "{}.json".format(key))
+
+class SegmentStore:
+    """
+    Raw scraped JSON as zlib compressed records appended to a few segment files, with a SQLite index of key -> content
+    hash -> (segment, offset, length). Identical payloads are stored once. A record is fsynced before it is added to the
+    index, so a write that gets killed halfway leaves at most some unreferenced bytes at the end of a segment, never a
+    key pointing at half a record. Several processes can write to the same store
+    """
+    RECORD_HEADER = struct.Struct(">4sIII") #magic, compressed length, crc32 of the compressed payload, raw length
+    MAGIC = b"SXR1"
+
+    def __init__(self, directory, max_segment_size=256 * 1024 * 1024, compression_level=6):
+        self.directory = directory
+        self.max_segment_size = max_segment_size
+        self.compression_level = compression_level
+        self.connections = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["connections"] = {}
+        return state
+
+    def put(self, key, data):
+        """
+        Stores the data of the key and returns a name for where it went, like JsonFileStore.put
+        """
+        payload = json.dumps(data).encode()
+        content_hash = hashlib.sha1(payload).hexdigest()
+        connection = self._get_connection()
+        if connection.execute("SELECT 1 FROM blobs WHERE hash = ?", (content_hash,)).fetchone() is None:
+            segment, offset, length = self._append_record(payload)
+            with connection:
+                connection.execute("INSERT OR IGNORE INTO blobs (hash, segment, offset, length, raw_length) VALUES (?, ?, ?, ?, ?)",
+                    (content_hash, segment, offset, length, len(payload)))
+        with connection:
+            connection.execute("INSERT OR REPLACE INTO keys (key, hash, updated_at) VALUES (?, ?, ?)", (key, content_hash, time.time()))
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        with self.open(key) as f:
+            return json.load(f)
+
+    def open(self, key):
+        """
+        Returns a binary file object that decompresses the record of the key while it is read (for ijson)
+        """
+        segment, offset, length = self._get_location(key)
+        return io.BufferedReader(_RecordReader(self._get_segment_file_name(segment), offset, length), buffer_size=1 << 16)
+
+    def keys(self):
+        return [row[0] for row in self._get_connection().execute("SELECT key FROM keys")]
+
+    def get_hash(self, key):
+        row = self._get_connection().execute("SELECT hash FROM keys WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row[0]
+
+    def __contains__(self, key):
+        return self._get_connection().execute("SELECT 1 FROM keys WHERE key = ?", (key,)).fetchone() is not None
+
+    def import_from(self, store):
+        """
+        Copies every key of another store (e.g. the JsonFileStore of the same directory) that isn't in this one yet
+        """
+        existing_keys = set(self.keys())
+        imported = 0
+        for key in store.keys():
+            if key not in existing_keys:
+                self.put(key, store.get(key))
+                imported += 1
+        return imported
+
+    def get_summary(self):
+        keys, blobs, length, raw_length = self._get_connection().execute(
+            "SELECT (SELECT COUNT(*) FROM keys), COUNT(*), COALESCE(SUM(length), 0), COALESCE(SUM(raw_length), 0) FROM blobs").fetchone()
+        return {"keys": keys, "blobs": blobs, "bytes": length, "raw_bytes": raw_length, "segments": len(self._list_segments())}
+
+    def _append_record(self, payload):
+        compressed = zlib.compress(payload, self.compression_level)
+        record = self.RECORD_HEADER.pack(self.MAGIC, len(compressed), zlib.crc32(compressed), len(payload)) + compressed
+        with open(os.path.join(self.directory, ".lock"), 'w') as lock_file:
+            #one appender at a time across processes
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            segments = self._list_segments()
+            segment = segments[-1] if segments else 1
+            file_name = self._get_segment_file_name(segment)
+            if os.path.exists(file_name) and os.path.getsize(file_name) + len(record) > self.max_segment_size:
+                segment += 1
+                file_name = self._get_segment_file_name(segment)
+            with open(file_name, 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(record)
+                f.flush()
+                os.fsync(f.fileno())
+        return segment, offset, len(record)
+
+    def _get_location(self, key):
+        row = self._get_connection().execute(
+            "SELECT blobs.segment, blobs.offset, blobs.length FROM keys JOIN blobs ON keys.hash = blobs.hash WHERE keys.key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row
+
+    def _list_segments(self):
+        return sorted(int(file_name[len("segment-"):-len(".seg")]) for file_name in os.listdir(self.directory)
+            if file_name.startswith("segment-") and file_name.endswith(".seg"))
+
+    def _get_segment_file_name(self, segment):
+        return os.path.join(self.directory, "segment-{:06d}.seg".format(segment))
+
+    def _get_connection(self):
+        #sqlite connections can't be shared with forked worker processes or other threads (a served store is called from
+        #one thread per client) so each opens its own
+        owner = (os.getpid(), threading.get_ident())
+        if owner not in self.connections:
+            os.makedirs(self.directory, exist_ok=True)
+            connection = sqlite3.connect(os.path.join(self.directory, "index.db"), timeout=60)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY, segment INTEGER NOT NULL, offset INTEGER NOT NULL, length INTEGER NOT NULL, raw_length INTEGER NOT NULL)""")
+            connection.execute("CREATE TABLE IF NOT EXISTS keys (key TEXT PRIMARY KEY, hash TEXT NOT NULL, updated_at REAL NOT NULL)")
+            connection.commit()
+            self.connections[owner] = connection
+        return self.connections[owner]
+
+class _RecordReader(io.RawIOBase):
+    """
+    Reads one record of a segment file and returns its decompressed payload, checking the header and crc32 first
+    """
+    def __init__(self, file_name, offset, length):
+        self.file = open(file_name, 'rb')
+        self.file.seek(offset)
+        header = self.file.read(SegmentStore.RECORD_HEADER.size)
+        magic, compressed_length, crc, _ = SegmentStore.RECORD_HEADER.unpack(header)
+        if magic != SegmentStore.MAGIC or compressed_length != length - SegmentStore.RECORD_HEADER.size:
+            self.file.close()
+            raise ValueError("Corrupt record at {}:{}".format(file_name, offset))
+        self.remaining = compressed_length
+        self.crc = crc
+        self.running_crc = 0
+        self.decompressor = zlib.decompressobj()
+        self.buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.buffer and (self.remaining or not self.decompressor.eof):
+            chunk = self.file.read(min(self.remaining, 1 << 16))
+            self.remaining -= len(chunk)
+            self.running_crc = zlib.crc32(chunk, self.running_crc)
+            if not self.remaining and self.running_crc != self.crc:
+                raise ValueError("Corrupt record in {}".format(self.file.name))
+            self.buffer = self.decompressor.decompress(chunk) if chunk else self.decompressor.flush()
+            if not chunk:
+                break
+        size = min(len(buffer), len(self.buffer))
+        buffer[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+def get_raw_store(brand, kind, backend="files"):
+    """
+    The store of the "shoe_info" or "shoe_transactions" JSON of a brand: "files" for the shoe_info/<brand>/ and
+    shoe_transactions/<brand>/ directories, "segments" for a SegmentStore in raw_store/<brand>/<kind>/
+    """
+    if backend == "segments":
+        return SegmentStore("raw_store/{}/{}/".format(brand, kind))
+    if backend == "files":
+        return JsonFileStore("{}/{}/".format(kind, brand))
+    raise ValueError("Unknown raw storage backend {}".format(backend))
+
+if __name__ == '__main__':
+    #adidas, nike, retro-jordans, other-sneakers
+    brand = "adidas"
+    for kind in ["shoe_info", "shoe_transactions"]:
+        segment_store = get_raw_store(brand, kind, "segments")
+        imported = segment_store.import_from(get_raw_store(brand, kind, "files"))
+        print("Imported {} {} files into {}: {}".format(imported, kind, segment_store.directory, segment_store.get_summary()))
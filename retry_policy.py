@@ -0,0 +1,285 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing.managers import BaseManager
+import requests
+
+class RetryError(Exception):
+    """
+    Raised by RetryPolicy.call when it gives up, with the error class and the error of the last attempt
+    """
+    def __init__(self, stage, attempts, error_class, error):
+        super().__init__("{} gave up after {} attempts, last error: {} ({!r})".format(stage, attempts, error_class, error))
+        self.stage = stage
+        self.attempts = attempts
+        self.error_class = error_class
+        self.error = error
+
+class CircuitBreaker:
+    """
+    Stops every worker from making requests for a while once the site keeps rate limiting. Opens after
+    failure_threshold rate limited responses within window seconds, lets a single probe request through after the
+    cooldown and closes again if it succeeds or opens for twice as long if it doesn't
+    """
+    def __init__(self, failure_threshold=5, window=30, cooldown=30, max_cooldown=600, probe_timeout=60):
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.probe_timeout = probe_timeout
+        self.lock = threading.Lock()
+        self.state = "closed"
+        self.failures = []
+        self.open_count = 0
+        self.opened_until = 0
+        self.probe_started_at = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def get_wait(self):
+        """
+        Returns how many seconds the caller should wait before asking again, 0 if it can make its request now
+        """
+        with self.lock:
+            now = time.time()
+            if self.state == "open":
+                if now < self.opened_until:
+                    return self.opened_until - now
+                self.state = "half_open"
+                self.probe_started_at = now
+                return 0
+            if self.state == "half_open":
+                if now - self.probe_started_at > self.probe_timeout:
+                    #the probe never reported back (its worker died), send another one
+                    self.probe_started_at = now
+                    return 0
+                return min(0.2, self.probe_timeout - (now - self.probe_started_at))
+            return 0
+
+    def record_success(self):
+        """
+        Records an attempt that wasn't rate limited (even if it failed otherwise)
+        """
+        with self.lock:
+            if self.state == "half_open":
+                self.state = "closed"
+                self.open_count = 0
+                self.failures = []
+
+    def record_failure(self):
+        """
+        Records a rate limited response and returns True if that opened the breaker
+        """
+        with self.lock:
+            now = time.time()
+            if self.state == "half_open":
+                self._open(now)
+                return True
+            if self.state == "open":
+                return False
+            self.failures = [failed_at for failed_at in self.failures if now - failed_at <= self.window] + [now]
+            if len(self.failures) >= self.failure_threshold:
+                self._open(now)
+                return True
+            return False
+
+    def get_state(self):
+        with self.lock:
+            return self.state
+
+    def _open(self, now):
+        self.open_count += 1
+        self.state = "open"
+        self.opened_until = now + min(self.max_cooldown, self.cooldown * 2 ** (self.open_count - 1))
+        self.failures = []
+
+class RetryBudget:
+    """
+    Caps retries at a fraction of the requests of each stage: every first attempt adds `ratio` tokens (up to
+    max_tokens) and every retry takes one, so when a stage mostly fails it stops hammering the site instead of
+    multiplying its load by the number of attempts
+    """
+    def __init__(self, ratio=0.5, min_tokens=20, max_tokens=500):
+        self.ratio = ratio
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.lock = threading.Lock()
+        self.tokens = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def record_request(self, stage):
+        with self.lock:
+            self.tokens[stage] = min(self.max_tokens, self.tokens.get(stage, self.min_tokens) + self.ratio)
+
+    def try_spend(self, stage):
+        with self.lock:
+            tokens = self.tokens.get(stage, self.min_tokens)
+            if tokens < 1:
+                return False
+            self.tokens[stage] = tokens - 1
+            return True
+
+    def get_tokens(self):
+        with self.lock:
+            return dict(self.tokens)
+
+class RetryPolicy:
+    """
+    Decides per error class whether and when a failed request is retried. Delays grow exponentially per attempt from
+    the base delay of the error class with full jitter (a random delay between 0 and the backoff) so workers that
+    failed together don't retry together, and a Retry-After header of the response is honored. Rate limited responses
+    feed the circuit breaker and every retry has to fit in the retry budget of its stage
+    """
+    #retry: whether the error class is retried at all, max_attempts: attempts including the first one
+    DEFAULT_RULES = {
+        "rate_limited": {"retry": True, "base_delay": 5.0, "max_delay": 120.0, "max_attempts": 6},
+        "blocked": {"retry": True, "base_delay": 0.1, "max_delay": 2.0, "max_attempts": 10}, #403/407, the next attempt gets another proxy
+        "server_error": {"retry": True, "base_delay": 1.0, "max_delay": 30.0, "max_attempts": 5},
+        "timeout": {"retry": True, "base_delay": 0.5, "max_delay": 10.0, "max_attempts": 5},
+        "connection": {"retry": True, "base_delay": 0.1, "max_delay": 2.0, "max_attempts": 10}, #mostly dead proxies
+        "parse": {"retry": True, "base_delay": 1.0, "max_delay": 5.0, "max_attempts": 3}, #captcha or truncated pages
+        "not_found": {"retry": False},
+        "client_error": {"retry": False},
+    }
+
+    def __init__(self, rules=None, timeout=(5, 30), breaker=None, budget=None):
+        self.rules = {error_class: dict(rule) for error_class, rule in self.DEFAULT_RULES.items()}
+        for error_class, rule in (rules or {}).items():
+            self.rules.setdefault(error_class, {}).update(rule)
+        #(connect, read) timeout in seconds for requests
+        self.timeout = timeout
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.budget = budget if budget is not None else RetryBudget()
+
+    def call(self, stage, function, metrics=None):
+        """
+        Calls function until it returns without raising and returns its result. An error is retried after the delay
+        of its class unless its class isn't retried, it ran out of attempts or the retry budget of the stage is spent,
+        in which case a RetryError is raised. Waits while the circuit breaker is open before every attempt
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            self._wait_for_breaker(stage, metrics)
+            if attempt == 1:
+                self.budget.record_request(stage)
+            try:
+                result = function()
+            except Exception as e:
+                error_class = self.classify(e)
+                if error_class != "rate_limited":
+                    self.breaker.record_success()
+                elif self.breaker.record_failure() and metrics is not None:
+                    metrics.increment("breaker_opens", stage)
+                delay = self.get_delay(error_class, attempt, self._get_retry_after(e))
+                #giving up is counted by the caller as a failure, not as a retry
+                if delay is None or not self.budget.try_spend(stage):
+                    raise RetryError(stage, attempt, error_class, e) from e
+                if metrics is not None:
+                    metrics.increment("retries", stage, self._describe(e))
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    def classify(self, error):
+        if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+            return self.classify_status(error.response.status_code)
+        if isinstance(error, requests.exceptions.Timeout):
+            return "timeout"
+        if isinstance(error, requests.exceptions.ConnectionError):
+            return "connection"
+        #anything else went wrong reading the page or the JSON
+        return "parse"
+
+    def classify_status(self, status_code):
+        if status_code == 429:
+            return "rate_limited"
+        if status_code in [403, 407]:
+            return "blocked"
+        if status_code >= 500:
+            return "server_error"
+        if status_code in [404, 410]:
+            return "not_found"
+        return "client_error"
+
+    def get_delay(self, error_class, attempt, retry_after=None):
+        """
+        Returns the seconds to wait before the next attempt after `attempt` attempts failed with the error class, or
+        None if it shouldn't be retried
+        """
+        rule = self.rules[error_class]
+        if not rule["retry"] or attempt >= rule["max_attempts"]:
+            return None
+        backoff = min(rule["max_delay"], rule["base_delay"] * 2 ** (attempt - 1))
+        delay = random.uniform(0, backoff)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, rule["max_delay"]))
+        return delay
+
+    def _wait_for_breaker(self, stage, metrics):
+        wait = self.breaker.get_wait()
+        while wait > 0:
+            if metrics is not None:
+                metrics.observe(stage + ".breaker_wait", wait)
+            time.sleep(wait)
+            wait = self.breaker.get_wait()
+
+    def _get_retry_after(self, error):
+        response = getattr(error, "response", None)
+        if response is None:
+            return None
+        try:
+            return float(response.headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            #missing or an HTTP date, the backoff is used instead
+            return None
+
+    def _describe(self, error):
+        if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+            return "HTTP {}".format(error.response.status_code)
+        return type(error).__name__
+
+class RetryStateManager(BaseManager):
+    """
+    Serves a single CircuitBreaker and RetryBudget from a manager process so every worker in a multiprocessing Pool
+    backs off together
+    """
+    pass
+
+RetryStateManager.register("CircuitBreaker", CircuitBreaker)
+RetryStateManager.register("RetryBudget", RetryBudget)
+
+@contextmanager
+def shared_retry_state(retry_policy):
+    """
+    Replaces the circuit breaker and retry budget of the retry policy with ones served by a manager process for the
+    duration of the block, then puts the local ones back with the tokens the workers left in the budget
+    """
+    local_breaker, local_budget = retry_policy.breaker, retry_policy.budget
+    with RetryStateManager() as manager:
+        retry_policy.breaker = manager.CircuitBreaker(local_breaker.failure_threshold, local_breaker.window, local_breaker.cooldown,
+            local_breaker.max_cooldown, local_breaker.probe_timeout)
+        retry_policy.budget = manager.RetryBudget(local_budget.ratio, local_budget.min_tokens, local_budget.max_tokens)
+        try:
+            yield retry_policy
+        finally:
+            local_budget.tokens.update(retry_policy.budget.get_tokens())
+            retry_policy.breaker = local_breaker
+            retry_policy.budget = local_budget
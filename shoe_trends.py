@@ -1,9 +1,9 @@
 import os
+from datetime import date
 import pandas as pd
-import pytrends.dailydata
-import pytrends.request
 from bs4 import BeautifulSoup
 import requests
+from trends_fetcher import PyTrendsBackend, TrendsFetcher
 
 def _get_proxies():
         """
@@ -30,18 +30,16 @@ def get_release_month_and_year_per_shoe_model_as_dict(df):
     min_df = min_df.fillna(0)
     return min_df.to_dict()
 
-def get_evaluated_shoe_models():
-    path = "shoe_data/shoe_trends/{}/".format(brand)
-    return [i for i in os.listdir(path)]
-
 if __name__ == '__main__':
-    pytrend = pytrends.request.TrendReq(retries=5, timeout=(100,100), proxies=_get_proxies())
+    #months that were fetched before come from shoe_data/trends_cache so only the new months are requested
+    fetcher = TrendsFetcher(PyTrendsBackend(retries=5, timeout=(100,100), proxies=_get_proxies()), rate=1.0, max_workers=4)
     brand = "adidas"  
+    today = date.today()
+    os.makedirs("shoe_data/shoe_trends/{}/".format(brand), exist_ok=True)
     info_df = pd.read_csv("shoe_data/{}_shoe_info.csv".format(brand))
     shoe_models_df = info_df[["model", "release_year", "release_month"]]
     
     min_dict = get_release_month_and_year_per_shoe_model_as_dict(shoe_models_df)
-    evaluated_shoe_models = get_evaluated_shoe_models()
 
     for index in min_dict['model']:
         model = min_dict['model'][index]
@@ -50,15 +48,11 @@ if __name__ == '__main__':
         keyword = brand + " " + model
         file_name = model.replace(" ", "-") + ".csv"
 
-        if file_name not in evaluated_shoe_models:
-            if release_year != 0 and release_month != 0:
-                daily_data_df = pytrends.dailydata.get_daily_data(word=keyword, start_year=release_year, start_mon=release_month, stop_year=2019, stop_mon=12, pytrends=pytrend)
-                daily_data_df = daily_data_df.reset_index()
-                
-                daily_data_df.to_csv("shoe_data/shoe_trends/{}/{}".format(brand, file_name))
-            else:
-                print(model + " has no listed release date")
+        if release_year != 0 and release_month != 0:
+            daily_data_df = fetcher.get_daily_data(keyword, release_year, release_month, today.year, today.month)
+            daily_data_df = daily_data_df.reset_index()
+            
+            daily_data_df.to_csv("shoe_data/shoe_trends/{}/{}".format(brand, file_name))
         else:
-            print(model + " has already been evaluated")
-
-    
\ No newline at end of file
+            print(model + " has no listed release date")
+    print("{} requests, {} cached months".format(fetcher.request_count, fetcher.cache_hits))
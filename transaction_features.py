@@ -0,0 +1,136 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+class TransactionFeatureBuilder:
+    """
+    Vectorized per transaction features of one shoe: rolling average prices over the last N transactions
+    (count_windows) and over a time span (time_windows, e.g. "7D"), the same per shoe size (size_count_windows and
+    size_time_windows), the average price and amount of transactions per day and per day and size, and the days since
+    release. createdAt is parsed once and every rolling window is computed from cumulative sums over the transactions
+    sorted by time instead of a pandas rolling object per window and size
+    """
+    #every numeric column add_features adds starts with one of these (days_since_release can be "N/A")
+    NUMERIC_COLUMN_PREFIXES = ("average_price_per_day", "transactions_per_day", "rolling_average_price_", "rolling_transactions_", "days_since_release")
+
+    def __init__(self, count_windows=(10,), time_windows=("7D", "30D"), size_count_windows=(10,), size_time_windows=("30D",)):
+        self.count_windows = list(count_windows)
+        self.time_windows = list(time_windows)
+        self.size_count_windows = list(size_count_windows)
+        self.size_time_windows = list(size_time_windows)
+
+    def get_version(self):
+        """
+        Short string that changes whenever the windows do, for the feature version of the feature store
+        """
+        windows = self.count_windows + self.time_windows + ["s{}".format(window) for window in self.size_count_windows + self.size_time_windows]
+        return "-".join(str(window) for window in windows)
+
+    def parse_created_at(self, created_at):
+        """
+        Returns createdAt as a timezone naive (UTC) datetime64 Series
+        """
+        if not pd.api.types.is_datetime64_any_dtype(created_at):
+            created_at = pd.to_datetime(created_at, utc=True, format="ISO8601")
+        if created_at.dt.tz is not None:
+            created_at = created_at.dt.tz_convert("UTC").dt.tz_localize(None)
+        return created_at
+
+    def add_features(self, shoe_transaction_df, release_date=None, created_at=None):
+        """
+        Adds every feature column to shoe_transaction_df in place. created_at can be passed if it was already parsed
+        """
+        if created_at is None:
+            created_at = self.parse_created_at(shoe_transaction_df["createdAt"])
+        seconds = created_at.values.astype("datetime64[s]").astype(np.int64)
+        days = seconds // 86400
+        amounts = shoe_transaction_df["amount"].to_numpy(dtype=float)
+        size_codes = pd.factorize(shoe_transaction_df["shoeSize"], use_na_sentinel=False)[0].astype(np.int64)
+        shoe_order = self._sort_by_group_and_time(np.zeros(len(amounts), dtype=np.int64), seconds)
+        size_order = self._sort_by_group_and_time(size_codes, seconds)
+
+        daily_amounts = pd.Series(amounts, index=shoe_transaction_df.index).groupby(days)
+        shoe_transaction_df["average_price_per_day"] = daily_amounts.transform("mean")
+        shoe_transaction_df["transactions_per_day"] = daily_amounts.transform("size")
+        daily_size_amounts = pd.Series(amounts, index=shoe_transaction_df.index).groupby([size_codes, days])
+        shoe_transaction_df["average_price_per_day_size"] = daily_size_amounts.transform("mean")
+        shoe_transaction_df["transactions_per_day_size"] = daily_size_amounts.transform("size")
+
+        for window in self.count_windows:
+            shoe_transaction_df["rolling_average_price_{}".format(window)] = self._rolling_mean(shoe_order, amounts, window)[0]
+        for window in self.time_windows:
+            means, counts = self._rolling_mean(shoe_order, amounts, window)
+            shoe_transaction_df["rolling_average_price_{}".format(window.lower())] = means
+            shoe_transaction_df["rolling_transactions_{}".format(window.lower())] = counts
+        for window in self.size_count_windows:
+            shoe_transaction_df["rolling_average_price_size_{}".format(window)] = self._rolling_mean(size_order, amounts, window)[0]
+        for window in self.size_time_windows:
+            means, counts = self._rolling_mean(size_order, amounts, window)
+            shoe_transaction_df["rolling_average_price_size_{}".format(window.lower())] = means
+            shoe_transaction_df["rolling_transactions_size_{}".format(window.lower())] = counts
+
+        if release_date is None:
+            shoe_transaction_df["days_since_release"] = "N/A"
+        else:
+            self.add_days_since_release(shoe_transaction_df, release_date, created_at)
+
+    def add_days_since_release(self, shoe_transaction_df, release_date, created_at=None):
+        """
+        Adds the whole days between the release date (YYYY-MM-DD) and each transaction, or N/A if the release date
+        isn't a date (e.g. --). Returns the parsed release date or None
+        """
+        try:
+            release_date = datetime.strptime(release_date, "%Y-%m-%d")
+        except ValueError:
+            shoe_transaction_df["days_since_release"] = "N/A"
+            return None
+        if created_at is None:
+            created_at = self.parse_created_at(shoe_transaction_df["createdAt"])
+        #floor division like timedelta.days, so a sale 1 hour before release is day -1
+        shoe_transaction_df["days_since_release"] = (created_at - release_date) // pd.Timedelta(days=1)
+        return release_date
+
+    def _sort_by_group_and_time(self, group_codes, seconds):
+        """
+        Row order sorted by group then time (then position) with the sorted groups, times and the start of every group,
+        shared by all the windows of a grouping
+        """
+        order = np.lexsort((np.arange(len(seconds)), seconds, group_codes))
+        groups = group_codes[order]
+        return order, groups, seconds[order], np.searchsorted(groups, groups, side="left")
+
+    def _rolling_mean(self, sorted_groups, amounts, window):
+        """
+        Rolling mean and amount of prices per group over the last window transactions (int, needs window prices like
+        pandas rolling) or the window time span (string, transactions in (t - window, t]). Returns both in the original
+        row order
+        """
+        order, groups, times, group_starts = sorted_groups
+        row_count = len(amounts)
+        valid = ~np.isnan(amounts[order])
+        sums = np.concatenate([[0.0], np.cumsum(np.where(valid, amounts[order], 0.0))])
+        valid_counts = np.concatenate([[0], np.cumsum(valid)])
+        positions = np.arange(row_count)
+
+        if isinstance(window, (int, np.integer)):
+            left = np.maximum(positions - window + 1, group_starts)
+            min_count = window
+        else:
+            window_seconds = int(pd.Timedelta(window).total_seconds())
+            first_time = times.min() if row_count else 0
+            span = int(times.max() - first_time) + window_seconds + 1 if row_count else 1
+            #(group, time) as a single sorted key so one searchsorted finds every window start
+            keys = groups * span + (times - first_time)
+            left = np.searchsorted(keys, keys - window_seconds, side="right")
+            min_count = 1
+
+        counts = valid_counts[positions + 1] - valid_counts[left]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = (sums[positions + 1] - sums[left]) / counts
+        means[counts < min_count] = np.nan
+
+        result_means = np.empty(row_count)
+        result_means[order] = means
+        result_counts = np.empty(row_count, dtype=np.int64)
+        result_counts[order] = counts
+        return result_means, result_counts
@@ -0,0 +1,205 @@
+import sqlite3
+import time
+import numpy as np
+import pandas as pd
+from catalog_index import ShoeCatalogIndex
+from feature_extractor import StockXFeatureExtractor
+
+class StockXTransactionStore:
+    """
+    SQLite copy of the formatted transactions of every brand, indexed by sku, shoe size, date, brand and model, plus a
+    table of pre-aggregated daily price bars. Lets model.py and shoe_trends.py read a single SKU/size slice or a date
+    range without loading whole CSV files
+    """
+    def __init__(self, db_file="shoe_data/transactions.db"):
+        self.db_file = db_file
+        self.indexes = [
+            ("transactions_sku", "transactions", "sku, shoe_size, created_at"),
+            ("transactions_link_name", "transactions", "link_name, shoe_size, created_at"),
+            ("transactions_brand_model", "transactions", "brand, model, created_at"),
+            ("transactions_created_at", "transactions", "created_at"),
+            ("daily_bars_sku", "daily_bars", "sku, shoe_size, day"),
+            ("daily_bars_link_name", "daily_bars", "link_name, shoe_size, day"),
+            ("daily_bars_brand_model", "daily_bars", "brand, model, day"),
+        ]
+        self.connection = sqlite3.connect(db_file)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self._create_tables()
+
+    def load_brand(self, brand, transactions_format="csv", batch_size=200000):
+        """
+        Replaces the transactions and daily bars of the brand with the per shoe files in shoe_data. Shoes are inserted
+        in batches of about batch_size rows so memory stays bounded
+        """
+        start = time.perf_counter()
+        extractor = StockXFeatureExtractor(brand, transactions_format=transactions_format)
+        catalog = ShoeCatalogIndex(brand)
+        row_count = 0
+        batch, batch_rows = [], 0
+        with self.connection:
+            #rebuilding the indexes once at the end is a lot faster than updating them on every insert
+            self._drop_indexes()
+            self.connection.execute("DELETE FROM transactions WHERE brand = ?", (brand,))
+            self.connection.execute("DELETE FROM daily_bars WHERE brand = ?", (brand,))
+            for shoe in extractor._get_shoe_name_list():
+                try:
+                    shoe_transaction_df = extractor._read_shoe_transactions(extractor._get_transactions_file_name(shoe))
+                    batch.append(self._to_transactions_df(brand, shoe_transaction_df, catalog))
+                except Exception as e:
+                    print("Unable to load {}: {!r}".format(shoe, e))
+                    continue
+                batch_rows += len(batch[-1])
+                if batch_rows >= batch_size:
+                    row_count += self._insert_batch(batch)
+                    batch, batch_rows = [], 0
+            row_count += self._insert_batch(batch)
+            self._create_indexes()
+        self.connection.execute("ANALYZE")
+        print("Loaded {} transactions for {} in {:.1f}s".format(row_count, brand, time.perf_counter() - start))
+
+    def get_transactions(self, sku=None, shoe_size=None, brand=None, model=None, link_name=None, start=None, end=None):
+        """
+        Returns the matching transactions ordered by date. start and end are anything pd.Timestamp accepts (end is
+        exclusive)
+        """
+        where, params = self._get_filters(sku, shoe_size, brand, model, link_name, start, end, "created_at")
+        query = "SELECT brand, sku, link_name, model, shoe_size AS shoeSize, amount, created_at AS createdAt, local_currency AS localCurrency FROM transactions {} ORDER BY created_at".format(where)
+        df = pd.read_sql_query(query, self.connection, params=params)
+        df["createdAt"] = pd.to_datetime(df["createdAt"], unit="s", utc=True)
+        return df
+
+    def get_price_bars(self, frequency="D", sku=None, shoe_size=None, brand=None, model=None, link_name=None, start=None, end=None):
+        """
+        Returns open/high/low/close/mean price and volume per day (frequency="D") or week (frequency="W") from the
+        pre-aggregated daily bars, over every series matching the filters
+        """
+        where, params = self._get_filters(sku, shoe_size, brand, model, link_name, start, end, "day")
+        query = "SELECT day, first_at, last_at, open, close, high, low, total, volume FROM daily_bars {}".format(where)
+        daily_bars = pd.read_sql_query(query, self.connection, params=params)
+        daily_bars["day"] = pd.to_datetime(daily_bars["day"], unit="s")
+        if frequency == "D":
+            period = daily_bars["day"]
+        elif frequency == "W":
+            period = daily_bars["day"].dt.to_period("W").dt.start_time
+        else:
+            raise ValueError("frequency must be D or W, got {}".format(frequency))
+
+        daily_bars["period"] = period
+        grouped = daily_bars.groupby("period")
+        bars = pd.DataFrame({
+            "open": daily_bars.sort_values(["period", "first_at"], kind="stable").groupby("period")["open"].first(),
+            "high": grouped["high"].max(),
+            "low": grouped["low"].min(),
+            "close": daily_bars.sort_values(["period", "last_at"], kind="stable").groupby("period")["close"].last(),
+            "volume": grouped["volume"].sum(),
+        })
+        bars["mean"] = grouped["total"].sum() / bars["volume"]
+        bars.index.name = "date"
+        return bars
+
+    def close(self):
+        self.connection.close()
+
+    def _insert_batch(self, batch):
+        if not batch:
+            return 0
+        transactions_df = pd.concat(batch, ignore_index=True)
+        self.connection.executemany("INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self._to_rows(transactions_df))
+        self.connection.executemany("INSERT INTO daily_bars VALUES ({})".format(", ".join(["?"] * 14)), self._to_rows(self._to_daily_bars_df(transactions_df)))
+        return len(transactions_df)
+
+    def _to_transactions_df(self, brand, shoe_transaction_df, catalog):
+        sku = str(shoe_transaction_df["sku"].values[0])
+        created_at = pd.to_datetime(shoe_transaction_df["createdAt"], utc=True, format="ISO8601")
+        return pd.DataFrame({
+            "brand": brand,
+            "sku": sku,
+            "link_name": shoe_transaction_df["link_name"].astype(str).values,
+            "model": catalog.get_value(sku, "model"),
+            "shoe_size": self._to_shoe_size_texts(shoe_transaction_df["shoeSize"]),
+            "amount": pd.to_numeric(shoe_transaction_df["amount"], errors="coerce").astype(float).values,
+            "created_at": ((created_at - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)).values,
+            "local_currency": shoe_transaction_df["localCurrency"].astype(str).values,
+        })
+
+    def _to_daily_bars_df(self, transactions_df):
+        transactions_df = transactions_df.sort_values("created_at", kind="stable")
+        day = transactions_df["created_at"] // 86400 * 86400
+        grouped = transactions_df.groupby(["brand", "sku", "link_name", "model", "shoe_size", day.rename("day")], dropna=False, sort=False)
+        return grouped.agg(first_at=("created_at", "min"), last_at=("created_at", "max"), open=("amount", "first"), close=("amount", "last"),
+            high=("amount", "max"), low=("amount", "min"), total=("amount", "sum"), volume=("amount", "size")).reset_index()
+
+    def _to_rows(self, df):
+        #sqlite wants None instead of NaN and python scalars instead of numpy ones
+        return list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+
+    def _get_filters(self, sku, shoe_size, brand, model, link_name, start, end, date_column):
+        conditions, params = [], []
+        for column, value in [("sku", sku), ("shoe_size", shoe_size), ("brand", brand), ("model", model), ("link_name", link_name)]:
+            if value is not None:
+                conditions.append("{} = ?".format(column))
+                params.append(self._to_shoe_size_text(value) if column == "shoe_size" else value)
+        if start is not None:
+            conditions.append("{} >= ?".format(date_column))
+            params.append(self._to_epoch(start))
+        if end is not None:
+            conditions.append("{} < ?".format(date_column))
+            params.append(self._to_epoch(end))
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        return where, params
+
+    def _to_shoe_size_texts(self, shoe_sizes):
+        codes, uniques = pd.factorize(shoe_sizes)
+        #only the distinct sizes are converted, code -1 (missing) picks the None at the end
+        return np.array([self._to_shoe_size_text(value) for value in uniques] + [None], dtype=object)[codes]
+
+    def _to_shoe_size_text(self, value):
+        """
+        Sizes are stored as text because some aren't numeric ("5.5W", "4Y", "10.5K"). pandas reads a column of numeric
+        sizes as floats, so 10.0 is stored as "10" like in the raw data and shoe_size=10 matches it
+        """
+        if pd.isna(value):
+            return None
+        if isinstance(value, (float, np.floating)) and float(value).is_integer():
+            return str(int(value))
+        return str(value)
+
+    def _to_epoch(self, value):
+        timestamp = pd.Timestamp(value)
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.tz_localize("UTC")
+        return int(timestamp.timestamp())
+
+    def _create_tables(self):
+        with self.connection:
+            #stores made when shoe_size was REAL are rebuilt by the next load_brand
+            columns = {row[1]: row[2] for row in self.connection.execute("PRAGMA table_info(transactions)")}
+            if columns.get("shoe_size") == "REAL":
+                self.connection.execute("DROP TABLE transactions")
+                self.connection.execute("DROP TABLE IF EXISTS daily_bars")
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS transactions (
+                brand TEXT NOT NULL, sku TEXT NOT NULL, link_name TEXT, model TEXT, shoe_size TEXT, amount REAL,
+                created_at INTEGER NOT NULL, local_currency TEXT)""")
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS daily_bars (
+                brand TEXT NOT NULL, sku TEXT NOT NULL, link_name TEXT, model TEXT, shoe_size TEXT, day INTEGER NOT NULL,
+                first_at INTEGER, last_at INTEGER, open REAL, close REAL, high REAL, low REAL, total REAL, volume INTEGER)""")
+            self._create_indexes()
+
+    def _create_indexes(self):
+        for name, table, columns in self.indexes:
+            self.connection.execute("CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(name, table, columns))
+
+    def _drop_indexes(self):
+        for name, table, columns in self.indexes:
+            self.connection.execute("DROP INDEX IF EXISTS {}".format(name))
+
+if __name__ == '__main__':
+    #adidas, nike, retro-jordans, other-sneakers
+    store = StockXTransactionStore()
+
+    #print("Loading transactions into the query store:")
+    #store.load_brand("adidas")
+
+    #print(store.get_transactions(link_name="adidas-zx-500-dragon-ball-z-son-goku", shoe_size=10))
+    #print(store.get_price_bars("W", link_name="adidas-zx-500-dragon-ball-z-son-goku", shoe_size=10))
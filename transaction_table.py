@@ -0,0 +1,362 @@
+import sys
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+class TransactionTable:
+    """
+    Compact in-memory transactions: sku, link_name, shoeSize and localCurrency are dictionary encoded (one small
+    integer code per row, -1 for missing, and each distinct value stored once), amount is int64 when the source amounts
+    are all integers and float64 otherwise (like pandas reads them, so no price loses precision) and createdAt is int64
+    seconds since the epoch (NaT for missing, so it can be viewed as datetime64[s] without a copy). Shoe sizes
+    are kept as their original text ("10.5", "5.5W") with a float32 view for the numeric ones. Slicing by SKU (and by
+    size once sorted with sort_by_size) returns views of the same arrays instead of copies.
+
+    The original createdAt text ("2019-11-03T01:02:03.500Z") can be kept next to the epoch seconds as an Arrow string
+    array with keep_created_at_text, and text_shoe_sizes is True when the source typed the shoe sizes as text (like the
+    formatter's Parquet files), so both can be given back the way pandas reads them from the same file
+    """
+    DICTIONARY_COLUMNS = ["sku", "link_name", "shoeSize", "localCurrency"]
+    COLUMNS = ["sku", "link_name", "amount", "createdAt", "shoeSize", "localCurrency"]
+    MISSING_TIME = np.iinfo(np.int64).min
+
+    def __init__(self, codes, dictionaries, amount, created_at, created_at_text=None, text_shoe_sizes=False):
+        #{column: array of codes}, {column: array of the distinct values as strings}
+        self.codes = codes
+        self.dictionaries = dictionaries
+        self.amount = amount
+        self.created_at = created_at
+        self.created_at_text = created_at_text
+        self.text_shoe_sizes = text_shoe_sizes
+        self.runs = {}
+        self.positions = {}
+
+    @classmethod
+    def from_activity(cls, sku, link_name, transactions):
+        """
+        Table of the ProductActivity records of one SKU as they come from the activity API
+        """
+        row_count = len(transactions)
+        codes, dictionaries = {}, {}
+        for column, value in [("sku", sku), ("link_name", link_name)]:
+            codes[column] = np.full(row_count, 0 if value is not None else -1, dtype=np.int8)
+            dictionaries[column] = np.array([str(value)] if value is not None else [], dtype=object)
+        for column in ["shoeSize", "localCurrency"]:
+            codes[column], dictionaries[column] = cls._encode([transaction.get(column) for transaction in transactions])
+        amount = cls._to_amounts(pd.to_numeric(pd.Series([transaction.get("amount") for transaction in transactions], dtype=object), errors="coerce"))
+        created_at = cls._to_epoch_seconds(pd.Series([transaction.get("createdAt") for transaction in transactions], dtype=object))
+        return cls(codes, dictionaries, amount, created_at)
+
+    @classmethod
+    def from_dataframe(cls, df, keep_created_at_text=False):
+        """
+        Table of the base columns of a transactions frame (missing columns are all missing). Categorical columns are
+        taken over without decoding them
+        """
+        codes, dictionaries = {}, {}
+        for column in cls.DICTIONARY_COLUMNS:
+            if column not in df.columns:
+                codes[column], dictionaries[column] = np.full(len(df), -1, dtype=np.int8), np.array([], dtype=object)
+            elif isinstance(df[column].dtype, pd.CategoricalDtype):
+                categories = np.array([str(value) for value in df[column].cat.categories], dtype=object)
+                codes[column] = df[column].cat.codes.to_numpy().astype(cls._get_code_dtype(len(categories)), copy=False)
+                dictionaries[column] = categories
+            else:
+                codes[column], dictionaries[column] = cls._encode(df[column])
+        if "amount" in df.columns:
+            amount = cls._to_amounts(pd.to_numeric(df["amount"], errors="coerce"))
+        else:
+            amount = np.full(len(df), np.nan)
+        created_at_text = None
+        if "createdAt" in df.columns:
+            created_at = cls._to_epoch_seconds(df["createdAt"])
+            if keep_created_at_text and not pd.api.types.is_datetime64_any_dtype(df["createdAt"]):
+                created_at_text = pa.array(df["createdAt"], type=pa.string(), from_pandas=True)
+        else:
+            created_at = np.full(len(df), cls.MISSING_TIME, dtype=np.int64)
+        text_shoe_sizes = "shoeSize" in df.columns and not pd.api.types.is_numeric_dtype(df["shoeSize"])
+        return cls(codes, dictionaries, amount, created_at, created_at_text, text_shoe_sizes)
+
+    @classmethod
+    def from_arrow(cls, table, keep_created_at_text=False, text_shoe_sizes=None):
+        """
+        Table of the base columns of a pyarrow Table (missing columns are all missing). Dictionary columns are taken
+        over without decoding them. text_shoe_sizes defaults to whether the shoeSize column is typed as text
+        """
+        codes, dictionaries = {}, {}
+        for column in cls.DICTIONARY_COLUMNS:
+            if column not in table.column_names:
+                codes[column], dictionaries[column] = np.full(table.num_rows, -1, dtype=np.int8), np.array([], dtype=object)
+                continue
+            values = table.column(column).combine_chunks()
+            if not pa.types.is_dictionary(values.type):
+                values = values.dictionary_encode()
+            dictionaries[column] = np.array([str(value) for value in values.dictionary.to_pylist()], dtype=object)
+            codes[column] = pc.fill_null(values.indices, -1).to_numpy(zero_copy_only=False).astype(cls._get_code_dtype(len(dictionaries[column])))
+        if "amount" in table.column_names:
+            amount = cls._to_amounts(table.column("amount").to_pandas())
+        else:
+            amount = np.full(table.num_rows, np.nan)
+        created_at_text = None
+        if "createdAt" not in table.column_names:
+            created_at = np.full(table.num_rows, cls.MISSING_TIME, dtype=np.int64)
+        elif pa.types.is_timestamp(table.column("createdAt").type):
+            seconds = pc.cast(pc.cast(table.column("createdAt"), pa.timestamp("s", tz="UTC")), pa.int64())
+            created_at = pc.fill_null(seconds, cls.MISSING_TIME).to_numpy()
+        else:
+            created_at = cls._to_epoch_seconds(table.column("createdAt").to_pandas())
+            if keep_created_at_text:
+                created_at_text = pc.cast(table.column("createdAt").combine_chunks(), pa.string())
+        if text_shoe_sizes is None:
+            size_type = table.schema.field("shoeSize").type if "shoeSize" in table.column_names else pa.null()
+            size_type = size_type.value_type if pa.types.is_dictionary(size_type) else size_type
+            text_shoe_sizes = pa.types.is_string(size_type) or pa.types.is_large_string(size_type)
+        return cls(codes, dictionaries, amount, created_at, created_at_text, text_shoe_sizes)
+
+    @classmethod
+    def read_file(cls, file_name, keep_created_at_text=False):
+        """
+        Reads the base columns of a transactions CSV or Parquet file (from the formatter or with features added).
+        Parquet files have typed timestamps, so there is no createdAt text to keep
+        """
+        if file_name.endswith(".parquet"):
+            columns = [column for column in cls.COLUMNS if column in pq.read_schema(file_name).names]
+            return cls.from_arrow(pq.read_table(file_name, columns=columns))
+        #the text columns are read straight into dictionary arrays so no per row strings are made
+        column_types = {column: pa.dictionary(pa.int32(), pa.string()) for column in cls.DICTIONARY_COLUMNS}
+        #amount is left to type inference, so it's int64 when every price is whole like with pandas
+        column_types["createdAt"] = pa.string() if keep_created_at_text else pa.timestamp("s", tz="UTC")
+        #CSV columns aren't typed, pandas reads the sizes as numbers when they all are
+        try:
+            return cls.from_arrow(cls._read_csv(file_name, column_types), keep_created_at_text, text_shoe_sizes=False)
+        except pa.ArrowInvalid: #some timestamps aren't ISO 8601, let pandas parse them
+            column_types["createdAt"] = pa.string()
+            return cls.from_arrow(cls._read_csv(file_name, column_types), keep_created_at_text, text_shoe_sizes=False)
+
+    @classmethod
+    def _read_csv(cls, file_name, column_types):
+        convert_options = pa_csv.ConvertOptions(column_types=column_types, include_columns=cls.COLUMNS, include_missing_columns=True, strings_can_be_null=True)
+        return pa_csv.read_csv(file_name, convert_options=convert_options)
+
+    @classmethod
+    def concat(cls, tables):
+        """
+        One table with the rows of all the tables, merging their dictionaries
+        """
+        tables = list(tables)
+        codes, dictionaries = {}, {}
+        for column in cls.DICTIONARY_COLUMNS:
+            values = {}
+            remapped = []
+            for table in tables:
+                #the last entry of the mapping is for code -1
+                mapping = np.array([values.setdefault(value, len(values)) for value in table.dictionaries[column]] + [-1], dtype=np.int64)
+                remapped.append(mapping[table.codes[column]])
+            code_dtype = cls._get_code_dtype(len(values))
+            codes[column] = np.concatenate(remapped).astype(code_dtype) if remapped else np.array([], dtype=code_dtype)
+            dictionaries[column] = np.array(list(values), dtype=object)
+        #integer amounts become float64 if any of the tables has float amounts
+        amount = np.concatenate([table.amount for table in tables]) if tables else np.array([], dtype=np.float64)
+        created_at = np.concatenate([table.created_at for table in tables]) if tables else np.array([], dtype=np.int64)
+        #the createdAt text is only kept if every table kept it
+        created_at_text = None
+        if tables and all(table.created_at_text is not None for table in tables):
+            created_at_text = pa.concat_arrays([table.created_at_text for table in tables])
+        text_shoe_sizes = bool(tables) and all(table.text_shoe_sizes for table in tables)
+        return cls(codes, dictionaries, amount, created_at, created_at_text, text_shoe_sizes)
+
+    def __len__(self):
+        return len(self.amount)
+
+    def get_values(self, column):
+        """
+        Decoded values of a dictionary column, None where missing
+        """
+        dictionary = np.append(self.dictionaries[column], None)
+        return dictionary[self.codes[column]]
+
+    def get_created_at(self):
+        #a view, no copy
+        return self.created_at.view("datetime64[s]")
+
+    def get_shoe_sizes(self):
+        """
+        Shoe sizes as float32, NaN for missing and non numeric sizes
+        """
+        sizes = pd.to_numeric(pd.Series(self.dictionaries["shoeSize"], dtype=object), errors="coerce").to_numpy(dtype=np.float32)
+        return np.append(sizes, np.float32(np.nan))[self.codes["shoeSize"]]
+
+    def format_amounts(self):
+        """
+        Amounts as the csv module writes the Python numbers ("250", "123.45", "250.0"), "" where missing
+        """
+        #prices repeat a lot, so only the distinct ones are formatted
+        amounts, inverse = np.unique(self.amount, return_inverse=True)
+        text = np.array(["" if np.isnan(amount) else str(amount.item()) for amount in amounts], dtype=object)
+        return text[inverse.reshape(-1)]
+
+    def format_created_at(self, rows=None):
+        """
+        createdAt (of the rows, all of them by default) as text, "" where missing: the original text if it was kept,
+        ISO 8601 UTC text like the activity API sends it otherwise
+        """
+        if self.created_at_text is not None:
+            text = self.created_at_text if rows is None else self.created_at_text.take(pa.array(rows, type=pa.int64()))
+            return pc.fill_null(text, "").to_numpy(zero_copy_only=False).astype(object)
+        created_at = self.created_at if rows is None else self.created_at[rows]
+        text = np.char.add(np.datetime_as_string(created_at.view("datetime64[s]"), unit="s"), "+00:00").astype(object)
+        text[created_at == self.MISSING_TIME] = ""
+        return text
+
+    def get_created_at_values(self, rows):
+        """
+        createdAt of the rows as pandas reads them from the source file: the original text if it was kept (CSV
+        files), Timestamps otherwise (typed Parquet timestamps)
+        """
+        if self.created_at_text is not None:
+            #pandas reads a blank createdAt as NaN
+            return [np.nan if value is None else value for value in self.created_at_text.take(pa.array(rows, type=pa.int64())).to_pylist()]
+        return [pd.Timestamp(self.created_at[row], unit="s", tz="UTC") if self.created_at[row] != self.MISSING_TIME else pd.NaT for row in rows]
+
+    def to_rows(self):
+        """
+        Rows of text in COLUMNS order, for writing CSVs
+        """
+        columns = {column: np.where(self.codes[column] >= 0, self.get_values(column), "") for column in self.DICTIONARY_COLUMNS}
+        columns["amount"] = self.format_amounts()
+        columns["createdAt"] = self.format_created_at()
+        return zip(*[columns[column] for column in self.COLUMNS])
+
+    def to_dataframe(self):
+        """
+        DataFrame of the table with categorical columns for the dictionary columns (sharing their codes)
+        """
+        data = {}
+        for column in self.COLUMNS:
+            if column == "amount":
+                data[column] = self.amount
+            elif column == "createdAt":
+                data[column] = pd.Series(self.get_created_at()).dt.tz_localize("UTC")
+            else:
+                data[column] = pd.Categorical.from_codes(self.codes[column], self.dictionaries[column])
+        return pd.DataFrame(data)
+
+    def get_slice(self, sku, shoe_size=None):
+        """
+        Rows of the SKU (and shoe size) as a table of views into this one. The rows of a SKU have to be next to each
+        other (as after concat of per SKU tables) and for a shoe size the table has to be sorted with sort_by_size
+        """
+        start, stop = self._get_run("sku", sku, 0, len(self))
+        if shoe_size is not None:
+            start, stop = self._get_run("shoeSize", str(shoe_size), start, stop)
+        return self._slice(start, stop)
+
+    def iterate_slices(self):
+        """
+        Yields (sku, table of views) for every run of rows of the same SKU in order
+        """
+        starts = self._get_run_starts(self.codes["sku"], 0, len(self))
+        for start, stop in zip(starts, list(starts[1:]) + [len(self)]):
+            code = self.codes["sku"][start]
+            yield (self.dictionaries["sku"][code] if code >= 0 else None), self._slice(start, stop)
+
+    def sort_by_size(self):
+        """
+        Copy of the table with the rows of every SKU grouped by shoe size (keeping their order within a size), so
+        get_slice can slice by size
+        """
+        order = np.lexsort((np.arange(len(self)), self.codes["shoeSize"], self._get_first_positions(self.codes["sku"])))
+        created_at_text = self.created_at_text.take(pa.array(order)) if self.created_at_text is not None else None
+        return TransactionTable({column: codes[order] for column, codes in self.codes.items()}, self.dictionaries, self.amount[order], self.created_at[order],
+            created_at_text, self.text_shoe_sizes)
+
+    def get_memory_usage(self):
+        """
+        Bytes used by the arrays and the distinct values of the dictionaries
+        """
+        array_bytes = self.amount.nbytes + self.created_at.nbytes + sum(codes.nbytes for codes in self.codes.values())
+        if self.created_at_text is not None:
+            array_bytes += self.created_at_text.nbytes
+        dictionary_bytes = sum(dictionary.nbytes + sum(sys.getsizeof(value) for value in dictionary) for dictionary in self.dictionaries.values())
+        return array_bytes + dictionary_bytes
+
+    def _slice(self, start, stop):
+        created_at_text = self.created_at_text.slice(start, stop - start) if self.created_at_text is not None else None
+        return TransactionTable({column: codes[start:stop] for column, codes in self.codes.items()}, self.dictionaries, self.amount[start:stop],
+            self.created_at[start:stop], created_at_text, self.text_shoe_sizes)
+
+    def _get_run(self, column, value, start, stop):
+        code = self._get_code(column, value)
+        if code is None:
+            return start, start
+        if start == 0 and stop == len(self):
+            if column not in self.runs:
+                self.runs[column] = self._get_runs(self.codes[column], 0, stop)
+            runs = self.runs[column]
+        else:
+            runs = self._get_runs(self.codes[column][start:stop], start, stop)
+        if code not in runs:
+            return start, start
+        if runs[code] is None:
+            raise ValueError("The rows of {} {} aren't next to each other, sort the table first".format(column, value))
+        return runs[code]
+
+    def _get_runs(self, codes, offset, stop):
+        #{code: (start, stop)} of every run of equal codes, None for codes with more than one run
+        starts = self._get_run_starts(codes, offset, stop)
+        runs = {}
+        for start, run_stop in zip(starts, list(starts[1:]) + [stop]):
+            code = int(codes[start - offset])
+            runs[code] = None if code in runs else (start, run_stop)
+        return runs
+
+    def _get_run_starts(self, codes, offset, stop):
+        if stop == offset:
+            return []
+        return [offset] + list(np.flatnonzero(codes[1:] != codes[:-1]) + 1 + offset)
+
+    def _get_code(self, column, value):
+        if column not in self.positions:
+            self.positions[column] = {value: code for code, value in enumerate(self.dictionaries[column])}
+        return self.positions[column].get(str(value))
+
+    def _get_first_positions(self, codes):
+        #position of the first row of each code, so sorting by it keeps SKUs in the order they come in
+        first_positions = np.full(len(self.dictionaries["sku"]) + 1, len(codes), dtype=np.int64)
+        np.minimum.at(first_positions, codes, np.arange(len(codes)))
+        return first_positions[codes]
+
+    @classmethod
+    def _encode(cls, values):
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+        #only the distinct values are turned into strings, 10 and "10" become the same value
+        string_codes, string_uniques = pd.factorize(pd.Series([str(value) for value in uniques], dtype=object))
+        codes = np.append(string_codes, -1)[codes]
+        return codes.astype(cls._get_code_dtype(len(string_uniques))), np.array(list(string_uniques), dtype=object)
+
+    @classmethod
+    def _to_amounts(cls, amounts):
+        #NaN for missing amounts needs float64, like pandas does for an integer column with blanks
+        if pd.api.types.is_integer_dtype(amounts) and not amounts.isna().any():
+            return amounts.to_numpy(dtype=np.int64)
+        return amounts.to_numpy(dtype=np.float64, na_value=np.nan)
+
+    @classmethod
+    def _to_epoch_seconds(cls, created_at):
+        if not pd.api.types.is_datetime64_any_dtype(created_at):
+            created_at = pd.to_datetime(created_at, utc=True, format="ISO8601", errors="coerce")
+        elif created_at.dt.tz is None:
+            created_at = created_at.dt.tz_localize("UTC")
+        #NaT is the smallest int64 in every unit, so it stays MISSING_TIME
+        seconds = created_at.dt.tz_convert("UTC").dt.tz_localize(None).to_numpy().astype("datetime64[s]").view(np.int64)
+        return np.ascontiguousarray(seconds)
+
+    @classmethod
+    def _get_code_dtype(cls, value_count):
+        for dtype in [np.int8, np.int16, np.int32]:
+            if value_count < np.iinfo(dtype).max:
+                return dtype
+        return np.int64
@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+
+class ThreadRateLimiter:
+    """
+    Token bucket that lets through at most `rate` requests per second with bursts of up to `burst` requests, shared by
+    threads
+    """
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                time.sleep((1 - self.tokens) / self.rate)
+
+class PyTrendsBackend:
+    """
+    Google Trends through pytrends. get_interest returns the interest over time of a keyword between two dates (daily
+    values for ranges of a few months, weekly or monthly ones for longer ranges). Every thread gets its own TrendReq
+    made with trend_request_kwargs, so the requests of TrendsFetcher's threads run concurrently
+    """
+    def __init__(self, geo="US", **trend_request_kwargs):
+        self.geo = geo
+        self.trend_request_kwargs = dict({"retries": 5, "timeout": (100, 100)}, **trend_request_kwargs)
+        self.local = threading.local()
+
+    def get_interest(self, keyword, start_date, end_date):
+        pytrend = self._get_pytrend()
+        pytrend.build_payload([keyword], timeframe="{} {}".format(start_date, end_date), geo=self.geo)
+        df = pytrend.interest_over_time()
+        if df.empty:
+            return pd.Series(dtype=float, name=keyword)
+        return df[keyword].astype(float)
+
+    def _get_pytrend(self):
+        #a TrendReq keeps the payload of the last request so threads can't share one
+        if not hasattr(self.local, "pytrend"):
+            import pytrends.request
+            self.local.pytrend = pytrends.request.TrendReq(**self.trend_request_kwargs)
+        return self.local.pytrend
+
+class FakeTrendsBackend:
+    """
+    Local stand-in for Google Trends: deterministic values per keyword and day, an optional latency per request and a
+    count of the requests made, for testing and benchmarking TrendsFetcher offline
+    """
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.request_count = 0
+        self.lock = threading.Lock()
+
+    def get_interest(self, keyword, start_date, end_date):
+        with self.lock:
+            self.request_count += 1
+        time.sleep(self.latency)
+        days = pd.date_range(start_date, end_date, freq="D")
+        seed = zlib.crc32(keyword.encode())
+        values = (np.sin(days.values.astype("datetime64[D]").astype(np.int64) / 30 + seed) + 1) * 50
+        series = pd.Series(values.round(), index=days, name=keyword)
+        if len(days) > 270: #google only gives daily values for short ranges
+            series = series.resample("MS").mean().round()
+        return series
+
+class TrendsFetcher:
+    """
+    Drop in for pytrends.dailydata.get_daily_data that keeps the unscaled daily values of every (keyword, month) in
+    cache_directory and only requests the months that aren't cached yet, concurrently on max_workers threads and at
+    most `rate` requests per second. The month that isn't over yet is never cached
+    """
+    def __init__(self, backend=None, cache_directory="shoe_data/trends_cache", rate=1.0, burst=1, max_workers=4):
+        self.backend = backend if backend is not None else PyTrendsBackend()
+        self.cache_directory = cache_directory
+        self.rate_limiter = ThreadRateLimiter(rate, burst)
+        self.max_workers = max_workers
+        self.request_count = 0
+        self.cache_hits = 0
+        self.lock = threading.Lock()
+
+    def get_daily_data(self, word, start_year, start_mon, stop_year, stop_mon):
+        """
+        Returns the same DataFrame as pytrends.dailydata.get_daily_data: <word>_unscaled daily values, <word>_monthly
+        values of the whole range, the scale and the scaled <word> column, indexed by date
+        """
+        months = self._get_months(start_year, start_mon, stop_year, stop_mon)
+        start_date, stop_date = months[0][0], months[-1][1]
+        monthly = self._request(word, start_date, stop_date)
+
+        daily = {}
+        missing_months = []
+        for month_start, month_end in months:
+            cached = self._read_month(word, month_start)
+            if cached is None:
+                missing_months.append((month_start, month_end))
+            else:
+                daily[month_start] = cached
+                self.cache_hits += 1
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {month_start: executor.submit(self._fetch_month, word, month_start, month_end) for month_start, month_end in missing_months}
+            for month_start, future in futures.items():
+                daily[month_start] = future.result()
+
+        daily = [daily[month_start] for month_start, _ in months if not daily[month_start].empty]
+        if not daily: #no search interest at all in the range
+            return pd.DataFrame(columns=["{}_unscaled".format(word), "{}_monthly".format(word), "scale", word])
+        daily = pd.concat(daily)
+        complete = daily.to_frame("{}_unscaled".format(word)).join(monthly.rename("{}_monthly".format(word)))
+        complete["{}_monthly".format(word)] = complete["{}_monthly".format(word)].ffill()
+        complete["scale"] = complete["{}_monthly".format(word)] / 100
+        complete[word] = complete["{}_unscaled".format(word)] * complete["scale"]
+        complete.index.name = "date"
+        return complete
+
+    def _fetch_month(self, word, month_start, month_end):
+        series = self._request(word, month_start, month_end)
+        if month_end < date.today():
+            self._write_month(word, month_start, series)
+        return series
+
+    def _request(self, word, start_date, end_date):
+        self.rate_limiter.acquire()
+        with self.lock:
+            self.request_count += 1
+        series = self.backend.get_interest(word, start_date, end_date)
+        series.index = pd.to_datetime(series.index)
+        return series
+
+    def _get_months(self, start_year, start_mon, stop_year, stop_mon):
+        months = []
+        month_start = date(start_year, start_mon, 1)
+        while month_start <= date(stop_year, stop_mon, 1):
+            next_month = (month_start + timedelta(days=32)).replace(day=1)
+            months.append((month_start, next_month - timedelta(days=1)))
+            month_start = next_month
+        return months
+
+    def _get_month_file_name(self, word, month_start):
+        return os.path.join(self.cache_directory, word.replace(" ", "-").replace("/", "-"), "{:%Y-%m}.csv".format(month_start))
+
+    def _read_month(self, word, month_start):
+        file_name = self._get_month_file_name(word, month_start)
+        if not os.path.exists(file_name):
+            return None
+        df = pd.read_csv(file_name, index_col="date", parse_dates=["date"])
+        return df["value"].rename(word)
+
+    def _write_month(self, word, month_start, series):
+        file_name = self._get_month_file_name(word, month_start)
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        temp_file_name = "{}.{}.{}.tmp".format(file_name, os.getpid(), threading.get_ident())
+        series.rename("value").rename_axis("date").to_csv(temp_file_name)
+        os.replace(temp_file_name, file_name)
@@ -0,0 +1,208 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+from multiprocessing.managers import BaseManager
+
+class CrawlWorkQueue:
+    """
+    SQLite lease table of the keys (pages, links or SKUs) a crawl stage still has to scrape, so the work can be split
+    over any amount of worker processes. A worker leases keys for visibility_timeout seconds, keeps extending the leases
+    while it works on them (see LeaseKeeper) and completes or fails them. If it dies its leases expire and other workers
+    lease the keys again, and a key that failed max_attempts times
+    is left as "failed". The database file must be on a local disk of one machine (WAL mode needs memory shared on one
+    host and SQLite locking isn't reliable on network file systems), the workers of other machines reach it through a
+    CrawlWorkManager
+    """
+    def __init__(self, brand, db_file="work_queue.db", visibility_timeout=600, max_attempts=5):
+        self.brand = brand
+        self.db_file = db_file
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.connections = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["connections"] = {}
+        return state
+
+    def enqueue(self, stage, keys):
+        """
+        Adds the keys that aren't in the queue of the stage yet and returns how many were added
+        """
+        now = time.time()
+        connection = self._get_connection()
+        connection.execute("BEGIN")
+        try:
+            before = connection.total_changes
+            connection.executemany("INSERT OR IGNORE INTO work_queue (brand, stage, key, status, attempts, updated_at) VALUES (?, ?, ?, 'pending', 0, ?)",
+                [(self.brand, stage, key, now) for key in keys])
+            added = connection.total_changes - before
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        return added
+
+    def lease(self, stage, worker_id, count=1):
+        """
+        Leases up to count pending keys of the stage (or keys whose lease expired) to the worker and returns them
+        """
+        now = time.time()
+        connection = self._get_connection()
+        #BEGIN IMMEDIATE takes the write lock up front so two workers can't select the same keys
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute("""SELECT key FROM work_queue WHERE brand = ? AND stage = ? AND attempts < ?
+                AND (status = 'pending' OR (status = 'leased' AND lease_expires_at < ?)) ORDER BY attempts, updated_at LIMIT ?""",
+                (self.brand, stage, self.max_attempts, now, count)).fetchall()
+            keys = [row[0] for row in rows]
+            connection.executemany("""UPDATE work_queue SET status = 'leased', lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1,
+                updated_at = ? WHERE brand = ? AND stage = ? AND key = ?""",
+                [(worker_id, now + self.visibility_timeout, now, self.brand, stage, key) for key in keys])
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        return keys
+
+    def extend(self, stage, key, worker_id):
+        """
+        Pushes back the expiry of a lease the worker still holds, for work that takes longer than the visibility
+        timeout. Returns False if the lease expired and was taken by another worker
+        """
+        connection = self._get_connection()
+        with connection:
+            cursor = connection.execute("""UPDATE work_queue SET lease_expires_at = ? WHERE brand = ? AND stage = ? AND key = ?
+                AND status = 'leased' AND lease_owner = ?""", (time.time() + self.visibility_timeout, self.brand, stage, key, worker_id))
+        return cursor.rowcount == 1
+
+    def get_visibility_timeout(self):
+        #a method so workers can ask a served queue too
+        return self.visibility_timeout
+
+    def complete(self, stage, key, worker_id):
+        #done even if the lease expired in the meantime, the work was still done
+        connection = self._get_connection()
+        with connection:
+            connection.execute("""UPDATE work_queue SET status = 'done', lease_owner = ?, lease_expires_at = NULL, updated_at = ?
+                WHERE brand = ? AND stage = ? AND key = ?""", (worker_id, time.time(), self.brand, stage, key))
+
+    def fail(self, stage, key, worker_id, error=None):
+        """
+        Gives up the lease of a key that couldn't be scraped: it goes back to pending, or to failed once it has been
+        attempted max_attempts times
+        """
+        connection = self._get_connection()
+        with connection:
+            connection.execute("""UPDATE work_queue SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, lease_owner = NULL,
+                lease_expires_at = NULL, last_error = ?, updated_at = ? WHERE brand = ? AND stage = ? AND key = ? AND status = 'leased' AND lease_owner = ?""",
+                (self.max_attempts, error, time.time(), self.brand, stage, key, worker_id))
+
+    def requeue_expired(self, stage):
+        """
+        Puts the keys whose lease expired back to pending (or failed) and returns how many. lease does this by itself,
+        this is for reporting and for queues nobody is leasing from
+        """
+        connection = self._get_connection()
+        with connection:
+            cursor = connection.execute("""UPDATE work_queue SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, lease_owner = NULL,
+                lease_expires_at = NULL, last_error = 'lease expired', updated_at = ? WHERE brand = ? AND stage = ? AND status = 'leased' AND lease_expires_at < ?""",
+                (self.max_attempts, time.time(), self.brand, stage, time.time()))
+        return cursor.rowcount
+
+    def get_counts(self, stage):
+        """
+        Returns {status: amount of keys} for the stage, with expired leases counted as "expired"
+        """
+        rows = self._get_connection().execute("""SELECT CASE WHEN status = 'leased' AND lease_expires_at < ? THEN 'expired' ELSE status END AS state, COUNT(*)
+            FROM work_queue WHERE brand = ? AND stage = ? GROUP BY state""", (time.time(), self.brand, stage))
+        return dict(rows.fetchall())
+
+    def get_keys(self, stage, status):
+        rows = self._get_connection().execute("SELECT key FROM work_queue WHERE brand = ? AND stage = ? AND status = ?", (self.brand, stage, status))
+        return [row[0] for row in rows]
+
+    def is_finished(self, stage):
+        """
+        True once every key of the stage is done or failed. Expired leases that can still be retried count as work
+        left, the ones that can't are marked failed
+        """
+        row = self._get_connection().execute("""SELECT 1 FROM work_queue WHERE brand = ? AND stage = ? AND (status = 'pending'
+            OR (status = 'leased' AND (lease_expires_at >= ? OR attempts < ?))) LIMIT 1""", (self.brand, stage, time.time(), self.max_attempts)).fetchone()
+        if row is not None:
+            return False
+        self.requeue_expired(stage)
+        return True
+
+    def _get_connection(self):
+        #sqlite connections can't be shared with forked worker processes or other threads (a served queue is called from
+        #one thread per client) so each opens its own
+        owner = (os.getpid(), threading.get_ident())
+        if owner not in self.connections:
+            connection = sqlite3.connect(self.db_file, timeout=60, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""CREATE TABLE IF NOT EXISTS work_queue (
+                brand TEXT NOT NULL, stage TEXT NOT NULL, key TEXT NOT NULL, status TEXT NOT NULL, lease_owner TEXT, lease_expires_at REAL,
+                attempts INTEGER NOT NULL, last_error TEXT, updated_at REAL NOT NULL, PRIMARY KEY (brand, stage, key))""")
+            connection.execute("CREATE INDEX IF NOT EXISTS work_queue_status ON work_queue (brand, stage, status)")
+            self.connections[owner] = connection
+        return self.connections[owner]
+
+class LeaseKeeper:
+    """
+    Extends the leases a worker holds from a background thread every third of the visibility timeout while it works
+    on them. Retry delays, circuit breaker waits and paging through a long activity feed can keep one key busy for
+    longer than the timeout, and without this its lease would expire and another worker would scrape it again. Keys are
+    added once leased and removed once completed or failed
+    """
+    def __init__(self, work_queue, stage, worker_id):
+        self.work_queue = work_queue
+        self.stage = stage
+        self.worker_id = worker_id
+        self.interval = work_queue.get_visibility_timeout() / 3
+        self.lock = threading.Lock()
+        self.keys = set()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stopped.set()
+        self.thread.join()
+
+    def add(self, keys):
+        with self.lock:
+            self.keys.update(keys)
+
+    def remove(self, key):
+        with self.lock:
+            self.keys.discard(key)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            with self.lock:
+                keys = list(self.keys)
+            for key in keys:
+                try:
+                    self.work_queue.extend(self.stage, key, self.worker_id)
+                except Exception as e: #try again next time, the lease is still valid for two more intervals
+                    print("Unable to extend the lease of {}: {!r}".format(key, e))
+
+class CrawlWorkManager(BaseManager):
+    """
+    Serves the work queue of one machine over TCP, along with the raw stores and crawl state the workers save what
+    they scrape to, so workers on other machines share a crawl without opening its SQLite files themselves (see
+    serve_crawl_work and connect_to_crawl_work in multiprocessing_scraper.py)
+    """
+    pass
+
+for typeid in ["get_work_queue", "get_shoe_info_store", "get_shoe_transaction_store", "get_crawl_state"]:
+    CrawlWorkManager.register(typeid)
+
+def get_worker_id():
+    return "{}-{}".format(socket.gethostname(), os.getpid())